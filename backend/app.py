@@ -5,10 +5,11 @@ The world's first fake deepfake therapy app where you roast yourself.
 "Because sometimes, the only person qualified to give you terrible advice... is also you."
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 import os
+import threading
 from dotenv import load_dotenv
 import uuid
 from datetime import datetime
@@ -20,6 +21,7 @@ load_dotenv()
 from app.services.roast_therapist import RoastTherapistService
 from app.services.face_processor import FaceProcessorService
 from app.services.avatar_generator import AvatarGeneratorService
+from app.services.job_queue import JobQueue
 
 def create_app():
     """Create and configure the Flask app"""
@@ -43,6 +45,9 @@ def create_app():
     face_service = FaceProcessorService()
     avatar_service = AvatarGeneratorService()
     
+    # Avatar jobs run in the background; progress is pushed to the job's room
+    job_queue = JobQueue(notifier=lambda event, job: socketio.emit(event, job, to=job['job_id']))
+    
     # Create upload directories
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['AVATAR_FOLDER'], exist_ok=True)
@@ -52,8 +57,10 @@ def create_app():
     from app.api.routes import create_routes
     from app.api.auth_routes import create_auth_routes
     
-    create_routes(app, roast_service, face_service, avatar_service)
+    create_routes(app, roast_service, face_service, avatar_service, job_queue)
     create_auth_routes(app)
+    job_queue.start()
+    roast_service.start_response_pool()
     
     # WebSocket events for real-time therapy
     @socketio.on('start_therapy_session')
@@ -68,25 +75,79 @@ def create_app():
             'timestamp': datetime.now().isoformat()
         })
     
+    # Replies still streaming, per client, so a disconnect can cancel them
+    active_streams = {}
+    active_streams_lock = threading.Lock()
+    
     @socketio.on('therapy_message')
     def handle_therapy_message(data):
-        """Handle therapy chat messages"""
+        """Handle therapy chat messages, streaming the reply as it's generated"""
         user_message = data.get('message', '')
         session_id = data.get('session_id', '')
+        message_id = data.get('message_id') or str(uuid.uuid4())
+        sid = request.sid
+        
+        stream = roast_service.stream_therapy_response(user_message)
+        with active_streams_lock:
+            active_streams.setdefault(sid, {})[message_id] = stream
+        
+        try:
+            # Each delta goes out as soon as it arrives
+            for index, delta in enumerate(stream):
+                emit('therapy_response_chunk', {
+                    'session_id': session_id,
+                    'message_id': message_id,
+                    'index': index,
+                    'delta': delta
+                })
+        finally:
+            with active_streams_lock:
+                streams = active_streams.get(sid, {})
+                streams.pop(message_id, None)
+                if not streams:
+                    active_streams.pop(sid, None)
         
-        # Get roasted therapy response
-        therapy_response = roast_service.generate_therapy_response(user_message)
+        if stream.response is None:
+            return  # cancelled; nobody is listening
         
+        # The full reply, scored, once the stream is done
         emit('therapy_response', {
             'session_id': session_id,
-            'response': therapy_response,
-            'useless_meter': roast_service.calculate_uselessness_score(therapy_response),
+            'message_id': message_id,
+            'response': stream.response,
+            'useless_meter': roast_service.calculate_uselessness_score(stream.response),
             'timestamp': datetime.now().isoformat()
         })
     
+    @socketio.on('cancel_therapy_response')
+    def handle_cancel_therapy_response(data):
+        """Stop a reply that is still streaming"""
+        with active_streams_lock:
+            stream = active_streams.get(request.sid, {}).get(data.get('message_id'))
+        if stream is not None:
+            stream.cancel()
+    
+    @socketio.on('watch_avatar_job')
+    def handle_watch_avatar_job(data):
+        """Subscribe to progress pushes for an avatar job"""
+        job = job_queue.get(data.get('job_id', ''))
+        if job is None:
+            emit('job_failed', {'job_id': data.get('job_id'), 'error': 'Job not found'})
+            return
+        
+        join_room(job['job_id'])
+        # Send the current state so updates that happened before joining aren't lost
+        emit('job_progress', job)
+    
     @socketio.on('disconnect')
     def handle_disconnect():
         """Handle client disconnect"""
+        # No point generating replies for someone who left
+        with active_streams_lock:
+            streams = active_streams.pop(request.sid, {})
+        for stream in streams.values():
+            stream.cancel()
+        
         emit('session_ended', {
             'message': "Session ended. Remember: you can't run from yourself... but you can try!"
         })
@@ -6,13 +6,14 @@ Login, logout, and registration endpoints for therapeutic disappointment.
 """
 
 from flask import request, jsonify
-from app.services.auth_service import AuthService, token_required, optional_auth
+from app.services.auth_service import get_auth_service, token_required
+from app.services.password_hasher import HasherSaturatedError
 
 
 def create_auth_routes(app):
     """Create authentication routes"""
     
-    auth_service = AuthService()
+    auth_service = get_auth_service()
     
     @app.route('/api/auth/register', methods=['POST'])
     def register():
@@ -53,6 +54,12 @@ def create_auth_routes(app):
                     'message': 'Registration failed'
                 }), 400
                 
+        except HasherSaturatedError:
+            return jsonify({
+                'success': False,
+                'error': 'Server busy',
+                'message': 'Too many people are logging in to be disappointed. Try again in a moment.'
+            }), 503, {'Retry-After': '1'}
         except Exception as e:
             return jsonify({
                 'success': False,
@@ -98,6 +105,12 @@ def create_auth_routes(app):
                     'message': 'Login failed'
                 }), 401
                 
+        except HasherSaturatedError:
+            return jsonify({
+                'success': False,
+                'error': 'Server busy',
+                'message': 'Too many people are logging in to be disappointed. Try again in a moment.'
+            }), 503, {'Retry-After': '1'}
         except Exception as e:
             return jsonify({
                 'success': False,
@@ -208,6 +221,12 @@ def create_auth_routes(app):
                     'message': 'Password change failed'
                 }), 400
                 
+        except HasherSaturatedError:
+            return jsonify({
+                'success': False,
+                'error': 'Server busy',
+                'message': 'Too many people are logging in to be disappointed. Try again in a moment.'
+            }), 503, {'Retry-After': '1'}
         except Exception as e:
             return jsonify({
                 'success': False,
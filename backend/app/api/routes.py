@@ -5,19 +5,53 @@ All the endpoints for maximum therapeutic disappointment.
 "RESTful APIs for RESTless souls seeking questionable advice."
 """
 
-from flask import request, jsonify, send_file
+from flask import request, jsonify
 import os
 import uuid
 from datetime import datetime
-from typing import Dict, Any
-import json
 
-from app.services.auth_service import optional_auth, token_required
+from app.services.auth_service import get_auth_service, optional_auth, token_required
+from app.services.password_hasher import get_password_hasher
+from app.services.file_store import get_file_store
+from app.services.file_delivery import FileDelivery
+from app.services.derivatives import DerivativeService
+from app.services.job_queue import PermanentJobError
+from app.services.roast_therapist import ROAST_PROMPTS
 
 
-def create_routes(app, roast_service, face_service, avatar_service):
+def create_routes(app, roast_service, face_service, avatar_service, job_queue=None):
     """Create all API routes for the therapy app"""
     
+    file_store = get_file_store()
+    file_delivery = FileDelivery(file_store.roots)
+    derivatives = DerivativeService()
+    
+    def client_key(current_user) -> str:
+        """Who is asking, for per-client state such as which pooled roasts they've seen"""
+        if current_user is not None:
+            return f"user:{current_user.user_id}"
+        return request.headers.get('X-Client-Id') or request.remote_addr or 'anonymous'
+    
+    def run_avatar_job(payload, report_progress):
+        """Job handler: render an avatar off the request thread"""
+        face_data = face_service.get_face_data(payload['file_id'])
+        if not face_data or not os.path.exists(face_data['processed_path'] or ''):
+            raise PermanentJobError("Processed image not found")
+        
+        report_progress(0.05, "rendering variants")
+        result = avatar_service.generate_therapist_avatar(
+            face_data, payload.get('customization') or {}, progress=report_progress,
+            user_id=payload.get('user_id')
+        )
+        if result.get('error'):
+            raise RuntimeError(result['error'])
+        return result
+    
+    if job_queue is not None:
+        # Job status is readable by anyone with the id; only the owner sees who made it and from what
+        job_queue.register('generate_avatar', run_avatar_job, public_result=lambda result: dict(
+            result, metadata=avatar_service.public_view(result['metadata'])))
+    
     @app.route('/', methods=['GET'])
     def home():
         """Welcome endpoint"""
@@ -44,6 +78,28 @@ def create_routes(app, roast_service, face_service, avatar_service):
             "therapy_quality": "Consistently disappointing"
         })
     
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        """Cache and pool counters for whoever is watching the disappointment scale"""
+        return jsonify({
+            "token_cache": get_auth_service().token_cache.stats(),
+            "password_hasher": get_password_hasher().stats(),
+            "user_write_buffer": get_auth_service().user_db.write_buffer.stats(),
+            "face_metadata": face_service.metadata_store.stats(),
+            "frame_cache": face_service.frame_cache.stats(),
+            "accessory_layers": avatar_service.accessory_layers.stats(),
+            "avatar_store": avatar_service.avatar_store.stats(),
+            "file_store": file_store.stats(),
+            "file_delivery": file_delivery.stats(),
+            "derivatives": derivatives.stats(),
+            "variant_cache": dict(avatar_service.variant_cache.stats(),
+                                  renders=avatar_service._render_flight.stats()),
+            "response_pool": roast_service.response_pool.stats(),
+            "llm": roast_service.llm_stats(),
+            "job_queue": job_queue.stats() if job_queue is not None else None,
+            "timestamp": datetime.now().isoformat()
+        })
+    
     # 📷 SELFIE UPLOAD & PROCESSING
     @app.route('/api/upload-selfie', methods=['POST'])
     @optional_auth
@@ -104,7 +160,8 @@ def create_routes(app, roast_service, face_service, avatar_service):
     
     # 🎭 AVATAR GENERATION
     @app.route('/api/generate-avatar', methods=['POST'])
-    def generate_avatar():
+    @optional_auth
+    def generate_avatar(current_user):
         """Generate therapist avatar from processed selfie"""
         
         try:
@@ -118,30 +175,30 @@ def create_routes(app, roast_service, face_service, avatar_service):
             
             file_id = data['file_id']
             customization = data.get('customization', {})
+            try:
+                avatar_service.validate_customization(customization)
+            except ValueError as e:
+                return jsonify({
+                    "error": str(e),
+                    "message": "We can't render that. Even your therapist has standards."
+                }), 400
+            # 'preview' returns as soon as the preview variant exists
+            wait_for = data.get('wait_for', os.getenv('AVATAR_WAIT_FOR', 'all'))
             
-            # Mock face data retrieval (in real app, this would be stored)
-            # For now, we'll construct the expected data structure
-            processed_path = os.path.join(app.config['UPLOAD_FOLDER'], f"processed_{file_id}.jpg")
+            # Use the detection stored at upload time instead of detecting again
+            face_data = face_service.get_face_data(file_id)
             
-            if not os.path.exists(processed_path):
+            if not face_data or not os.path.exists(face_data['processed_path'] or ''):
                 return jsonify({
                     "error": "Processed image not found",
                     "message": "The processed selfie seems to have vanished. Try uploading again."
                 }), 404
             
-            face_data = {
-                'processed_path': processed_path,
-                'file_id': file_id,
-                'features': {
-                    'size_category': 'medium',
-                    'aspect_ratio': 1.2,
-                    'suggested_accessories': ['therapist_glasses', 'notepad_small']
-                },
-                'position': (50, 50, 200, 250)  # Mock face coordinates
-            }
-            
             # Generate the avatar
-            result = avatar_service.generate_therapist_avatar(face_data, customization)
+            result = avatar_service.generate_therapist_avatar(
+                face_data, customization, wait_for=wait_for,
+                user_id=current_user.user_id if current_user else None
+            )
             
             if result.get('error'):
                 return jsonify(result), 500
@@ -160,9 +217,71 @@ def create_routes(app, roast_service, face_service, avatar_service):
                 "suggestion": "Try again or accept that even fake therapy doesn't want to help you"
             }), 500
     
+    @app.route('/api/avatar-jobs', methods=['POST'])
+    @optional_auth
+    def submit_avatar_job(current_user):
+        """Queue avatar generation and return a job id right away"""
+        
+        if job_queue is None:
+            return jsonify({
+                "error": "Job queue disabled",
+                "message": "Use /api/generate-avatar instead. We'll make you wait in person."
+            }), 503
+        
+        data = request.get_json(silent=True)
+        if not data or 'file_id' not in data:
+            return jsonify({
+                "error": "Missing file_id",
+                "message": "Please provide the file_id from the upload step"
+            }), 400
+        
+        try:
+            avatar_service.validate_customization(data.get('customization'))
+        except ValueError as e:
+            return jsonify({
+                "error": str(e),
+                "message": "We can't render that. Even your therapist has standards."
+            }), 400
+        
+        if not face_service.get_face_data(data['file_id']):
+            return jsonify({
+                "error": "Processed image not found",
+                "message": "The processed selfie seems to have vanished. Try uploading again."
+            }), 404
+        
+        job, deduplicated = job_queue.submit('generate_avatar', {
+            "file_id": data['file_id'],
+            "customization": data.get('customization') or {},
+            "user_id": current_user.user_id if current_user else None
+        })
+        
+        return jsonify({
+            "success": True,
+            "job": job,
+            "deduplicated": deduplicated,
+            "status_url": f"/api/avatar-jobs/{job['job_id']}",
+            "message": "Your avatar is in the queue. Disappointment is on its way."
+        }), 202
+    
+    @app.route('/api/avatar-jobs/<job_id>', methods=['GET'])
+    @optional_auth
+    def get_avatar_job(current_user, job_id):
+        """Report the status and progress of a queued avatar job"""
+        
+        viewer_id = current_user.user_id if current_user else None
+        job = job_queue.get(job_id, viewer_id) if job_queue is not None else None
+        if job is None:
+            return jsonify({
+                "error": "Job not found",
+                "message": "That job never existed. Much like your motivation."
+            }), 404
+        
+        return jsonify({"success": True, "job": job})
+    
     # 💬 THERAPY SESSION ENDPOINTS
     @app.route('/api/therapy-session', methods=['POST'])
-    def start_therapy_session():
+    @optional_auth
+    def start_therapy_session(current_user):
         """Start a new therapy session"""
         
         try:
@@ -198,10 +317,8 @@ def create_routes(app, roast_service, face_service, avatar_service):
                 "messages": []
             }
             
-            # Welcome message from therapist
-            welcome_response = roast_service.generate_therapy_response(
-                "Hello, I'm here for therapy."
-            )
+            # Welcome message from therapist (the prompt never changes, so it's pre-generated)
+            welcome_response = roast_service.generate_pooled_response('welcome', client_key(current_user))
             
             return jsonify({
                 "success": True,
@@ -218,7 +335,8 @@ def create_routes(app, roast_service, face_service, avatar_service):
             }), 500
     
     @app.route('/api/therapy-message', methods=['POST'])
-    def therapy_message():
+    @optional_auth
+    def therapy_message(current_user):
         """Send a message in therapy session"""
         
         try:
@@ -233,7 +351,7 @@ def create_routes(app, roast_service, face_service, avatar_service):
                 }), 400
             
             # Generate therapy response
-            therapy_response = roast_service.generate_therapy_response(user_message)
+            therapy_response = roast_service.generate_therapy_response(user_message, client_key(current_user))
             
             # Calculate uselessness
             useless_meter = roast_service.calculate_uselessness_score(therapy_response)
@@ -261,7 +379,8 @@ def create_routes(app, roast_service, face_service, avatar_service):
     
     # 🔥 ROASTING ENDPOINTS
     @app.route('/api/roast-me', methods=['POST'])
-    def roast_me():
+    @optional_auth
+    def roast_me(current_user):
         """Get roasted by your therapist self"""
         
         try:
@@ -269,18 +388,10 @@ def create_routes(app, roast_service, face_service, avatar_service):
             roast_topic = data.get('topic', 'general_existence')
             intensity = data.get('intensity', 'medium')
             
-            # Generate a roast based on topic
-            roast_prompts = {
-                'general_existence': "Roast me about my life choices in general",
-                'work_life': "Roast me about my work and career decisions", 
-                'relationships': "Roast me about my relationship skills",
-                'self_care': "Roast me about my self-care routine",
-                'decision_making': "Roast me about how I make decisions"
-            }
+            # Each topic maps to a fixed prompt, so roasts come from the pre-generated pool
+            prompt_key = roast_topic if roast_topic in ROAST_PROMPTS else 'default'
             
-            prompt = roast_prompts.get(roast_topic, "Just roast me about whatever")
-            
-            roast_response = roast_service.generate_therapy_response(prompt)
+            roast_response = roast_service.generate_pooled_response(prompt_key, client_key(current_user))
             useless_meter = roast_service.calculate_uselessness_score(roast_response)
             
             return jsonify({
@@ -300,6 +411,21 @@ def create_routes(app, roast_service, face_service, avatar_service):
             }), 500
     
     # 📊 AVATAR MANAGEMENT
+    @app.route('/api/my-avatars', methods=['GET'])
+    @token_required
+    def list_my_avatars(current_user):
+        """List the signed-in user's avatars, newest first"""
+        
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        avatars = avatar_service.list_avatars(current_user.user_id, limit)
+        
+        return jsonify({
+            "success": True,
+            "avatars": avatars,
+            "count": len(avatars),
+            "message": "Every version of you that has ever judged you."
+        })
+    
     @app.route('/api/avatar/<avatar_id>', methods=['GET'])
     def get_avatar_info(avatar_id):
         """Get avatar information"""
@@ -309,20 +435,30 @@ def create_routes(app, roast_service, face_service, avatar_service):
         if result.get('error'):
             return jsonify(result), 404
         
+        # Anyone with the id can read this, so leave out who made it and from what
+        result['avatar_data'] = avatar_service.public_view(result['avatar_data'])
         return jsonify(result)
     
     @app.route('/api/avatar/<avatar_id>/customize', methods=['POST'])
     def customize_avatar(avatar_id):
         """Customize avatar settings"""
         
-        data = request.get_json()
-        customizations = data.get('customizations', {})
+        data = request.get_json(silent=True) or {}
+        customizations = data.get('customizations') or {}
         
-        result = avatar_service.customize_avatar(avatar_id, customizations)
+        try:
+            avatar_service.validate_customization(customizations)
+            result = avatar_service.customize_avatar(avatar_id, customizations)
+        except ValueError as e:
+            return jsonify({
+                "error": str(e),
+                "message": "We can't render that. Even your therapist has standards."
+            }), 400
         
         if result.get('error'):
             return jsonify(result), 400
         
+        result['updated_avatar'] = avatar_service.public_view(result['updated_avatar'])
         return jsonify(result)
     
     @app.route('/api/avatar/<avatar_id>/video-preview', methods=['POST'])
@@ -340,17 +476,54 @@ def create_routes(app, roast_service, face_service, avatar_service):
     # 📁 FILE SERVING
     @app.route('/api/files/<filename>')
     def serve_file(filename):
-        """Serve uploaded or generated files"""
+        """Serve uploaded or generated files, optionally resized (?preset=thumb&format=webp)"""
+        
+        try:
+            derivative = derivatives.parse(request.args, request.headers.get('Accept', ''))
+        except ValueError as e:
+            return jsonify(dict(derivatives.describe(), **{
+                "error": str(e),
+                "message": "We only shrink therapists to sizes we've approved."
+            })), 400
+        suffix = derivatives.etag_suffix(derivative)
+        
+        def deliver(path):
+            if derivative is None:
+                return file_delivery.respond(path, filename)
+            source_hash = file_delivery.etag_for(path, filename)
+            derived_path = derivatives.get(path, source_hash, *derivative)
+            response = file_delivery.respond(derived_path, filename, etag=source_hash + suffix)
+            if request.args.get('format') == 'auto':
+                response.vary.add('Accept')
+            return response
+        
+        # Content-addressed names can be revalidated without touching the disk
+        not_modified = file_delivery.not_modified(filename, suffix)
+        if not_modified is not None:
+            if request.args.get('format') == 'auto':
+                not_modified.vary.add('Accept')
+            return not_modified
         
-        # Check in uploads folder first
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(upload_path):
-            return send_file(upload_path)
+        # One manifest lookup instead of probing both folders
+        file_path = file_store.resolve(filename)
+        if file_path:
+            try:
+                try:
+                    response = deliver(file_path)
+                except FileNotFoundError:
+                    if not os.path.exists(file_path):
+                        raise
+                    # Only the resized copy was evicted under us; the source is fine
+                    response = deliver(file_path)
+                avatar_service.variant_cache.touch(file_path)
+                return response
+            except FileNotFoundError:
+                file_store.discard(filename)  # evicted under us; render it again below
         
-        # Check in avatars folder
-        avatar_path = os.path.join(app.config['AVATAR_FOLDER'], filename)
-        if os.path.exists(avatar_path):
-            return send_file(avatar_path)
+        # Variants other than the preview are rendered on first request
+        rendered_path = avatar_service.render_on_demand(filename)
+        if rendered_path:
+            return deliver(rendered_path)
         
         return jsonify({
             "error": "File not found",
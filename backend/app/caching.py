@@ -0,0 +1,250 @@
+"""
+🧠 Caching Helpers for Mirror Mirror
+Remembering things so we don't have to disappoint you twice as slowly.
+
+"The only thing we never forget is how you looked in that selfie."
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with optional per-entry expiry and hit/miss counters.
+
+    Expiry times are wall-clock epoch seconds so they can come straight
+    from things like a JWT `exp` claim. With `max_bytes` and a `sizeof`
+    callable the cache is also bounded by the accounted size of its values.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None, sizeof: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry and mark it most recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.resident_bytes -= size
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            expires_at: Optional[float] = None):
+        """Store an entry, evicting the least recently used ones if full"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None:
+            ttl_expiry = time.time() + ttl
+            expires_at = ttl_expiry if expires_at is None else min(expires_at, ttl_expiry)
+
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.resident_bytes -= previous[2]
+            self._data[key] = (value, expires_at, size)
+            self.resident_bytes += size
+            while len(self._data) > self.maxsize or (
+                    self.max_bytes is not None and self.resident_bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self.resident_bytes -= evicted[2]
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.resident_bytes -= entry[2]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.resident_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the metrics endpoint"""
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize
+        }
+        if self.max_bytes is not None:
+            stats["resident_bytes"] = self.resident_bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller runs the function; everyone arriving while it runs
+    waits and gets the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights)
+        }
+
+
+class DiskLRU:
+    """
+    Byte budget over a set of files on disk.
+
+    Files are registered after they are written and touched when they are
+    read; once the total size passes `max_bytes` the least recently used
+    ones are deleted (and passed to `on_evict`). Evicted files are expected
+    to be re-creatable.
+    """
+
+    def __init__(self, max_bytes: int, on_evict: Optional[Callable[[str], None]] = None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.evictions = 0
+
+    def add(self, path: str):
+        """Register a freshly written file and evict old ones if over budget"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        evicted = []
+        with self._lock:
+            self.resident_bytes += size - self._files.pop(path, 0)
+            self._files[path] = size
+            while self.resident_bytes > self.max_bytes and len(self._files) > 1:
+                old_path, old_size = self._files.popitem(last=False)
+                self.resident_bytes -= old_size
+                self.evictions += 1
+                evicted.append(old_path)
+        for old_path in evicted:
+            if self.on_evict is not None:
+                self.on_evict(old_path)
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    def touch(self, path: str) -> bool:
+        """Mark a file recently used; False if it isn't tracked"""
+        with self._lock:
+            if path not in self._files:
+                return False
+            self._files.move_to_end(path)
+            return True
+
+    def discard(self, path: str):
+        with self._lock:
+            self.resident_bytes -= self._files.pop(path, 0)
+
+    def scan(self, paths):
+        """Adopt files that already exist (e.g. after a restart), oldest first"""
+        existing = []
+        for path in paths:
+            try:
+                existing.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        for _, path in sorted(existing):
+            self.add(path)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._files
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self._files),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,250 @@
+"""
+🗄️ Avatar Metadata Store
+Every therapist you've ever spawned, indexed for your convenience.
+
+"Millions of disappointing doppelgangers, and we can find any one of them in a millisecond."
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.caching import LRUCache
+
+
+class AvatarStore:
+    """
+    SQLite store for avatar metadata.
+
+    avatar_id is the primary key, with secondary indexes on the owning
+    user_id and the source upload's file_id. Metadata is kept as compact
+    JSON in one column, and reads go through an in-memory LRU. WAL mode and
+    per-thread connections, like SQLiteUserStorage. Other workers' writes
+    aren't seen by this worker's LRU, so entries expire after AVATAR_CACHE_TTL.
+    
+    Variants marked render="on_demand" are their own render recipe (the
+    avatar supplies the source, face box and file_id), so avatar_variants
+    only indexes their filenames back to an avatar. Content-addressed files
+    can belong to several avatars.
+    """
+
+    _COLUMNS = ('avatar_id', 'user_id', 'file_id', 'created_at', 'metadata')
+
+    def __init__(self, db_file: str = None, cache_size: int = None):
+        self.db_file = db_file or os.getenv(
+            'AVATAR_DB_PATH', os.path.join(os.getenv('DATA_FOLDER', './data'), 'avatars.sqlite3')
+        )
+        self._cache = LRUCache(maxsize=cache_size or int(os.getenv('AVATAR_CACHE_SIZE', 4096)),
+                               ttl=float(os.getenv('AVATAR_CACHE_TTL', 5)))
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection, opened lazily"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connection()
+        backfill = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'avatar_variants'"
+        ).fetchone() is None
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS avatars (
+                avatar_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                file_id TEXT,
+                created_at TEXT,
+                metadata TEXT NOT NULL
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_avatars_user ON avatars (user_id, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_avatars_file ON avatars (file_id)')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS avatar_variants (
+                filename TEXT NOT NULL,
+                avatar_id TEXT NOT NULL,
+                PRIMARY KEY (filename, avatar_id)
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_avatar_variants_avatar ON avatar_variants (avatar_id)')
+        
+        if backfill:
+            # Index the on-demand variants of avatars stored before the table existed
+            rows = conn.execute("SELECT metadata FROM avatars").fetchall()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany("INSERT OR IGNORE INTO avatar_variants (filename, avatar_id) VALUES (?, ?)",
+                             [pair for row in rows for pair in self._variant_rows(json.loads(row[0]))])
+            conn.execute('COMMIT')
+
+    @staticmethod
+    def _params(metadata: Dict[str, Any]) -> tuple:
+        return (metadata['avatar_id'], metadata.get('user_id'), metadata.get('file_id'),
+                metadata.get('generated_at'), json.dumps(metadata, separators=(',', ':')))
+
+    @staticmethod
+    def _variant_rows(metadata: Dict[str, Any]) -> List[tuple]:
+        return [(os.path.basename(variant['file_path']), metadata['avatar_id'])
+                for variant in metadata.get('variants') or []
+                if variant.get('render') == 'on_demand' and variant.get('file_path')]
+
+    def save(self, metadata: Dict[str, Any]):
+        """Insert or replace an avatar's metadata (and its on-demand variant index)"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                f"""INSERT INTO avatars ({', '.join(self._COLUMNS)}) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(avatar_id) DO UPDATE SET
+                        user_id = excluded.user_id,
+                        file_id = excluded.file_id,
+                        created_at = excluded.created_at,
+                        metadata = excluded.metadata""",
+                self._params(metadata)
+            )
+            conn.execute("DELETE FROM avatar_variants WHERE avatar_id = ?", (metadata['avatar_id'],))
+            conn.executemany("INSERT OR IGNORE INTO avatar_variants (filename, avatar_id) VALUES (?, ?)",
+                             self._variant_rows(metadata))
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        self._cache.set(metadata['avatar_id'], metadata)
+
+    def save_many(self, records: List[Dict[str, Any]]):
+        """Bulk upsert in one transaction (used by the importer)"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f"""INSERT INTO avatars ({', '.join(self._COLUMNS)}) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(avatar_id) DO NOTHING""",
+                [self._params(record) for record in records]
+            )
+            conn.executemany("INSERT OR IGNORE INTO avatar_variants (filename, avatar_id) VALUES (?, ?)",
+                             [pair for record in records for pair in self._variant_rows(record)])
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def get(self, avatar_id: str) -> Optional[Dict[str, Any]]:
+        """Avatar metadata, or None if there's no such avatar"""
+        metadata = self._cache.get(avatar_id)
+        if metadata is None:
+            row = self._connection().execute(
+                "SELECT metadata FROM avatars WHERE avatar_id = ?", (avatar_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            metadata = json.loads(row[0])
+            self._cache.set(avatar_id, metadata)
+        return metadata
+
+    def _find(self, column: str, value: str, limit: int) -> List[Dict[str, Any]]:
+        cursor = self._connection().execute(
+            f"SELECT metadata FROM avatars WHERE {column} = ? ORDER BY created_at DESC LIMIT ?", (value, limit)
+        )
+        return [json.loads(row[0]) for row in cursor]
+
+    def find_by_user(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        return self._find('user_id', user_id, limit)
+
+    def find_by_file(self, file_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        return self._find('file_id', file_id, limit)
+
+    def find_by_variant(self, filename: str) -> Optional[Dict[str, Any]]:
+        """An avatar that has `filename` as an on-demand variant"""
+        row = self._connection().execute(
+            "SELECT avatar_id FROM avatar_variants WHERE filename = ? LIMIT 1", (filename,)
+        ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def variant_filenames(self) -> Iterator[str]:
+        """Every on-demand variant filename"""
+        for row in self._connection().execute("SELECT DISTINCT filename FROM avatar_variants"):
+            yield row[0]
+
+    def exists(self, avatar_id: str) -> bool:
+        if avatar_id in self._cache:
+            return True
+        return self._connection().execute(
+            "SELECT 1 FROM avatars WHERE avatar_id = ?", (avatar_id,)
+        ).fetchone() is not None
+
+    def delete(self, avatar_id: str) -> bool:
+        self._cache.pop(avatar_id)
+        conn = self._connection()
+        conn.execute("DELETE FROM avatar_variants WHERE avatar_id = ?", (avatar_id,))
+        cursor = conn.execute("DELETE FROM avatars WHERE avatar_id = ?", (avatar_id,))
+        return cursor.rowcount > 0
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM avatars").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+def import_avatars_from_json(folder: str, store: AvatarStore, batch_size: int = 1000,
+                             remove: bool = False) -> Dict[str, int]:
+    """
+    One-shot import of legacy avatar_<id>.json files into the store.
+
+    Avatars already in the store are left alone; unreadable files are
+    counted as failed. With `remove`, files whose avatar is now in the
+    store are deleted.
+    """
+    imported = skipped = failed = 0
+    batch, batch_paths = [], []
+
+    def flush():
+        nonlocal imported
+        store.save_many(batch)
+        imported += len(batch)
+        if remove:
+            for path in batch_paths:
+                os.remove(path)
+        batch.clear()
+        batch_paths.clear()
+
+    for entry in os.scandir(folder):
+        if not (entry.name.startswith('avatar_') and entry.name.endswith('.json')):
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                metadata = json.load(f)
+            avatar_id = metadata['avatar_id']
+        except (OSError, ValueError, KeyError):
+            failed += 1
+            continue
+
+        if store.exists(avatar_id):
+            skipped += 1
+            if remove:
+                os.remove(entry.path)
+            continue
+
+        batch.append(metadata)
+        batch_paths.append(entry.path)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    return {'imported': imported, 'skipped': skipped, 'failed': failed}
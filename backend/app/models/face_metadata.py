@@ -0,0 +1,146 @@
+"""
+🗂️ Face Metadata Store
+Remembers where your face was, so we don't have to look at it twice.
+
+"We never forget a face. Mostly because we wrote it down."
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from app.caching import LRUCache
+
+FACE_METADATA_VERSION = 2
+
+
+class FaceMetadataStore:
+    """
+    Keyed store for the face data computed at upload time.
+
+    One compact JSON row per file_id in SQLite, next to the avatar store
+    (so every worker can read it), behind an in-memory LRU, so avatar
+    generation right after an upload never touches the disk or re-runs
+    detection. The processed image is recorded by filename only; the file
+    store knows where it lives now. Uploads from before the database are
+    read from their face_<id>.json and moved into it on first access.
+    """
+
+    def __init__(self, db_file: str = None, cache_size: int = None, legacy_folder: str = None):
+        data_folder = os.getenv('DATA_FOLDER', './data')
+        self.db_file = db_file or os.getenv('FACE_DB_PATH', os.path.join(data_folder, 'faces.sqlite3'))
+        self.legacy_folder = legacy_folder or os.path.join(data_folder, 'faces')
+        self._cache = LRUCache(maxsize=cache_size or int(os.getenv('FACE_METADATA_CACHE_SIZE', 1024)))
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection, opened lazily"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS faces (
+                file_id TEXT PRIMARY KEY,
+                metadata TEXT NOT NULL
+            )
+        """)
+
+    @staticmethod
+    def _compact(file_id: str, processed_file: str, face_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep only what avatar generation needs"""
+        features = face_data.get('features', {})
+        quality = face_data.get('quality_score', {})
+        return {
+            "v": FACE_METADATA_VERSION,
+            "file_id": file_id,
+            "processed_file": processed_file,
+            "position": list(face_data['position']),
+            "features": {
+                "face_width": features.get('face_width'),
+                "face_height": features.get('face_height'),
+                "aspect_ratio": features.get('aspect_ratio'),
+                "size_category": features.get('size_category'),
+                "suggested_accessories": features.get('suggested_accessories', [])
+            },
+            "quality": quality.get('overall_score') if isinstance(quality, dict) else quality,
+            "source_hash": face_data.get('source_hash')
+        }
+
+    @staticmethod
+    def _expand(record: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a stored record into the face_data shape services expect"""
+        face_data = dict(record)
+        # Version 1 records held the full (pre-sharding) path
+        legacy_path = face_data.pop('processed_path', None)
+        if 'processed_file' not in face_data:
+            face_data['processed_file'] = os.path.basename(legacy_path) if legacy_path else None
+        face_data['position'] = tuple(record['position'])
+        face_data.pop('original_position', None)  # older records mapped it onto the upload
+        face_data['features'] = dict(record['features'])
+        return face_data
+
+    def _insert(self, file_id: str, record: Dict[str, Any]):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO faces (file_id, metadata) VALUES (?, ?)",
+            (file_id, json.dumps(record, separators=(',', ':')))
+        )
+        self._cache.set(file_id, record)
+
+    def save(self, file_id: str, processed_file: str, face_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist face data for an upload and keep it hot in memory"""
+        record = self._compact(file_id, processed_file, face_data)
+        self._insert(file_id, record)
+        return self._expand(record)
+
+    def _adopt_legacy_record(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Move a face_<id>.json written before the database existed into it"""
+        legacy_path = os.path.join(self.legacy_folder, f"face_{file_id}.json")
+        try:
+            with open(legacy_path, 'r') as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self._insert(file_id, record)
+        try:
+            os.remove(legacy_path)
+        except FileNotFoundError:
+            pass  # another worker adopted it at the same time
+        return record
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Face data for an upload, or None if it was never stored"""
+        if not file_id or os.path.basename(file_id) != file_id:
+            return None
+
+        record = self._cache.get(file_id)
+        if record is None:
+            row = self._connection().execute(
+                "SELECT metadata FROM faces WHERE file_id = ?", (file_id,)
+            ).fetchone()
+            if row is not None:
+                record = json.loads(row[0])
+                self._cache.set(file_id, record)
+            else:
+                record = self._adopt_legacy_record(file_id)
+                if record is None:
+                    return None
+        return self._expand(record)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
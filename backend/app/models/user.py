@@ -5,14 +5,16 @@ Because even fake therapy needs real users... unfortunately.
 "Every user is special. Special in their own disappointing way."
 """
 
-import json
-import os
 import uuid
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-from werkzeug.security import generate_password_hash, check_password_hash
+from typing import Optional, Dict, Any, Callable, List
 import jwt
 
+from app.models.user_storage import UserRecord, UserStorageBackend, create_user_storage
+from app.models.write_behind import (
+    WriteBehindBuffer, DEFERRABLE_FIELDS, DURABILITY_DEFERRED, DURABILITY_IMMEDIATE
+)
+
 
 class User:
     """User model for authentication and profile management"""
@@ -28,13 +30,17 @@ class User:
         self.last_login = last_login
         self.profile_data = profile_data or {}
         
-    def set_password(self, password: str):
-        """Hash and set user password"""
-        self.password_hash = generate_password_hash(password)
+    def set_password(self, password: str, hasher):
+        """Hash and set user password with the given hasher (hash/verify/needs_rehash)"""
+        self.password_hash = hasher.hash(password)
     
-    def check_password(self, password: str) -> bool:
+    def check_password(self, password: str, hasher) -> bool:
         """Check if provided password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self, hasher) -> bool:
+        """Check if the stored hash predates the hasher's current parameters"""
+        return hasher.needs_rehash(self.password_hash)
     
     def update_last_login(self):
         """Update last login timestamp"""
@@ -78,112 +84,119 @@ class User:
 
 
 class UserDatabase:
-    """Simple file-based user database (for development)"""
-    
-    def __init__(self, db_file: str = "./data/users.json"):
-        self.db_file = db_file
-        self._ensure_db_exists()
-    
-    def _ensure_db_exists(self):
-        """Create database file if it doesn't exist"""
-        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
-        if not os.path.exists(self.db_file):
-            with open(self.db_file, 'w') as f:
-                json.dump({}, f)
-    
-    def _load_users(self) -> Dict[str, Dict]:
-        """Load users from database file"""
-        try:
-            with open(self.db_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_users(self, users: Dict[str, Dict]):
-        """Save users to database file"""
-        with open(self.db_file, 'w') as f:
-            json.dump(users, f, indent=2)
+    """
+    User database facade over a pluggable storage backend.
+    
+    The JSON file backend stays the default for development; set
+    USER_DB_BACKEND=sqlite (and optionally USER_DB_PATH) for real traffic.
+    Small field updates (last login, profile) can be deferred to a
+    write-behind buffer instead of costing a full write each. Passwords
+    are hashed with the injected `password_hasher`.
+    """
+    
+    def __init__(self, db_file: str = None, storage: UserStorageBackend = None, password_hasher=None):
+        if storage is None:
+            storage = create_user_storage(path=db_file)
+        self.storage = storage
+        self.password_hasher = password_hasher
+        self._change_listeners: List[Callable[[str], None]] = []
+        self.write_buffer = WriteBehindBuffer(storage, on_flush=self._notify_flushed)
+    
+    def add_change_listener(self, listener: Callable[[str], None]):
+        """Call listener(user_id) whenever a user is updated or deleted"""
+        self._change_listeners.append(listener)
+    
+    def _notify_change(self, user_id: str):
+        for listener in self._change_listeners:
+            listener(user_id)
+    
+    def _notify_flushed(self, user_ids):
+        """Deferred writes just landed; anything cached before they did is stale"""
+        for user_id in user_ids:
+            self._notify_change(user_id)
+    
+    def _to_user(self, record: Optional[UserRecord]) -> Optional[User]:
+        """Build a User the caller is free to mutate, including pending writes"""
+        if record is None:
+            return None
+        user = User(user_id=record.user_id, username=record.username, email=record.email,
+                    password_hash=record.password_hash, created_at=record.created_at,
+                    last_login=record.last_login, profile_data=dict(record.profile_data))
+        pending = self.write_buffer.pending_for(record.user_id)
+        if pending:
+            for field, value in pending.items():
+                setattr(user, field, value)
+        return user
     
     def create_user(self, username: str, email: str, password: str) -> Optional[User]:
         """Create a new user"""
-        users = self._load_users()
+        # Cheap duplicate probes before paying for the password hash;
+        # the backend re-checks atomically on insert
+        if self.storage.get_by_username(username) is not None:
+            raise ValueError("Username already exists")
+        if self.storage.get_by_email(email) is not None:
+            raise ValueError("Email already exists")
         
-        # Check if username or email already exists
-        for user_data in users.values():
-            if user_data['username'] == username:
-                raise ValueError("Username already exists")
-            if user_data['email'] == email:
-                raise ValueError("Email already exists")
-        
-        # Create new user
         user = User(username=username, email=email)
-        user.set_password(password)
-        
-        # Save to database
-        users[user.user_id] = {
-            'user_id': user.user_id,
-            'username': user.username,
-            'email': user.email,
-            'password_hash': user.password_hash,
-            'created_at': user.created_at,
-            'last_login': user.last_login,
-            'profile_data': user.profile_data
-        }
+        user.set_password(password, self.password_hasher)
         
-        self._save_users(users)
+        self.storage.insert(UserRecord.from_user(user))
         return user
     
     def get_user_by_id(self, user_id: str) -> Optional[User]:
         """Get user by ID"""
-        users = self._load_users()
-        user_data = users.get(user_id)
-        
-        if user_data:
-            return User(**user_data)
-        return None
+        return self._to_user(self.storage.get_by_id(user_id))
     
     def get_user_by_username(self, username: str) -> Optional[User]:
         """Get user by username"""
-        users = self._load_users()
-        
-        for user_data in users.values():
-            if user_data['username'] == username:
-                return User(**user_data)
-        return None
+        return self._to_user(self.storage.get_by_username(username))
     
     def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
-        users = self._load_users()
-        
-        for user_data in users.values():
-            if user_data['email'] == email:
-                return User(**user_data)
-        return None
+        return self._to_user(self.storage.get_by_email(email))
     
     def update_user(self, user: User):
         """Update user in database"""
-        users = self._load_users()
-        users[user.user_id] = {
-            'user_id': user.user_id,
-            'username': user.username,
-            'email': user.email,
-            'password_hash': user.password_hash,
-            'created_at': user.created_at,
-            'last_login': user.last_login,
-            'profile_data': user.profile_data
-        }
-        self._save_users(users)
+        # The full record supersedes anything still waiting in the buffer
+        self.write_buffer.take(user.user_id)
+        self.storage.update(UserRecord.from_user(user))
+        self._notify_change(user.user_id)
+    
+    def update_user_fields(self, user_id: str, fields: Dict[str, Any],
+                           durability: str = DURABILITY_DEFERRED):
+        """
+        Update a few fields of a user.
+        
+        DURABILITY_DEFERRED merges them into the write-behind buffer and
+        returns immediately; DURABILITY_IMMEDIATE writes them (and anything
+        already pending for the user) before returning. Only last_login,
+        profile_data and password_hash may be deferred.
+        """
+        if durability == DURABILITY_DEFERRED:
+            unsupported = set(fields) - DEFERRABLE_FIELDS
+            if unsupported:
+                raise ValueError(f"Fields cannot be deferred: {', '.join(sorted(unsupported))}")
+            self.write_buffer.stage(user_id, fields)
+        elif durability == DURABILITY_IMMEDIATE:
+            merged = self.write_buffer.take(user_id)
+            merged.update(fields)
+            self.storage.update_fields({user_id: merged})
+        else:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self._notify_change(user_id)
+    
+    def flush(self):
+        """Write out all deferred updates now"""
+        self.write_buffer.flush()
     
     def delete_user(self, user_id: str) -> bool:
         """Delete user from database"""
-        users = self._load_users()
-        if user_id in users:
-            del users[user_id]
-            self._save_users(users)
-            return True
-        return False
+        self.write_buffer.take(user_id)
+        deleted = self.storage.delete(user_id)
+        if deleted:
+            self._notify_change(user_id)
+        return deleted
     
     def get_all_users(self) -> Dict[str, User]:
         """Get all users"""
-        users = self._load_users()
-        return {user_id: User(**user_data) for user_id, user_data in users.items()}
+        return {user_id: self._to_user(record) for user_id, record in self.storage.all().items()}
@@ -0,0 +1,456 @@
+"""
+🗄️ User Storage Backends for Mirror Mirror
+Where we keep everyone who signed up for disappointment.
+
+"Your insecurities, now with ACID guarantees."
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to in-process locking only
+    fcntl = None
+
+
+class UserRecord:
+    """Compact resident copy of a stored user (password hash included)"""
+
+    __slots__ = ('user_id', 'username', 'email', 'password_hash',
+                 'created_at', 'last_login', 'profile_data')
+
+    def __init__(self, user_id: str, username: str, email: str, password_hash: str,
+                 created_at: str = None, last_login: str = None, profile_data: Dict = None):
+        self.user_id = user_id
+        self.username = username
+        self.email = email
+        self.password_hash = password_hash
+        self.created_at = created_at
+        self.last_login = last_login
+        self.profile_data = profile_data or {}
+
+    @classmethod
+    def from_user(cls, user) -> 'UserRecord':
+        """Snapshot a User into a record"""
+        return cls(user.user_id, user.username, user.email, user.password_hash,
+                   user.created_at, user.last_login, dict(user.profile_data))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize record for storage"""
+        return {
+            'user_id': self.user_id,
+            'username': self.username,
+            'email': self.email,
+            'password_hash': self.password_hash,
+            'created_at': self.created_at,
+            'last_login': self.last_login,
+            'profile_data': self.profile_data
+        }
+
+
+class UserStorageBackend(ABC):
+    """
+    Interface every UserDatabase storage engine implements.
+
+    Backends hand out UserRecord objects and raise ValueError with a
+    user-facing message when a username or email is already taken.
+    """
+
+    @abstractmethod
+    def get_by_id(self, user_id: str) -> Optional[UserRecord]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_by_username(self, username: str) -> Optional[UserRecord]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_by_email(self, email: str) -> Optional[UserRecord]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert(self, record: UserRecord):
+        """Store a new user, rejecting duplicate usernames or emails"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, record: UserRecord):
+        """Replace (or create) the stored copy of a user"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_fields(self, updates: Dict[str, Dict[str, Any]]):
+        """Apply {user_id: {field: value}} for many users in a single write"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, user_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def all(self) -> Dict[str, UserRecord]:
+        raise NotImplementedError
+
+    def close(self):
+        """Release any handles held by the backend"""
+
+
+class JSONUserStorage(UserStorageBackend):
+    """
+    Single JSON file storage (for development).
+
+    Users are kept resident with hash indexes on user_id, username and email.
+    The file's (mtime, size) signature is checked before each operation, so
+    several workers sharing the file reload only when someone else wrote it.
+    Writes take an exclusive lock on a sidecar lock file, merge any foreign
+    changes first and replace the file atomically.
+    """
+
+    def __init__(self, db_file: str = "./data/users.json"):
+        self.db_file = db_file
+        self.lock_file = db_file + '.lock'
+        self._lock = threading.RLock()
+        self._records: Dict[str, UserRecord] = {}
+        self._username_index: Dict[str, str] = {}
+        self._email_index: Dict[str, str] = {}
+        self._file_signature = None
+        self._ensure_db_exists()
+
+    def _ensure_db_exists(self):
+        """Create database file if it doesn't exist"""
+        os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+        if not os.path.exists(self.db_file):
+            with open(self.db_file, 'w') as f:
+                json.dump({}, f)
+
+    def _current_signature(self) -> Optional[Tuple[int, int]]:
+        """Cheap change marker for the database file"""
+        try:
+            stat = os.stat(self.db_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load_users(self) -> Dict[str, Dict]:
+        """Load users from database file"""
+        try:
+            with open(self.db_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_users(self, users: Dict[str, Dict]):
+        """Atomically replace the database file"""
+        directory = os.path.dirname(self.db_file) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.users-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(users, f, indent=2)
+            os.replace(tmp_path, self.db_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._file_signature = self._current_signature()
+
+    def _refresh(self):
+        """Reload and re-index only if the file changed since we last saw it"""
+        signature = self._current_signature()
+        if signature is not None and signature == self._file_signature:
+            return
+
+        records = {}
+        username_index = {}
+        email_index = {}
+        for user_id, user_data in self._load_users().items():
+            record = UserRecord(**user_data)
+            records[user_id] = record
+            username_index[record.username] = user_id
+            email_index[record.email] = user_id
+
+        self._records = records
+        self._username_index = username_index
+        self._email_index = email_index
+        self._file_signature = signature
+
+    @contextmanager
+    def _write_transaction(self):
+        """Hold the cross-process lock, start from the latest file, persist on exit"""
+        with self._lock:
+            with open(self.lock_file, 'a') as lock_handle:
+                if fcntl is not None:
+                    fcntl.flock(lock_handle, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    snapshot = (dict(self._records), dict(self._username_index), dict(self._email_index))
+                    try:
+                        yield
+                        self._save_users({user_id: record.to_dict()
+                                          for user_id, record in self._records.items()})
+                    except Exception:
+                        # Nothing reached the disk, so memory shouldn't claim otherwise
+                        self._records, self._username_index, self._email_index = snapshot
+                        raise
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_handle, fcntl.LOCK_UN)
+
+    def _index(self, record: UserRecord):
+        """Add or replace a record in all indexes"""
+        previous = self._records.get(record.user_id)
+        if previous is not None:
+            self._username_index.pop(previous.username, None)
+            self._email_index.pop(previous.email, None)
+        self._records[record.user_id] = record
+        self._username_index[record.username] = record.user_id
+        self._email_index[record.email] = record.user_id
+
+    def get_by_id(self, user_id: str) -> Optional[UserRecord]:
+        with self._lock:
+            self._refresh()
+            return self._records.get(user_id)
+
+    def get_by_username(self, username: str) -> Optional[UserRecord]:
+        with self._lock:
+            self._refresh()
+            user_id = self._username_index.get(username)
+            return self._records[user_id] if user_id else None
+
+    def get_by_email(self, email: str) -> Optional[UserRecord]:
+        with self._lock:
+            self._refresh()
+            user_id = self._email_index.get(email)
+            return self._records[user_id] if user_id else None
+
+    def insert(self, record: UserRecord):
+        with self._write_transaction():
+            if record.username in self._username_index:
+                raise ValueError("Username already exists")
+            if record.email in self._email_index:
+                raise ValueError("Email already exists")
+            self._index(record)
+
+    def update(self, record: UserRecord):
+        with self._write_transaction():
+            self._index(record)
+
+    def update_fields(self, updates: Dict[str, Dict[str, Any]]):
+        with self._write_transaction():
+            for user_id, fields in updates.items():
+                record = self._records.get(user_id)
+                if record is None:
+                    continue
+                # Resident records are handed out to readers; replace, don't mutate
+                record = copy.copy(record)
+                for field, value in fields.items():
+                    setattr(record, field, value)
+                self._records[user_id] = record
+
+    def delete(self, user_id: str) -> bool:
+        with self._write_transaction():
+            record = self._records.pop(user_id, None)
+            if record is None:
+                return False
+            self._username_index.pop(record.username, None)
+            self._email_index.pop(record.email, None)
+            return True
+
+    def all(self) -> Dict[str, UserRecord]:
+        with self._lock:
+            self._refresh()
+            return dict(self._records)
+
+
+class SQLiteUserStorage(UserStorageBackend):
+    """
+    SQLite storage with unique indexes on username and email.
+
+    Runs in WAL mode so readers never block the writer, and keeps one
+    connection per thread instead of reconnecting on every call.
+    """
+
+    _COLUMNS = ('user_id', 'username', 'email', 'password_hash',
+                'created_at', 'last_login', 'profile_data')
+
+    def __init__(self, db_file: str = "./data/users.sqlite3"):
+        self.db_file = db_file
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection, opened lazily"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                email TEXT NOT NULL,
+                password_hash TEXT,
+                created_at TEXT,
+                last_login TEXT,
+                profile_data TEXT NOT NULL DEFAULT '{}'
+            )
+        """)
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username)')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email)')
+
+    def _row_to_record(self, row) -> Optional[UserRecord]:
+        if row is None:
+            return None
+        values = dict(zip(self._COLUMNS, row))
+        values['profile_data'] = json.loads(values['profile_data'] or '{}')
+        return UserRecord(**values)
+
+    def _record_params(self, record: UserRecord) -> Tuple:
+        return (record.user_id, record.username, record.email, record.password_hash,
+                record.created_at, record.last_login,
+                json.dumps(record.profile_data, separators=(',', ':')))
+
+    def _fetch_one(self, column: str, value: str) -> Optional[UserRecord]:
+        cursor = self._connection().execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM users WHERE {column} = ?", (value,)
+        )
+        return self._row_to_record(cursor.fetchone())
+
+    @staticmethod
+    def _duplicate_error(error: sqlite3.IntegrityError) -> ValueError:
+        """Translate a unique-index violation into the message callers expect"""
+        message = str(error)
+        if 'username' in message:
+            return ValueError("Username already exists")
+        if 'email' in message:
+            return ValueError("Email already exists")
+        return ValueError("User already exists")
+
+    def get_by_id(self, user_id: str) -> Optional[UserRecord]:
+        return self._fetch_one('user_id', user_id)
+
+    def get_by_username(self, username: str) -> Optional[UserRecord]:
+        return self._fetch_one('username', username)
+
+    def get_by_email(self, email: str) -> Optional[UserRecord]:
+        return self._fetch_one('email', email)
+
+    def insert(self, record: UserRecord):
+        try:
+            self._connection().execute(
+                f"INSERT INTO users ({', '.join(self._COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._record_params(record)
+            )
+        except sqlite3.IntegrityError as e:
+            raise self._duplicate_error(e)
+
+    def update(self, record: UserRecord):
+        try:
+            self._connection().execute(
+                f"""INSERT INTO users ({', '.join(self._COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = excluded.username,
+                        email = excluded.email,
+                        password_hash = excluded.password_hash,
+                        created_at = excluded.created_at,
+                        last_login = excluded.last_login,
+                        profile_data = excluded.profile_data""",
+                self._record_params(record)
+            )
+        except sqlite3.IntegrityError as e:
+            raise self._duplicate_error(e)
+
+    def update_fields(self, updates: Dict[str, Dict[str, Any]]):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for user_id, fields in updates.items():
+                columns = [column for column in fields if column in self._COLUMNS[1:]]
+                if not columns:
+                    continue
+                values = [json.dumps(fields[column], separators=(',', ':')) if column == 'profile_data'
+                          else fields[column] for column in columns]
+                conn.execute(
+                    f"UPDATE users SET {', '.join(f'{column} = ?' for column in columns)} WHERE user_id = ?",
+                    (*values, user_id)
+                )
+        except sqlite3.IntegrityError as e:
+            conn.execute('ROLLBACK')
+            raise self._duplicate_error(e)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def delete(self, user_id: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def all(self) -> Dict[str, UserRecord]:
+        cursor = self._connection().execute(f"SELECT {', '.join(self._COLUMNS)} FROM users")
+        return {row[0]: self._row_to_record(row) for row in cursor}
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+STORAGE_BACKENDS = {
+    'json': JSONUserStorage,
+    'sqlite': SQLiteUserStorage,
+}
+
+
+def create_user_storage(backend: str = None, path: str = None) -> UserStorageBackend:
+    """
+    Build the configured storage backend.
+
+    Defaults come from USER_DB_BACKEND ('json' or 'sqlite') and USER_DB_PATH.
+    """
+    backend = (backend or os.getenv('USER_DB_BACKEND', 'json')).lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown user storage backend: {backend}")
+
+    path = path or os.getenv('USER_DB_PATH')
+    return STORAGE_BACKENDS[backend](path) if path else STORAGE_BACKENDS[backend]()
+
+
+def import_users_from_json(json_file: str, storage: UserStorageBackend) -> Dict[str, int]:
+    """
+    One-shot import of an existing users.json into another backend.
+
+    Users whose id already exists in the target are skipped, as are users
+    whose username or email collides with a different stored user.
+    """
+    with open(json_file, 'r') as f:
+        users = json.load(f)
+
+    imported = 0
+    skipped = 0
+    for user_id, user_data in users.items():
+        if storage.get_by_id(user_id) is not None:
+            skipped += 1
+            continue
+        try:
+            storage.insert(UserRecord(**user_data))
+            imported += 1
+        except ValueError:
+            skipped += 1
+
+    return {'imported': imported, 'skipped': skipped, 'total': len(users)}
@@ -0,0 +1,128 @@
+"""
+⏳ Write-Behind Buffer for Mirror Mirror Users
+Saving your last login eventually, like all our promises.
+
+"Procrastination, but as a storage strategy."
+"""
+
+import atexit
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+DURABILITY_IMMEDIATE = 'immediate'
+DURABILITY_DEFERRED = 'deferred'
+
+# Fields that never take part in a uniqueness check, so they are safe to defer
+DEFERRABLE_FIELDS = frozenset({'last_login', 'profile_data', 'password_hash'})
+
+
+class WriteBehindBuffer:
+    """
+    Merges pending per-user field updates and flushes them in one backend write.
+
+    A flush happens every `flush_interval` seconds, as soon as `max_batch`
+    users have pending changes, and at interpreter shutdown. Readers overlay
+    `pending_for(user_id)` on top of stored records so they never see stale data;
+    that includes a batch that is being written, until its write commits.
+    `on_flush(user_ids)` is called after each successful write.
+    """
+
+    def __init__(self, storage, flush_interval: float = None, max_batch: int = None,
+                 on_flush: Callable[[Iterable[str]], None] = None):
+        self.storage = storage
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval or float(os.getenv('USER_WRITE_FLUSH_INTERVAL', 2.0))
+        self.max_batch = max_batch or int(os.getenv('USER_WRITE_BATCH_SIZE', 100))
+
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.flushes = 0
+        self.flushed_users = 0
+
+        self._thread = threading.Thread(target=self._run, name='user-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def stage(self, user_id: str, fields: Dict[str, Any]):
+        """Queue field updates for a user, merging with anything already pending"""
+        with self._lock:
+            self._pending.setdefault(user_id, {}).update(fields)
+            batch_full = len(self._pending) >= self.max_batch
+        if batch_full:
+            self._wakeup.set()
+
+    def pending_for(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            fields = dict(self._in_flight.get(user_id) or {})
+            fields.update(self._pending.get(user_id) or {})
+            return fields or None
+
+    def take(self, user_id: str) -> Dict[str, Any]:
+        """Remove and return a user's pending fields (for an immediate write)"""
+        # Wait out a flush in progress, so its older values can't land after ours
+        with self._flush_lock:
+            with self._lock:
+                return self._pending.pop(user_id, None) or {}
+
+    def flush(self):
+        """Write everything pending in a single backend call"""
+        with self._flush_lock:
+            with self._lock:
+                # Still visible to pending_for() until the write commits
+                batch, self._pending = self._pending, {}
+                self._in_flight = batch
+            if not batch:
+                return
+
+            try:
+                self.storage.update_fields(batch)
+            except Exception as e:
+                print(f"Warning: deferred user write failed, will retry: {e}")
+                with self._lock:
+                    # Newer staged values win over the ones we failed to write
+                    for user_id, fields in batch.items():
+                        merged = dict(fields)
+                        merged.update(self._pending.get(user_id, {}))
+                        self._pending[user_id] = merged
+                    self._in_flight = {}
+                return
+
+            with self._lock:
+                self._in_flight = {}
+                self.flushes += 1
+                self.flushed_users += len(batch)
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush(batch.keys())
+            except Exception as e:
+                print(f"Warning: write-behind flush listener failed: {e}")
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the flusher and write out whatever is still pending"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_users": len(self._pending),
+                "flushes": self.flushes,
+                "flushed_users": self.flushed_users,
+                "flush_interval": self.flush_interval,
+                "max_batch": self.max_batch
+            }
@@ -8,18 +8,102 @@ Because even fake therapy needs real security... sort of.
 from typing import Optional, Dict, Any, Tuple
 from functools import wraps
 from flask import request, jsonify, current_app
+import copy
+import itertools
+import os
 import re
-from datetime import datetime, timedelta
+import threading
 
+from app.caching import LRUCache
 from app.models.user import User, UserDatabase
+from app.services.password_hasher import HasherSaturatedError, get_password_hasher
+
+
+class TokenCache:
+    """
+    Bounded LRU cache from a verified JWT to the user it resolved to.
+    
+    Entries expire at the token's `exp` (or after TOKEN_CACHE_TTL seconds,
+    whichever comes first, so changes made by other workers are picked up).
+    Updating or deleting a user bumps its generation, which makes every
+    cached token for that user miss on the next lookup. Callers read the
+    generation before loading the user and store under that one, so a
+    change that lands in between still invalidates the entry.
+    
+    Generations come from one increasing counter and live in an LRU with
+    the same TTL as the tokens, so they are bounded too. A user without an
+    entry is at the floor generation, which jumps past every number handed
+    out so far whenever an entry is evicted early; that costs some misses
+    but never revives a token cached before its user changed.
+    """
+    
+    def __init__(self, maxsize: int = None, ttl: float = None):
+        maxsize = maxsize or int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+        ttl = ttl if ttl is not None else float(os.getenv('TOKEN_CACHE_TTL', 300))
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._generations = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._counter = itertools.count(1)
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _copy(user: User) -> User:
+        user = copy.copy(user)
+        user.profile_data = dict(user.profile_data)
+        return user
+    
+    def generation(self, user_id: str) -> int:
+        with self._lock:
+            return self._generations.get(user_id, self._floor)
+    
+    def get(self, token: str) -> Optional[User]:
+        """The cached user (a private copy), or None"""
+        entry = self._cache.get(token)
+        if entry is not None and self.generation(entry[0].user_id) != entry[1]:
+            self._cache.pop(token)
+            entry = None
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._copy(entry[0])
+    
+    def set(self, token: str, user: User, expires_at: float, generation: int):
+        """Cache a user loaded after generation(user.user_id) returned `generation`"""
+        self._cache.set(token, (self._copy(user), generation), expires_at=expires_at)
+    
+    def invalidate_user(self, user_id: str):
+        """Drop every cached token that resolved to this user"""
+        with self._lock:
+            generation = next(self._counter)
+            evictions = self._generations.evictions
+            self._generations.set(user_id, generation)
+            if self._generations.evictions != evictions:
+                self._floor = generation
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = self._cache.stats()
+        stats.update({
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        })
+        return stats
 
 
 class AuthService:
     """Authentication service for user management"""
     
-    def __init__(self):
-        self.user_db = UserDatabase()
+    def __init__(self, user_db: UserDatabase = None):
+        self.password_hasher = get_password_hasher()
+        self.user_db = user_db or UserDatabase(password_hasher=self.password_hasher)
         self.email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+        self.token_cache = TokenCache()
+        self.user_db.add_change_listener(self.token_cache.invalidate_user)
     
     def validate_email(self, email: str) -> bool:
         """Validate email format"""
@@ -80,6 +164,8 @@ class AuthService:
             
         except ValueError as e:
             return False, str(e), None
+        except HasherSaturatedError:
+            raise
         except Exception as e:
             return False, f"Registration failed: {str(e)}", None
     
@@ -97,12 +183,17 @@ class AuthService:
                 return False, "Invalid credentials", None
             
             # Check password
-            if not user.check_password(password):
+            if not user.check_password(password, self.password_hasher):
                 return False, "Invalid credentials", None
             
-            # Update last login
+            # Update last login, and upgrade hashes made with older parameters
+            # while we have the plaintext; both ride the write-behind buffer
             user.update_last_login()
-            self.user_db.update_user(user)
+            changes = {'last_login': user.last_login}
+            if user.password_needs_rehash(self.password_hasher):
+                user.set_password(password, self.password_hasher)
+                changes['password_hash'] = user.password_hash
+            self.user_db.update_user_fields(user.user_id, changes)
             
             # Generate token
             token = user.generate_token(current_app.config['SECRET_KEY'])
@@ -113,15 +204,25 @@ class AuthService:
                 'message': f"Welcome back, {user.username}! Ready for more existential dread?"
             }
             
+        except HasherSaturatedError:
+            raise
         except Exception as e:
             return False, f"Login failed: {str(e)}", None
     
     def verify_token(self, token: str) -> Optional[User]:
         """Verify JWT token and return user"""
         try:
+            user = self.token_cache.get(token)
+            if user:
+                return user
+            
             payload = User.verify_token(token, current_app.config['SECRET_KEY'])
             if payload:
+                # Read before loading, so an update racing the load invalidates this entry
+                generation = self.token_cache.generation(payload['user_id'])
                 user = self.user_db.get_user_by_id(payload['user_id'])
+                if user:
+                    self.token_cache.set(token, user, expires_at=payload['exp'], generation=generation)
                 return user
             return None
         except Exception:
@@ -148,7 +249,7 @@ class AuthService:
                 return False, "User not found"
             
             # Verify old password
-            if not user.check_password(old_password):
+            if not user.check_password(old_password, self.password_hasher):
                 return False, "Invalid current password"
             
             # Validate new password
@@ -157,11 +258,13 @@ class AuthService:
                 return False, password_msg
             
             # Update password
-            user.set_password(new_password)
+            user.set_password(new_password, self.password_hasher)
             self.user_db.update_user(user)
             
             return True, "Password changed successfully"
             
+        except HasherSaturatedError:
+            raise
         except Exception as e:
             return False, f"Password change failed: {str(e)}"
     
@@ -174,7 +277,7 @@ class AuthService:
             
             # Update profile data
             user.profile_data.update(profile_data)
-            self.user_db.update_user(user)
+            self.user_db.update_user_fields(user.user_id, {'profile_data': user.profile_data})
             
             return True, "Profile updated successfully", user.to_dict()
             
@@ -182,11 +285,25 @@ class AuthService:
             return False, f"Profile update failed: {str(e)}", None
 
 
+_auth_service = None
+_auth_service_lock = threading.Lock()
+
+
+def get_auth_service() -> AuthService:
+    """Process-wide AuthService shared by the routes and decorators"""
+    global _auth_service
+    if _auth_service is None:
+        with _auth_service_lock:
+            if _auth_service is None:
+                _auth_service = AuthService()
+    return _auth_service
+
+
 def token_required(f):
     """Decorator to require authentication token"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth_service = AuthService()
+        auth_service = get_auth_service()
         user = auth_service.get_current_user(request)
         
         if not user:
@@ -205,7 +322,7 @@ def optional_auth(f):
     """Decorator for optional authentication (user can be None)"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth_service = AuthService()
+        auth_service = get_auth_service()
         user = auth_service.get_current_user(request)
         return f(current_user=user, *args, **kwargs)
     
@@ -5,15 +5,46 @@ Creates deepfake therapist avatars with maximum therapeutic uselessness.
 "Generating your worst self to give you the advice you don't want to hear."
 """
 
-import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+import copy
+import hashlib
 import os
 import uuid
 import json
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Callable, Dict, List, Tuple, Optional, Any
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION, TimeoutError as FutureTimeoutError
+
+from app.caching import DiskLRU, LRUCache, SingleFlight
+from app.models.avatar_store import AvatarStore
+from app.services.file_store import ShardedFileStore, get_file_store
+from app.services.frame_cache import DecodedFrameCache, get_frame_cache
+from app.services.mood_filters import load_mood_filters
+
+# Bump whenever a drawing or filter change alters what a variant looks like;
+# it is part of every variant's content hash
+RENDERER_VERSION = 2
+
+# Customization keys that change pixels (everything else is persona/metadata)
+RENDER_CUSTOMIZATIONS = ('mood', 'variant_overrides')
+
+# Metadata that identifies the owner or their upload; not for unauthenticated readers
+PRIVATE_AVATAR_FIELDS = ('user_id', 'file_id', 'source_hash', 'source_image')
+
+# Accessories that are actually drawn; the rest are aspirational
+DRAWN_ACCESSORIES = ('glasses', 'notepad', 'tissue_box')
+
+# Accessory layers are cut into pieces at most this many pixels tall
+SPRITE_TILE = 64
+
+
+def _sprite_bytes(sprites: List[Tuple[Image.Image, Tuple[int, int]]]) -> int:
+    """Resident size of a cached list of (sprite, offset) accessory pieces"""
+    return sum(sprite.size[0] * sprite.size[1] * 4 for sprite, _ in sprites)
 
 
 class AvatarGeneratorService:
@@ -22,9 +53,49 @@ class AvatarGeneratorService:
     and prepares them for the therapeutic roasting experience.
     """
     
-    def __init__(self):
+    def __init__(self, frame_cache: DecodedFrameCache = None, avatar_store: AvatarStore = None,
+                 file_store: ShardedFileStore = None):
         """Initialize avatar generation service"""
         self.avatar_folder = os.getenv('AVATAR_FOLDER', '../generated_avatars')
+        self.frame_cache = frame_cache or get_frame_cache()
+        self.file_store = file_store or get_file_store()
+        self.avatar_store = avatar_store or AvatarStore()
+        
+        # Variants render concurrently; JPEG encoding releases the GIL, so threads
+        # share one read-only decoded base image without pickling it to processes
+        self.render_workers = int(os.getenv('AVATAR_RENDER_WORKERS', 4))
+        self.render_deadline = float(os.getenv('AVATAR_RENDER_DEADLINE', 15))
+        self.render_pool = ThreadPoolExecutor(max_workers=self.render_workers,
+                                              thread_name_prefix='avatar-render')
+        
+        # Accessory layers are pre-rendered RGBA sprites keyed by image size,
+        # face box (snapped to a grid) and the accessories drawn
+        self.layer_quantum = max(1, int(os.getenv('AVATAR_LAYER_QUANTUM', 4)))
+        self.accessory_layers = LRUCache(
+            maxsize=int(os.getenv('AVATAR_LAYER_CACHE_SIZE', 256)),
+            max_bytes=int(os.getenv('AVATAR_LAYER_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+            sizeof=_sprite_bytes
+        )
+        
+        # Mood filters are compiled to colour matrices / LUTs once, here
+        self.mood_filters = load_mood_filters()
+        
+        # Only the preview is rendered up front; the other variants are recorded
+        # in the avatar metadata and drawn on first request, into a size-bounded disk cache
+        self.lazy_variants = os.getenv('AVATAR_LAZY_VARIANTS', 'true').lower() == 'true'
+        self.variant_cache = DiskLRU(int(os.getenv('AVATAR_VARIANT_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+                                     on_evict=lambda path: self.file_store.discard(os.path.basename(path)))
+        self.variant_cache.scan(self.file_store.path_for(self.avatar_folder, name, create=False)
+                                for name in self.avatar_store.variant_filenames())
+        self._render_flight = SingleFlight()
+        
+        # The first variant doubles as the preview
+        self.variant_configs = [
+            {"name": "Classic Therapist", "accessories": ["glasses", "notepad"], "mood": "professional_disappointment"},
+            {"name": "Concerned You", "accessories": ["glasses", "tissue_box"], "mood": "fake_empathy"},
+            {"name": "Judgmental You", "accessories": ["reading_glasses", "thick_file"], "mood": "silent_judgment"},
+            {"name": "Overly Cheerful You", "accessories": ["bright_smile", "motivational_poster"], "mood": "toxic_positivity"}
+        ]
         self.therapist_modes = [
             "condescending",
             "overly_supportive", 
@@ -40,13 +111,21 @@ class AvatarGeneratorService:
             "voice_tone": "your_own_voice_but_judgmental"
         }
     
-    def generate_therapist_avatar(self, face_data: Dict, customization: Dict = None) -> Dict[str, Any]:
+    def generate_therapist_avatar(self, face_data: Dict, customization: Dict = None,
+                                  wait_for: str = 'all',
+                                  progress: Callable[[float, str], None] = None,
+                                  user_id: str = None) -> Dict[str, Any]:
         """
         Generate a therapist avatar from processed face data
         
         Args:
             face_data (Dict): Processed face data from FaceProcessorService
             customization (Dict): User customization preferences
+            wait_for (str): 'all' to wait for every variant, 'preview' to return
+                as soon as the preview is written (the rest keep rendering)
+            progress (Callable): Optional progress(fraction, stage) hook, called
+                as each variant finishes rendering
+            user_id (str): Owner of the avatar, if the request was authenticated
             
         Returns:
             Dict with avatar generation results
@@ -61,33 +140,41 @@ class AvatarGeneratorService:
                 return {"error": "Processed image not found"}
             
             # Generate avatar variants
-            avatar_variants = self._create_avatar_variants(processed_path, face_data, customization)
+            avatar_variants, pending_variants = self._create_avatar_variants(
+                processed_path, face_data, customization, wait_for=wait_for, progress=progress
+            )
             
-            # Create therapist persona
-            persona = self._generate_therapist_persona(face_data.get('features', {}))
+            # Create therapist persona (same selfie + settings, same therapist)
+            source_hash = self._source_hash(face_data)
+            rng = self._persona_rng(source_hash, customization)
+            persona = self._generate_therapist_persona(face_data.get('features', {}), rng)
             
             # Prepare avatar metadata
             avatar_metadata = {
                 "avatar_id": avatar_id,
-                "source_image": processed_path,
+                "user_id": user_id,
+                "source_image": os.path.basename(processed_path),
+                "file_id": face_data.get('file_id'),
+                "source_hash": source_hash,
+                "face_position": [int(v) for v in face_data['position']] if face_data.get('position') else None,
+                "customization": customization or {},
                 "variants": avatar_variants,
                 "persona": persona,
-                "therapy_style": random.choice(self.therapist_modes),
-                "specializations": self._generate_fake_specializations(),
+                "therapy_style": rng.choice(self.therapist_modes),
+                "specializations": self._generate_fake_specializations(rng),
                 "generated_at": datetime.now().isoformat(),
                 "status": "ready_for_disappointment"
             }
             
             # Save avatar metadata
-            metadata_path = os.path.join(self.avatar_folder, f"avatar_{avatar_id}.json")
-            with open(metadata_path, 'w') as f:
-                json.dump(avatar_metadata, f, indent=2)
+            self.avatar_store.save(avatar_metadata)
             
             return {
                 "success": True,
                 "avatar_id": avatar_id,
                 "metadata": avatar_metadata,
                 "preview_url": avatar_variants[0]["file_path"],  # Use first variant as preview
+                "pending_variants": pending_variants,
                 "message": "Avatar generated! Your therapist self is ready to disappoint you.",
                 "estimated_roast_quality": "Premium grade disappointment"
             }
@@ -98,33 +185,195 @@ class AvatarGeneratorService:
                 "suggestion": "Try a different photo or pray to the tech gods."
             }
     
-    def _create_avatar_variants(self, image_path: str, face_data: Dict, customization: Dict = None) -> List[Dict]:
-        """Create different avatar variants with therapist accessories"""
+    def _render_variant(self, base_image: Image.Image, config: Dict, face_data: Dict, variant_path: str):
+        """Draw one variant on a private copy of the shared base image and save it"""
+        # The mood filter writes a new image, which is that private copy
+        variant_image = self._apply_mood_filter(base_image, config.get('mood', 'neutral'))
+        variant_image = self._add_therapist_accessories(variant_image, config, face_data)
+        
+        # Write beside the target and rename, so nobody serves a half-written JPEG
+        tmp_path = f"{variant_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            variant_image.save(tmp_path, format='JPEG', quality=95)
+            os.replace(tmp_path, variant_path)
+            self.file_store.register(self.avatar_folder, os.path.basename(variant_path))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def render_on_demand(self, filename: str) -> Optional[str]:
+        """
+        Render a deferred variant on its first request and return its path
         
-        variants = []
-        base_image = cv2.imread(image_path)
+        Concurrent first requests for the same file share one render.
+        Returns None if no avatar has it as an on-demand variant, or its
+        source is gone.
+        """
+        avatar = self.avatar_store.find_by_variant(filename)
+        variant = next((variant for variant in (avatar or {}).get('variants', [])
+                        if os.path.basename(variant['file_path']) == filename), None)
+        if variant is None:
+            return None
+        
+        variant_path = self.file_store.path_for(self.avatar_folder, filename)
+        
+        def render():
+            if os.path.exists(variant_path):
+                return variant_path  # rendered while we were waiting for the lock
+            source_path = self.file_store.locate(avatar.get('source_image'))
+            base_image = self.frame_cache.get_or_load(avatar.get('file_id'), source_path) if source_path else None
+            if base_image is None:
+                return None
+            face_data = {"file_id": avatar.get('file_id')}
+            if avatar.get('face_position'):
+                face_data['position'] = tuple(avatar['face_position'])
+            config = {key: variant[key] for key in ('name', 'accessories', 'mood')}
+            self._render_variant(base_image, config, face_data, variant_path)
+            self.variant_cache.add(variant_path)
+            return variant_path
+        
+        return self._render_flight.do(filename, render)
+    
+    def _render_once(self, base_image: Image.Image, config: Dict, face_data: Dict, variant_path: str) -> str:
+        """Render a variant unless that exact content already exists (or is being rendered)"""
         
-        if base_image is None:
-            return []
+        def render():
+            if not os.path.exists(variant_path):
+                self._render_variant(base_image, config, face_data, variant_path)
+            return variant_path
         
-        # Convert to PIL for easier manipulation
-        pil_image = Image.fromarray(cv2.cvtColor(base_image, cv2.COLOR_BGR2RGB))
+        return self._render_flight.do(os.path.basename(variant_path), render)
+    
+    def _source_hash(self, face_data: Dict) -> str:
+        """SHA-256 of the processed image (stored at upload; hashed from disk for older uploads)"""
+        if face_data.get('source_hash'):
+            return face_data['source_hash']
+        
+        digest = hashlib.sha256()
+        with open(face_data['processed_path'], 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def validate_customization(self, customization: Any):
+        """Raise ValueError unless moods and per-variant overrides are ones we can render"""
+        if customization is None:
+            return
+        if not isinstance(customization, dict):
+            raise ValueError("customization must be an object")
+        known_accessories = set(DRAWN_ACCESSORIES).union(
+            *(config['accessories'] for config in self.variant_configs))
+        
+        def check_mood(mood, where):
+            if mood and mood not in self.mood_filters:
+                raise ValueError(f"unknown mood in {where}: {mood!r}; choose from {sorted(self.mood_filters)}")
+        
+        check_mood(customization.get('mood'), 'customization')
+        overrides = customization.get('variant_overrides')
+        if overrides is None:
+            return
+        if not isinstance(overrides, dict):
+            raise ValueError("variant_overrides must be an object keyed by variant number")
+        for number, override in overrides.items():
+            if not isinstance(override, dict):
+                raise ValueError(f"variant_overrides[{number!r}] must be an object")
+            check_mood(override.get('mood'), f"variant_overrides[{number!r}]")
+            accessories = override.get('accessories', [])
+            if not isinstance(accessories, list) or not all(isinstance(a, str) for a in accessories):
+                raise ValueError(f"variant_overrides[{number!r}].accessories must be a list of names")
+            unknown = sorted(set(accessories) - known_accessories)
+            if unknown:
+                raise ValueError(f"unknown accessories in variant_overrides[{number!r}]: {unknown}")
+    
+    def _variant_configs_for(self, customization: Dict = None) -> List[Dict]:
+        """Variant configs with the customization's mood / per-variant overrides applied"""
+        self.validate_customization(customization)
+        customization = customization or {}
+        overrides = customization.get('variant_overrides') or {}
+        configs = []
+        
+        for i, base_config in enumerate(self.variant_configs):
+            config = dict(base_config)
+            if customization.get('mood'):
+                config['mood'] = customization['mood']
+            override = overrides.get(str(i + 1)) or {}
+            if override.get('mood'):
+                config['mood'] = override['mood']
+            if 'accessories' in override:
+                config['accessories'] = list(override['accessories'])
+            configs.append(config)
+        
+        return configs
+    
+    def _variant_filename(self, source_hash: str, config: Dict, position) -> str:
+        """Content-addressed name: identical inputs always map to the same file"""
+        mood_filter = self.mood_filters.get(config.get('mood'))
+        inputs = {
+            "source": source_hash,
+            "accessories": sorted(a for a in config.get('accessories', []) if a in DRAWN_ACCESSORIES),
+            "mood": mood_filter.spec if mood_filter else None,
+            "position": [int(v) for v in position] if position else None,
+            "layer_quantum": self.layer_quantum,
+            "renderer": RENDERER_VERSION
+        }
+        digest = hashlib.sha256(json.dumps(inputs, sort_keys=True, separators=(',', ':')).encode())
+        return f"avatar_variant_{digest.hexdigest()[:16]}.jpg"
+    
+    def _persona_rng(self, source_hash: str, customization: Dict = None) -> random.Random:
+        """Random source seeded by the selfie and settings, so regenerating is repeatable"""
+        seed = json.dumps({"source": source_hash, "customization": customization or {}},
+                          sort_keys=True, separators=(',', ':'), default=str)
+        return random.Random(hashlib.sha256(seed.encode()).hexdigest())
+    
+    def _create_avatar_variants(self, image_path: str, face_data: Dict, customization: Dict = None,
+                                wait_for: str = 'all',
+                                progress: Callable[[float, str], None] = None) -> Tuple[List[Dict], List[int]]:
+        """
+        Create different avatar variants with therapist accessories
         
-        # Generate different variants
-        variant_configs = [
-            {"name": "Classic Therapist", "accessories": ["glasses", "notepad"], "mood": "professional_disappointment"},
-            {"name": "Concerned You", "accessories": ["glasses", "tissue_box"], "mood": "fake_empathy"},
-            {"name": "Judgmental You", "accessories": ["reading_glasses", "thick_file"], "mood": "silent_judgment"},
-            {"name": "Overly Cheerful You", "accessories": ["bright_smile", "motivational_poster"], "mood": "toxic_positivity"}
-        ]
+        Eager variants (just the preview when lazy_variants is on) render
+        concurrently on the render pool; the rest are marked on_demand, and
+        the saved avatar metadata is their recipe for render_on_demand. Returns the variant list and the ids of eager
+        variants still rendering when we stopped waiting (either because
+        only the preview was requested or the deadline hit).
+        """
         
-        for i, config in enumerate(variant_configs):
-            variant_image = self._add_therapist_accessories(pil_image.copy(), config, face_data)
-            
-            # Save variant
-            variant_filename = f"avatar_variant_{uuid.uuid4().hex[:8]}.jpg"
-            variant_path = os.path.join(self.avatar_folder, variant_filename)
-            variant_image.save(variant_path, quality=95)
+        variants = []
+        source_hash = self._source_hash(face_data)
+        position = face_data.get('position')
+        configs = self._variant_configs_for(customization)
+        eager_count = 1 if self.lazy_variants else len(configs)
+        filenames = [self._variant_filename(source_hash, config, position) for config in configs]
+        resolved = [self.file_store.resolve(name) for name in filenames]
+        paths = [path or self.file_store.path_for(self.avatar_folder, name) for path, name in zip(resolved, filenames)]
+        reused = [path is not None for path in resolved]
+        
+        # Usually still in memory from the upload, already RGB and ready for PIL;
+        # not needed at all when every eager variant was rendered before
+        pil_image = None
+        if not all(reused[:eager_count]):
+            pil_image = self.frame_cache.get_or_load(face_data.get('file_id'), image_path)
+            if pil_image is None:
+                return [], []
+        
+        deadline = time.monotonic() + self.render_deadline
+        futures = []
+        rendered = [0]
+        rendered_lock = threading.Lock()
+        
+        def report_rendered(_future):
+            with rendered_lock:
+                rendered[0] += 1
+                count = rendered[0]
+            progress(count / eager_count, f"rendered {count}/{eager_count} variants")
+        
+        for i, (config, variant_path) in enumerate(zip(configs, paths)):
+            if i < eager_count:
+                future = self.render_pool.submit(self._render_once, pil_image, config, face_data, variant_path)
+                if progress is not None:
+                    future.add_done_callback(report_rendered)
+                futures.append(future)
             
             variants.append({
                 "variant_id": i + 1,
@@ -132,25 +381,69 @@ class AvatarGeneratorService:
                 "file_path": variant_path,
                 "mood": config["mood"],
                 "accessories": config["accessories"],
+                "render": "eager" if i < eager_count else "on_demand",
+                "reused": reused[i],
                 "therapy_effectiveness": "Questionable at best"
             })
         
-        return variants
+        # The preview is mandatory; surface its errors (or the deadline) to the caller
+        try:
+            futures[0].result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            raise TimeoutError(f"preview not rendered within {self.render_deadline:g}s")
+        
+        if wait_for == 'all':
+            done, _ = wait(futures[1:], timeout=max(0.0, deadline - time.monotonic()),
+                           return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()
+        
+        pending = [variant["variant_id"] for variant, future in zip(variants, futures) if not future.done()]
+        return variants, pending
     
     def _add_therapist_accessories(self, image: Image.Image, config: Dict, face_data: Dict) -> Image.Image:
         """Add therapist accessories to the avatar image"""
         
-        # Create a drawing context
-        draw = ImageDraw.Draw(image)
         width, height = image.size
-        
-        # Get face position
-        face_features = face_data.get('features', {})
         face_pos = face_data.get('position', (width//4, height//4, width//2, height//2))
-        x, y, w, h = face_pos
         
-        # Add accessories based on configuration
-        accessories = config.get('accessories', [])
+        # A few blits of cached sprites instead of redrawing every shape
+        for sprite, offset in self._get_accessory_layer(image.size, face_pos, config.get('accessories', [])):
+            image.paste(sprite, offset, sprite)
+        
+        return image
+    
+    def _get_accessory_layer(self, size: Tuple[int, int], face_pos: Tuple[int, int, int, int],
+                             accessories: List[str]) -> List[Tuple[Image.Image, Tuple[int, int]]]:
+        """
+        Cached (sprite, offset) pieces holding every drawn accessory
+        
+        The image size stays exact because the notepad and tissue box anchor
+        to the bottom corners; the face box is snapped to `layer_quantum`
+        pixels so nearby faces share a sprite.
+        """
+        drawn = tuple(a for a in DRAWN_ACCESSORIES if a in accessories)
+        if not drawn:
+            return []
+        
+        q = self.layer_quantum
+        face_box = tuple(int(round(v / q)) * q for v in face_pos)
+        key = (tuple(size), face_box, drawn)
+        
+        layer = self.accessory_layers.get(key)
+        if layer is None:
+            layer = self._render_accessory_layer(size, face_box, drawn)
+            self.accessory_layers.set(key, layer)
+        return layer
+    
+    def _render_accessory_layer(self, size: Tuple[int, int], face_box: Tuple[int, int, int, int],
+                                accessories: Tuple[str, ...]) -> List[Tuple[Image.Image, Tuple[int, int]]]:
+        """Draw accessories on a transparent layer and cut it into tight sprites"""
+        
+        layer = Image.new('RGBA', size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        width, height = size
+        x, y, w, h = face_box
         
         if 'glasses' in accessories:
             self._add_glasses(draw, x, y, w, h)
@@ -161,11 +454,27 @@ class AvatarGeneratorService:
         if 'tissue_box' in accessories:
             self._add_tissue_box(draw, width, height)
         
-        # Add mood-based modifications
-        mood = config.get('mood', 'neutral')
-        self._apply_mood_filter(image, mood)
-        
-        return image
+        # Masked pastes cost their area, so rather than one sprite spanning the
+        # face and the bottom corners (mostly transparent, e.g. the inside of
+        # the glasses) keep tight crops of the drawn runs in each tile row
+        alpha = np.asarray(layer.getchannel('A'))
+        tile = SPRITE_TILE
+        sprites = []
+        for top in range(0, height, tile):
+            band = alpha[top:top + tile]
+            drawn_columns = band.any(axis=0)
+            if not drawn_columns.any():
+                continue
+            padded = np.pad(drawn_columns, (0, -width % tile))
+            occupied = np.r_[False, padded.reshape(-1, tile).any(axis=1), False].astype(np.int8)
+            edges = np.flatnonzero(np.diff(occupied))
+            for start, stop in zip(edges[::2] * tile, np.minimum(edges[1::2] * tile, width)):
+                piece = band[:, start:stop]
+                rows = np.flatnonzero(piece.any(axis=1))
+                cols = np.flatnonzero(piece.any(axis=0))
+                box = (int(start + cols[0]), int(top + rows[0]), int(start + cols[-1] + 1), int(top + rows[-1] + 1))
+                sprites.append((layer.crop(box), box[:2]))
+        return sprites
     
     def _add_glasses(self, draw: ImageDraw.Draw, face_x: int, face_y: int, face_w: int, face_h: int):
         """Add therapist glasses to the face"""
@@ -230,29 +539,19 @@ class AvatarGeneratorService:
         except:
             pass
     
-    def _apply_mood_filter(self, image: Image.Image, mood: str):
-        """Apply mood-based visual filters"""
-        
-        # This is a placeholder for mood-based image processing
-        # In a real implementation, you might adjust colors, add overlays, etc.
-        
-        if mood == "professional_disappointment":
-            # Slightly desaturate for that clinical feel
-            enhancer = Image.ImageEnhance.Color(image)
-            image = enhancer.enhance(0.8)
-        
-        elif mood == "fake_empathy":
-            # Slightly warmer tones
-            enhancer = Image.ImageEnhance.Color(image)
-            image = enhancer.enhance(1.1)
-        
-        # Add more mood filters as needed
+    def _apply_mood_filter(self, image: Image.Image, mood: str) -> Image.Image:
+        """Filtered copy of the image for the mood (a plain copy if the mood is unknown)"""
         
-        return image
+        mood_filter = self.mood_filters.get(mood)
+        if mood_filter is None:
+            return image.copy()
+        return mood_filter.apply(image)
     
-    def _generate_therapist_persona(self, face_features: Dict) -> Dict[str, Any]:
+    def _generate_therapist_persona(self, face_features: Dict, rng: random.Random = None) -> Dict[str, Any]:
         """Generate a therapist persona based on face features"""
         
+        rng = rng or random
+        
         # Randomize persona traits based on "analysis"
         face_size = face_features.get('size_category', 'medium')
         aspect_ratio = face_features.get('aspect_ratio', 1.0)
@@ -271,14 +570,14 @@ class AvatarGeneratorService:
         persona = {
             "confidence_level": confidence,
             "primary_specialty": specialty,
-            "therapy_approach": random.choice([
+            "therapy_approach": rng.choice([
                 "Aggressive mindfulness",
                 "Passive-aggressive cognitive behavioral therapy",
                 "Interpretive dance therapy (without the dancing)",
                 "Solution-focused problem creation",
                 "Mindfulness-based stress addition"
             ]),
-            "catchphrase": random.choice([
+            "catchphrase": rng.choice([
                 "How does that make you feel? Don't answer that.",
                 "Let's unpack that... actually, let's not.",
                 "I'm sensing some resistance... good instincts.",
@@ -291,14 +590,16 @@ class AvatarGeneratorService:
                 "Certificate in Professional Disappointment",
                 "Licensed to Judge (self-issued)"
             ],
-            "therapy_success_rate": f"{random.randint(5, 15)}% (margin of error: ±100%)"
+            "therapy_success_rate": f"{rng.randint(5, 15)}% (margin of error: ±100%)"
         }
         
         return persona
     
-    def _generate_fake_specializations(self) -> List[str]:
+    def _generate_fake_specializations(self, rng: random.Random = None) -> List[str]:
         """Generate hilariously fake therapy specializations"""
         
+        rng = rng or random
+        
         specializations = [
             "Imposter Syndrome (Certified Expert)",
             "Decision Paralysis (Still deciding if I'm qualified)",
@@ -310,19 +611,16 @@ class AvatarGeneratorService:
             "Self-Care (Do as I say, not as I do)"
         ]
         
-        return random.sample(specializations, random.randint(2, 4))
+        return rng.sample(specializations, rng.randint(2, 4))
     
     def get_avatar_info(self, avatar_id: str) -> Dict[str, Any]:
         """Retrieve avatar information by ID"""
         
-        metadata_path = os.path.join(self.avatar_folder, f"avatar_{avatar_id}.json")
-        
-        if not os.path.exists(metadata_path):
-            return {"error": "Avatar not found. Did it get therapy and leave?"}
-        
         try:
-            with open(metadata_path, 'r') as f:
-                metadata = json.load(f)
+            metadata = self.avatar_store.get(avatar_id) or self._adopt_legacy_avatar(avatar_id)
+            
+            if metadata is None:
+                return {"error": "Avatar not found. Did it get therapy and leave?"}
             
             return {
                 "success": True,
@@ -333,6 +631,30 @@ class AvatarGeneratorService:
         except Exception as e:
             return {"error": f"Could not load avatar data: {str(e)}"}
     
+    @staticmethod
+    def public_view(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Avatar metadata without the owner and upload identifiers"""
+        return {key: value for key, value in metadata.items() if key not in PRIVATE_AVATAR_FIELDS}
+    
+    def _adopt_legacy_avatar(self, avatar_id: str) -> Optional[Dict[str, Any]]:
+        """Move a not-yet-imported avatar_<id>.json into the store on first read"""
+        if not avatar_id or os.path.basename(avatar_id) != avatar_id:
+            return None
+        
+        metadata_path = os.path.join(self.avatar_folder, f"avatar_{avatar_id}.json")
+        try:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            return None
+        
+        self.avatar_store.save(metadata)
+        return metadata
+    
+    def list_avatars(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """A user's avatars, newest first"""
+        return self.avatar_store.find_by_user(user_id, limit)
+    
     def customize_avatar(self, avatar_id: str, customizations: Dict) -> Dict[str, Any]:
         """Apply customizations to existing avatar"""
         
@@ -342,8 +664,9 @@ class AvatarGeneratorService:
         if not avatar_info.get('success'):
             return avatar_info
         
-        # Apply customizations (placeholder implementation)
-        avatar_data = avatar_info['avatar_data']
+        # Apply customizations (placeholder implementation); the stored copy is
+        # shared with the read cache, so edit a private one
+        avatar_data = copy.deepcopy(avatar_info['avatar_data'])
         
         # Update persona based on customizations
         if 'therapy_style' in customizations:
@@ -352,14 +675,43 @@ class AvatarGeneratorService:
         if 'sarcasm_level' in customizations:
             avatar_data['persona']['sarcasm_level'] = customizations['sarcasm_level']
         
+        # Re-render only the variants whose inputs changed; the rest keep their files
+        rerendered = []
+        if any(key in customizations for key in RENDER_CUSTOMIZATIONS):
+            customization = dict(avatar_data.get('customization') or {})
+            customization.update({key: customizations[key] for key in RENDER_CUSTOMIZATIONS if key in customizations})
+            
+            # Older records hold a full flat path; look the file up by name
+            source_path = self.file_store.locate(avatar_data['source_image'])
+            if source_path is None:
+                return {"error": "Source image for this avatar is gone. Please upload a new selfie."}
+            avatar_data['source_image'] = os.path.basename(source_path)
+            
+            face_data = {
+                "file_id": avatar_data.get('file_id'),
+                "processed_path": source_path,
+                "source_hash": avatar_data.get('source_hash')
+            }
+            if avatar_data.get('face_position'):
+                face_data['position'] = tuple(avatar_data['face_position'])
+            
+            previous = {variant['variant_id']: variant['file_path'] for variant in avatar_data['variants']}
+            variants, _ = self._create_avatar_variants(source_path, face_data, customization)
+            if not variants:
+                return {"error": "Source image for this avatar is gone. Please upload a new selfie."}
+            
+            rerendered = [variant['variant_id'] for variant in variants
+                          if variant['file_path'] != previous.get(variant['variant_id'])]
+            avatar_data['variants'] = variants
+            avatar_data['customization'] = customization
+        
         # Save updated metadata
-        metadata_path = os.path.join(self.avatar_folder, f"avatar_{avatar_id}.json")
-        with open(metadata_path, 'w') as f:
-            json.dump(avatar_data, f, indent=2)
+        self.avatar_store.save(avatar_data)
         
         return {
             "success": True,
             "message": "Avatar customized! Now even more disappointing than before.",
+            "rerendered_variants": rerendered,
             "updated_avatar": avatar_data
         }
     
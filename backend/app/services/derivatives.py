@@ -0,0 +1,185 @@
+"""
+🖼️ Image Derivatives
+Your disappointment, now available in thumbnail size.
+
+"We shrank your therapist. Their ego stayed the same size."
+"""
+
+import os
+import tempfile
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from app.caching import DiskLRU, SingleFlight
+from app.services.file_store import shard_for
+
+
+class Preset(NamedTuple):
+    name: str
+    width: Optional[int]
+    height: Optional[int]
+    fit: str
+
+
+# The only sizes we render; anything else would let clients fill the cache with junk
+PRESETS = {
+    'thumb': Preset('thumb', 128, 128, 'cover'),
+    'small': Preset('small', 256, 256, 'contain'),
+    'medium': Preset('medium', 512, 512, 'contain'),
+    'large': Preset('large', 1024, 1024, 'contain'),
+    'full': Preset('full', None, None, 'contain')  # format conversion only
+}
+
+# format -> (PIL format, extension, save options, Accept media type)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'progressive': True}, 'image/jpeg'),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}, 'image/webp'),
+    'avif': ('AVIF', 'avif', {'quality': 60, 'speed': 8}, 'image/avif')
+}
+AUTO_PREFERENCE = ('avif', 'webp', 'jpeg')
+
+
+def _available_formats() -> Tuple[str, ...]:
+    available = []
+    for name in FORMATS:
+        try:
+            if name == 'jpeg' or features.check(name):
+                available.append(name)
+        except ValueError:  # this Pillow doesn't know the feature at all
+            continue
+    return tuple(available)
+
+
+class DerivativeService:
+    """
+    Resized / re-encoded copies of stored images, rendered on first request.
+
+    Requests pick a preset (by name, or by matching width/height/fit) and a
+    format; 'auto' negotiates from the Accept header. Derivatives live under
+    DERIVATIVE_FOLDER keyed by (source hash, preset, format) behind a
+    byte-bounded DiskLRU, and concurrent requests for the same one share a
+    single render.
+    """
+
+    def __init__(self):
+        self.folder = os.getenv('DERIVATIVE_FOLDER',
+                                os.path.join(os.getenv('DATA_FOLDER', './data'), 'derivatives'))
+        self.formats = _available_formats()
+        self.default_format = os.getenv('DERIVATIVE_DEFAULT_FORMAT', 'jpeg')
+        if self.default_format not in self.formats:
+            print(f"Warning: DERIVATIVE_DEFAULT_FORMAT '{self.default_format}' not available, using jpeg")
+            self.default_format = 'jpeg'
+        self.cache = DiskLRU(int(os.getenv('DERIVATIVE_CACHE_MAX_BYTES', 256 * 1024 * 1024)))
+        self._flight = SingleFlight()
+        os.makedirs(self.folder, exist_ok=True)
+        self.cache.scan(self._existing_files())
+
+    def _existing_files(self):
+        for top, _, files in os.walk(self.folder):
+            for name in files:
+                if name.startswith('derivative_'):
+                    yield os.path.join(top, name)
+
+    def parse(self, args: Mapping[str, str], accept=None) -> Optional[Tuple[Preset, str]]:
+        """(preset, format) for the query string, None for the original; ValueError if not allowed"""
+        if not any(key in args for key in ('preset', 'w', 'h', 'fit', 'format')):
+            return None
+
+        if 'preset' in args:
+            preset = PRESETS.get(args['preset'])
+            if preset is None:
+                raise ValueError(f"Unknown preset '{args['preset']}'")
+        elif any(key in args for key in ('w', 'h', 'fit')):
+            try:
+                size = (int(args['w']) if 'w' in args else None, int(args['h']) if 'h' in args else None)
+            except ValueError:
+                raise ValueError("w and h must be integers")
+            fit = args.get('fit', 'contain')
+            preset = next((p for p in PRESETS.values() if (p.width, p.height, p.fit) == (*size, fit)), None)
+            if preset is None:
+                raise ValueError(f"{size[0]}x{size[1]} ({fit}) is not one of the allowed sizes")
+        else:
+            preset = PRESETS['full']
+
+        image_format = args.get('format', self.default_format).lower()
+        if image_format == 'auto':
+            image_format = next((name for name in AUTO_PREFERENCE if name in self.formats
+                                 and accept is not None and FORMATS[name][3] in accept), 'jpeg')
+        if image_format not in self.formats:
+            raise ValueError(f"Format '{image_format}' is not available")
+        return preset, image_format
+
+    def describe(self) -> Dict[str, Any]:
+        """Allowed presets and formats, for error messages"""
+        return {
+            "presets": {p.name: {"w": p.width, "h": p.height, "fit": p.fit} for p in PRESETS.values()},
+            "formats": list(self.formats) + ['auto']
+        }
+
+    @staticmethod
+    def etag_suffix(derivative: Optional[Tuple[Preset, str]]) -> str:
+        return f"-{derivative[0].name}.{derivative[1]}" if derivative else ''
+
+    def _path(self, source_hash: str, preset: Preset, image_format: str) -> str:
+        filename = f"derivative_{source_hash}_{preset.name}.{FORMATS[image_format][1]}"
+        return os.path.join(self.folder, *shard_for(filename), filename)
+
+    def get(self, source_path: str, source_hash: str, preset: Preset, image_format: str) -> str:
+        """Path of the derivative, rendering it first if it isn't cached"""
+        path = self._path(source_hash, preset, image_format)
+        if self.cache.touch(path) and os.path.exists(path):
+            return path
+        return self._flight.do(path, self._render, source_path, preset, image_format, path)
+
+    def _render(self, source_path: str, preset: Preset, image_format: str, path: str) -> str:
+        if os.path.exists(path):  # finished by another worker, or by a flight we just missed
+            self.cache.add(path)
+            return path
+
+        with Image.open(source_path) as image:
+            if preset.width or preset.height:
+                target = (preset.width or image.width, preset.height or image.height)
+                # JPEG sources decode straight at 1/2, 1/4 or 1/8 scale
+                image.draft('RGB', target if preset.fit == 'contain' else self._cover_draft(image.size, target))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+        if preset.fit == 'cover' and preset.width and preset.height:
+            image = image.resize((preset.width, preset.height), Image.Resampling.BICUBIC,
+                                 box=self._cover_box(image.size, (preset.width, preset.height)), reducing_gap=2.0)
+        elif preset.width or preset.height:
+            image.thumbnail((preset.width or image.width, preset.height or image.height),
+                            Image.Resampling.BICUBIC, reducing_gap=2.0)
+
+        pil_format, _, options, _ = FORMATS[image_format]
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.derivative-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, pil_format, **options)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.cache.add(path)
+        return path
+
+    @staticmethod
+    def _cover_draft(size: Tuple[int, int], target: Tuple[int, int]) -> Tuple[int, int]:
+        # The short side must still cover the box after cropping
+        scale = max(target[0] / size[0], target[1] / size[1])
+        return int(size[0] * scale) + 1, int(size[1] * scale) + 1
+
+    @staticmethod
+    def _cover_box(size: Tuple[int, int], target: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        # Centred crop with the target's aspect ratio
+        scale = max(target[0] / size[0], target[1] / size[1])
+        width, height = target[0] / scale, target[1] / scale
+        left, top = (size[0] - width) / 2, (size[1] - height) / 2
+        return int(left), int(top), int(left + width), int(top + height)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.cache.stats(), renders=self._flight.stats(), formats=list(self.formats))
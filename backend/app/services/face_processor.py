@@ -7,13 +7,92 @@ Handles face detection, processing, and preparation for avatar generation.
 
 import cv2
 import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
+import hashlib
+import io
+import math
 import os
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
 from typing import Dict, List, Tuple, Optional, Any
-import json
 from datetime import datetime
 
+from app.models.face_metadata import FaceMetadataStore
+from app.services.file_store import ShardedFileStore, get_file_store
+from app.services.frame_cache import DecodedFrameCache, get_frame_cache
+
+
+# cv2 decode flags that let libjpeg do the downscaling during DCT decoding
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class FaceAnalysis:
+    """
+    Per-upload analysis context.
+    
+    Every derived view (grayscale frame, face ROI, statistics, eyes) is
+    computed on first access and memoized, so detection, feature extraction
+    and quality assessment share one colour conversion instead of three.
+    The face ROI is a view into the frame, not a copy.
+    """
+    
+    def __init__(self, image: np.ndarray, face_coords: Tuple[int, int, int, int] = None,
+                 eye_cascade=None):
+        self.image = image
+        self.face = face_coords
+        self.eye_cascade = eye_cascade
+    
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+    
+    @cached_property
+    def face_roi(self) -> np.ndarray:
+        x, y, w, h = self.face
+        return self.image[y:y+h, x:x+w]
+    
+    @cached_property
+    def gray_roi(self) -> np.ndarray:
+        # Reuse the full grayscale frame if detection already paid for it
+        if 'gray' in self.__dict__:
+            x, y, w, h = self.face
+            return self.gray[y:y+h, x:x+w]
+        return cv2.cvtColor(self.face_roi, cv2.COLOR_BGR2GRAY)
+    
+    @cached_property
+    def laplacian_variance(self) -> float:
+        return float(cv2.Laplacian(self.gray_roi, cv2.CV_64F).var())
+    
+    @cached_property
+    def _gray_roi_stats(self) -> Tuple[float, float]:
+        mean, std = cv2.meanStdDev(self.gray_roi)
+        return float(mean[0][0]), float(std[0][0])
+    
+    @property
+    def gray_mean(self) -> float:
+        return self._gray_roi_stats[0]
+    
+    @property
+    def gray_std(self) -> float:
+        return self._gray_roi_stats[1]
+    
+    @cached_property
+    def eyes(self) -> Optional[List[Tuple[int, int, int, int]]]:
+        """Eye boxes within the face ROI (None when no eye model is loaded)"""
+        if self.eye_cascade is None:
+            return None
+        return [tuple(int(v) for v in eye) for eye in self.eye_cascade.detectMultiScale(self.gray_roi)]
+
 
 class FaceProcessorService:
     """
@@ -21,9 +100,18 @@ class FaceProcessorService:
     Adds therapist accessories because why not make it worse?
     """
     
-    def __init__(self):
+    def __init__(self, metadata_store: FaceMetadataStore = None, frame_cache: DecodedFrameCache = None,
+                 file_store: ShardedFileStore = None):
         """Initialize face processing with OpenCV"""
+        self.metadata_store = metadata_store or FaceMetadataStore()
+        self.frame_cache = frame_cache or get_frame_cache()
+        self.file_store = file_store or get_file_store()
         self.confidence_threshold = float(os.getenv('FACE_DETECTION_CONFIDENCE', 0.7))
+        # Largest frame we ever hold in memory, and the size face detection runs at
+        self.max_working_pixels = int(os.getenv('FACE_MAX_WORKING_PIXELS', 4_000_000))
+        self.detection_max_pixels = int(os.getenv('FACE_DETECTION_MAX_PIXELS', 480_000))
+        # Eye detection is the most expensive feature and nothing downstream needs it
+        self.detect_eyes = os.getenv('FACE_DETECT_EYES', 'false').lower() in ('1', 'true', 'yes')
         
         # Load OpenCV's pre-trained face detection model
         try:
@@ -33,11 +121,89 @@ class FaceProcessorService:
             print(f"Warning: Could not load face detection models: {e}")
             self.face_cascade = None
             self.eye_cascade = None
+        
+        # Originals are only kept for the record, so they are written off the request path
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+    
+    def _persist_original(self, data: bytes, upload_folder: str, original_path: str):
+        """Write the untouched upload bytes to disk (runs on the I/O pool)"""
+        try:
+            with open(original_path, 'wb') as f:
+                f.write(data)
+            self.file_store.register(upload_folder, os.path.basename(original_path))
+        except Exception as e:
+            print(f"Warning: Could not save original upload {original_path}: {e}")
+    
+    def _peek_image_size(self, data: bytes) -> Optional[Tuple[int, int]]:
+        """Read (width, height) from the image header without decoding pixels"""
+        try:
+            with Image.open(io.BytesIO(data)) as header:
+                width, height = header.size
+                if header.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+                    width, height = height, width
+                return width, height
+        except Exception:
+            return None
+    
+    def decode_image(self, data: bytes) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+        """
+        Decode image bytes at (roughly) the configured working resolution.
+        
+        JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 DCT scale that fits
+        under FACE_MAX_WORKING_PIXELS, so a 12MP phone photo never exists
+        in memory at full size; anything still too large is area-resized.
+        """
+        original_size = self._peek_image_size(data)
+        reduction = 1
+        if original_size and self.max_working_pixels:
+            original_pixels = original_size[0] * original_size[1]
+            for factor in (1, 2, 4, 8):
+                reduction = factor
+                if original_pixels / (factor * factor) <= self.max_working_pixels:
+                    break
+        
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        image = cv2.imdecode(buffer, REDUCED_DECODE_FLAGS[reduction])
+        if image is None and reduction > 1:
+            image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+            reduction = 1
+        if image is None:
+            return None, {}
+        
+        h, w = image.shape[:2]
+        if self.max_working_pixels and w * h > self.max_working_pixels:
+            shrink = math.sqrt(self.max_working_pixels / (w * h))
+            image = cv2.resize(image, (max(1, int(w * shrink)), max(1, int(h * shrink))),
+                               interpolation=cv2.INTER_AREA)
+            h, w = image.shape[:2]
+        
+        if original_size is None:
+            original_size = (w, h)
+        original_pixels = original_size[0] * original_size[1]
+        full_decode_bytes = original_pixels * 3
+        
+        return image, {
+            "original_size": original_size,
+            "working_size": (w, h),
+            "dct_reduction": reduction,
+            "scale": math.sqrt(original_pixels / (w * h)),
+            "working_bytes": image.nbytes,
+            "full_decode_bytes": full_decode_bytes,
+            "memory_saved_bytes": max(0, full_decode_bytes - image.nbytes)
+        }
+    
+    def analyze(self, image: np.ndarray, face_coords: Tuple[int, int, int, int] = None) -> FaceAnalysis:
+        """Start a lazily evaluated analysis of one frame"""
+        return FaceAnalysis(image, face_coords, self.eye_cascade)
     
     def process_uploaded_image(self, image_file, upload_folder: str) -> Dict[str, Any]:
         """
         Process uploaded selfie and prepare it for avatar generation
         
+        The processed image is the decoded working frame, so its resolution
+        (and every avatar rendered from it) is capped at FACE_MAX_WORKING_PIXELS;
+        the untouched original is kept alongside it.
+        
         Args:
             image_file: Uploaded image file
             upload_folder (str): Directory to save processed images
@@ -47,24 +213,40 @@ class FaceProcessorService:
         """
         
         try:
+            timings = {}
+            started = time.perf_counter()
+            stage_started = started
+            
+            def mark(stage: str):
+                nonlocal stage_started
+                now = time.perf_counter()
+                timings[f"{stage}_ms"] = round((now - stage_started) * 1000, 2)
+                stage_started = now
+            
             # Generate unique filename
             file_id = str(uuid.uuid4())
             original_filename = f"original_{file_id}.jpg"
             processed_filename = f"processed_{file_id}.jpg"
             
-            original_path = os.path.join(upload_folder, original_filename)
-            processed_path = os.path.join(upload_folder, processed_filename)
+            original_path = self.file_store.path_for(upload_folder, original_filename)
+            processed_path = self.file_store.path_for(upload_folder, processed_filename)
             
-            # Save original image
-            image_file.save(original_path)
+            # Decode straight from the request bytes instead of a save-then-imread round trip
+            data = image_file.read()
+            mark("read")
             
-            # Load and process image
-            image = cv2.imread(original_path)
+            image, decode_info = self.decode_image(data)
             if image is None:
                 return {"error": "Could not read image file"}
+            mark("decode")
+            
+            # Keep the original, but don't make the request wait for the disk
+            self._io_pool.submit(self._persist_original, data, upload_folder, original_path)
             
             # Detect faces
-            faces = self.detect_faces(image)
+            analysis = self.analyze(image)
+            faces = self.detect_faces(image, analysis)
+            mark("detect")
             
             if not faces:
                 return {
@@ -72,27 +254,58 @@ class FaceProcessorService:
                     "suggestion": "Try uploading a clearer photo with your face visible. We need something to work with here."
                 }
             
-            # Process the best face
+            # Process the best face (coordinates are in the working frame,
+            # which is also the processed image)
             best_face = self.select_best_face(faces, image)
-            processed_image = self.enhance_face_for_avatar(image, best_face)
+            analysis.face = best_face
+            
+            # Extract face features for avatar customization (before the
+            # in-place enhancement below touches the face region)
+            face_features = self.extract_face_features(image, best_face, analysis,
+                                                       include_eyes=self.detect_eyes)
+            quality_score = self.assess_image_quality(image, best_face, analysis)
+            mark("analyze")
+            
+            # The decoded frame is ours alone, so enhance it without a full-frame copy
+            processed_image = self.enhance_face_for_avatar(image, best_face, in_place=True)
+            mark("enhance")
             
-            # Save processed image
-            cv2.imwrite(processed_path, processed_image)
+            # Save processed image (the only synchronous disk write); the hash of
+            # its bytes content-addresses every avatar rendered from it
+            encoded_ok, encoded = cv2.imencode(os.path.splitext(processed_path)[1] or '.jpg', processed_image)
+            if not encoded_ok:
+                raise ValueError("Could not encode the processed image")
+            with open(processed_path, 'wb') as f:
+                f.write(encoded)
+            self.file_store.register(upload_folder, processed_filename)
+            source_hash = hashlib.sha256(encoded).hexdigest()
+            mark("write_processed")
             
-            # Extract face features for avatar customization
-            face_features = self.extract_face_features(image, best_face)
+            # Hand the frame to avatar generation already in the renderer's RGB layout
+            cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB, dst=processed_image)
+            self.frame_cache.put(file_id, Image.fromarray(processed_image))
+            mark("cache_frame")
+            
+            # Remember the real detection so avatar generation never redoes it
+            face_data = {
+                "position": best_face,
+                "features": face_features,
+                "quality_score": quality_score,
+                "source_hash": source_hash
+            }
+            self.metadata_store.save(file_id, processed_filename, face_data)
+            mark("store_metadata")
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
             
             return {
                 "success": True,
                 "file_id": file_id,
                 "original_path": original_path,
                 "processed_path": processed_path,
-                "face_data": {
-                    "position": best_face,
-                    "features": face_features,
-                    "quality_score": self.assess_image_quality(image, best_face)
-                },
+                "face_data": face_data,
                 "avatar_ready": True,
+                "decode": decode_info,
+                "timings": timings,
                 "message": "Face detected! Preparing for therapeutic roasting...",
                 "timestamp": datetime.now().isoformat()
             }
@@ -103,7 +316,15 @@ class FaceProcessorService:
                 "suggestion": "Try a different image or check if the file is corrupted."
             }
     
-    def detect_faces(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    def get_face_data(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Face data stored for an upload (position, features, processed path)"""
+        face_data = self.metadata_store.get(file_id)
+        if face_data is not None:
+            # None if the processed image is gone
+            face_data['processed_path'] = self.file_store.locate(face_data['processed_file'])
+        return face_data
+    
+    def detect_faces(self, image: np.ndarray, analysis: FaceAnalysis = None) -> List[Tuple[int, int, int, int]]:
         """Detect faces in the image using OpenCV"""
         
         if self.face_cascade is None:
@@ -112,7 +333,16 @@ class FaceProcessorService:
             return [(int(w*0.2), int(h*0.2), int(w*0.6), int(h*0.6))]
         
         # Convert to grayscale for face detection
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = (analysis or self.analyze(image)).gray
+        
+        # Run the cascade on a capped-resolution copy; selfie faces are big
+        # enough that detection at ~0.5MP finds the same box much faster
+        h, w = gray.shape[:2]
+        scale = 1.0
+        if self.detection_max_pixels and w * h > self.detection_max_pixels:
+            scale = math.sqrt((w * h) / self.detection_max_pixels)
+            gray = cv2.resize(gray, (max(1, int(w / scale)), max(1, int(h / scale))),
+                              interpolation=cv2.INTER_AREA)
         
         # Detect faces
         faces = self.face_cascade.detectMultiScale(
@@ -123,7 +353,8 @@ class FaceProcessorService:
             flags=cv2.CASCADE_SCALE_IMAGE
         )
         
-        return [(x, y, w, h) for x, y, w, h in faces]
+        # Map back to the caller's coordinates (and plain ints, so they serialize)
+        return [tuple(int(round(v * scale)) for v in (x, y, fw, fh)) for x, y, fw, fh in faces]
     
     def select_best_face(self, faces: List[Tuple[int, int, int, int]], image: np.ndarray) -> Tuple[int, int, int, int]:
         """Select the best face from detected faces (largest, most centered)"""
@@ -160,11 +391,12 @@ class FaceProcessorService:
         
         return best_face
     
-    def enhance_face_for_avatar(self, image: np.ndarray, face_coords: Tuple[int, int, int, int]) -> np.ndarray:
+    def enhance_face_for_avatar(self, image: np.ndarray, face_coords: Tuple[int, int, int, int],
+                                in_place: bool = False) -> np.ndarray:
         """Enhance the face region for better avatar generation"""
         
-        # Create a copy to work with
-        enhanced = image.copy()
+        # Create a copy to work with, unless the caller owns the frame
+        enhanced = image if in_place else image.copy()
         
         x, y, w, h = face_coords
         
@@ -186,11 +418,12 @@ class FaceProcessorService:
         
         return enhanced
     
-    def extract_face_features(self, image: np.ndarray, face_coords: Tuple[int, int, int, int]) -> Dict[str, Any]:
+    def extract_face_features(self, image: np.ndarray, face_coords: Tuple[int, int, int, int],
+                              analysis: FaceAnalysis = None, include_eyes: bool = True) -> Dict[str, Any]:
         """Extract facial features for avatar customization"""
         
         x, y, w, h = face_coords
-        face_region = image[y:y+h, x:x+w]
+        analysis = analysis or self.analyze(image, face_coords)
         
         # Basic feature extraction
         features = {
@@ -201,12 +434,14 @@ class FaceProcessorService:
             "suggested_accessories": self._suggest_therapist_accessories(w, h)
         }
         
-        # Detect eyes within face region
-        if self.eye_cascade is not None:
-            gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
-            eyes = self.eye_cascade.detectMultiScale(gray_face)
+        # Detect eyes within face region (only when asked; it's the slowest feature)
+        if not include_eyes:
+            return features
+        
+        eyes = analysis.eyes
+        if eyes is not None:
             features["eyes_detected"] = len(eyes)
-            features["eye_positions"] = [(ex, ey, ew, eh) for ex, ey, ew, eh in eyes]
+            features["eye_positions"] = eyes
         else:
             features["eyes_detected"] = 2  # Assume 2 eyes
             features["eye_positions"] = []
@@ -248,23 +483,23 @@ class FaceProcessorService:
         
         return accessories
     
-    def assess_image_quality(self, image: np.ndarray, face_coords: Tuple[int, int, int, int]) -> Dict[str, Any]:
+    def assess_image_quality(self, image: np.ndarray, face_coords: Tuple[int, int, int, int],
+                             analysis: FaceAnalysis = None) -> Dict[str, Any]:
         """Assess the quality of the uploaded image for avatar generation"""
         
         x, y, w, h = face_coords
-        face_region = image[y:y+h, x:x+w]
+        analysis = analysis or self.analyze(image, face_coords)
         
         # Calculate various quality metrics
         
         # 1. Sharpness (using Laplacian variance)
-        gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
-        sharpness = cv2.Laplacian(gray_face, cv2.CV_64F).var()
+        sharpness = analysis.laplacian_variance
         
         # 2. Brightness
-        brightness = np.mean(gray_face)
+        brightness = analysis.gray_mean
         
         # 3. Contrast
-        contrast = gray_face.std()
+        contrast = analysis.gray_std
         
         # 4. Size adequacy
         size_score = min(1.0, (w * h) / (200 * 200))  # 200x200 is our minimum preferred size
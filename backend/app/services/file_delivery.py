@@ -0,0 +1,144 @@
+"""
+📦 File Delivery
+Handing you the same disappointing avatar again, but only if you don't already have it.
+
+"Your browser remembers your therapist. That's more than your therapist does for you."
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from flask import current_app, request, send_file
+
+from app.caching import LRUCache
+
+# Variant names embed a hash of everything that went into rendering them
+CONTENT_ADDRESSED = re.compile(r'^avatar_variant_([0-9a-f]{16})\.[a-z]+$')
+# Uploads are written once under a fresh file_id and never modified
+WRITE_ONCE_PREFIXES = ('original_', 'processed_')
+
+DELIVERY_MODES = ('python', 'x-accel-redirect', 'x-sendfile')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class FileDelivery:
+    """
+    Cache-aware responses for /api/files.
+
+    Strong ETags come from the hash in content-addressed names, or from a
+    sha256 of the file cached by (size, mtime). Last-Modified, 304s and
+    byte ranges are handled by Werkzeug's conditional send_file.
+    Content-addressed and write-once files get a year-long immutable
+    Cache-Control; anything else must revalidate. Every file under these
+    roots is a user's selfie or rendered from one, so all of them are
+    private: browsers may keep them, shared proxies and CDNs may not. With FILE_DELIVERY set to
+    x-accel-redirect or x-sendfile, validators are still checked here but
+    the body (and any Range) is left to the front proxy.
+    """
+
+    def __init__(self, roots: List[str]):
+        self.roots = roots
+        self.mode = os.getenv('FILE_DELIVERY', 'python').lower()
+        if self.mode not in DELIVERY_MODES:
+            print(f"Warning: unknown FILE_DELIVERY '{self.mode}', serving files from Python")
+            self.mode = 'python'
+        self.accel_prefix = os.getenv('FILE_ACCEL_PREFIX', '/_protected').rstrip('/')
+        self.max_age = int(os.getenv('FILE_IMMUTABLE_MAX_AGE', IMMUTABLE_MAX_AGE))
+        self._digests = LRUCache(maxsize=int(os.getenv('FILE_ETAG_CACHE_SIZE', 4096)))
+        self._lock = threading.Lock()
+        self.counts = {"200": 0, "206": 0, "304": 0, "delegated": 0}
+
+    @staticmethod
+    def etag_from_name(filename: str) -> Optional[str]:
+        """ETag known without touching the disk, for content-addressed names"""
+        match = CONTENT_ADDRESSED.match(filename)
+        return match.group(1) if match else None
+
+    def etag_for(self, path: str, filename: str, stat: os.stat_result = None) -> str:
+        """Strong ETag (and content hash) for a stored file"""
+        etag = self.etag_from_name(filename)
+        if etag:
+            return etag
+
+        stat = stat or os.stat(path)
+        cached = self._digests.get(path)
+        if cached and cached[0] == (stat.st_size, stat.st_mtime_ns):
+            return cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()[:32]
+        self._digests.set(path, ((stat.st_size, stat.st_mtime_ns), etag))
+        return etag
+
+    def _apply_cache_policy(self, response, filename: str):
+        response.cache_control.private = True  # faces stay out of shared caches
+        if not (self.etag_from_name(filename) or filename.startswith(WRITE_ONCE_PREFIXES)):
+            response.cache_control.no_cache = True
+            return response
+        response.cache_control.no_cache = None  # send_file's default when it isn't given a max_age
+        response.cache_control.max_age = self.max_age
+        response.cache_control.immutable = True
+        return response
+
+    def not_modified(self, filename: str, suffix: str = ''):
+        """304 for a content-addressed file (or derivative) the client already has, or None"""
+        etag = self.etag_from_name(filename)
+        if not etag or etag + suffix not in request.if_none_match:
+            return None
+        response = current_app.response_class(status=304)
+        response.set_etag(etag + suffix)
+        self._count("304")
+        return self._apply_cache_policy(response, filename)
+
+    def _proxy_target(self, path: str) -> Optional[str]:
+        if self.mode == 'x-sendfile':
+            return os.path.abspath(path)
+        real_path = os.path.realpath(path)
+        for root in self.roots:
+            real_root = os.path.realpath(root)
+            if os.path.commonpath([real_path, real_root]) == real_root:
+                relative = os.path.relpath(real_path, real_root).replace(os.sep, '/')
+                return f"{self.accel_prefix}/{os.path.basename(real_root)}/{relative}"
+        return None
+
+    def respond(self, path: str, filename: str, etag: str = None):
+        """
+        Response for a stored file (raises FileNotFoundError if it vanished).
+
+        `filename` is the public name and decides the cache policy; `path`
+        may be a derivative of it, in which case the caller passes its etag.
+        """
+        stat = os.stat(path)
+        etag = etag or self.etag_for(path, filename, stat)
+
+        target = self._proxy_target(path) if self.mode != 'python' else None
+        if target:
+            response = current_app.response_class(
+                mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            )
+            response.headers['X-Accel-Redirect' if self.mode == 'x-accel-redirect' else 'X-Sendfile'] = target
+            response.set_etag(etag)
+            response.last_modified = stat.st_mtime
+            response = response.make_conditional(request.environ)
+            if response.status_code == 200:
+                self._count("delegated")
+        else:
+            response = send_file(path, etag=etag, last_modified=stat.st_mtime, conditional=True)
+
+        self._count(str(response.status_code))
+        return self._apply_cache_policy(response, filename)
+
+    def _count(self, key: str):
+        with self._lock:
+            if key in self.counts:
+                self.counts[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counts, mode=self.mode, etag_digests=self._digests.stats())
@@ -0,0 +1,179 @@
+"""
+🗃️ Sharded File Store
+Where your selfies go to be filed away forever, in a very orderly fashion.
+
+"A million faces, and not one of them in the wrong drawer."
+"""
+
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Files we never track: in-progress writes and avatar metadata awaiting import-avatars
+IGNORED_SUFFIXES = ('.tmp',)
+
+
+def shard_for(filename: str) -> Tuple[str, str]:
+    """Two levels of 256 buckets from a hash of the public filename"""
+    digest = hashlib.md5(filename.encode('utf-8')).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def _is_tracked(name: str) -> bool:
+    if name.startswith('.') or name.endswith(IGNORED_SUFFIXES):
+        return False
+    return not (name.startswith('avatar_') and name.endswith('.json'))
+
+
+class ShardedFileStore:
+    """
+    Hash-prefix sharded layout (<root>/ab/cd/<filename>) for uploads and
+    generated avatars, with an in-memory manifest from public filename to
+    storage location.
+
+    The manifest is rebuilt by a scan at startup. It only stores which
+    root a file lives in (and whether it is still in the legacy flat
+    layout); the sharded path itself is recomputed from the name, which
+    keeps a million-entry manifest small. A manifest miss falls back to
+    one stat per root, so files written by other workers are still found.
+    """
+
+    def __init__(self, roots: List[str]):
+        self.roots = [os.path.normpath(root) for root in roots]
+        self._manifest: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._created_dirs = set()
+        self.hits = 0
+        self.misses = 0
+        for root in self.roots:
+            os.makedirs(root, exist_ok=True)
+
+    def _root_index(self, folder: str) -> int:
+        folder = os.path.normpath(folder)
+        with self._lock:
+            if folder not in self.roots:
+                self.roots.append(folder)
+                os.makedirs(folder, exist_ok=True)
+            return self.roots.index(folder)
+
+    def _location(self, entry: int, filename: str) -> str:
+        # Non-negative entries are sharded, negative ones are legacy flat files
+        if entry >= 0:
+            return os.path.join(self.roots[entry], *shard_for(filename), filename)
+        return os.path.join(self.roots[-entry - 1], filename)
+
+    def path_for(self, folder: str, filename: str, create: bool = True) -> str:
+        """Sharded storage path for a new file (creating its bucket directories)"""
+        directory = os.path.join(folder, *shard_for(filename))
+        if create and directory not in self._created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._created_dirs.add(directory)
+        return os.path.join(directory, filename)
+
+    def register(self, folder: str, filename: str):
+        """Record a file that has been written to its sharded path"""
+        self._manifest[filename] = self._root_index(folder)
+
+    def discard(self, filename: str):
+        self._manifest.pop(filename, None)
+
+    def resolve(self, filename: str) -> Optional[str]:
+        """Storage path for a public filename, or None if we don't have it"""
+        if not filename or os.path.basename(filename) != filename:
+            return None
+
+        entry = self._manifest.get(filename)
+        if entry is not None:
+            # A flat file may have been sharded by migrate-files since we scanned
+            path = self._location(entry, filename)
+            if entry >= 0 or os.path.exists(path):
+                self.hits += 1
+                return path
+
+        # Written by another worker after our scan, or not ours at all
+        self.misses += 1
+        for index in range(len(self.roots)):
+            for candidate in (index, -index - 1):
+                path = self._location(candidate, filename)
+                if os.path.exists(path):
+                    self._manifest[filename] = candidate
+                    return path
+        return None
+
+    def locate(self, stored: Optional[str]) -> Optional[str]:
+        """
+        Current path of a file recorded in metadata, or None if it's gone.
+
+        Metadata stores bare filenames; records written before the sharded
+        layout hold full flat paths, which are looked up by their name.
+        """
+        return self.resolve(os.path.basename(stored)) if stored else None
+
+    def _scan_root(self, index: int) -> Iterator[Tuple[str, int]]:
+        root = self.roots[index]
+        for top in os.scandir(root):
+            if top.is_file():
+                if _is_tracked(top.name):
+                    yield top.name, -index - 1
+            elif len(top.name) == 2 and top.is_dir():
+                for middle in os.scandir(top.path):
+                    if len(middle.name) == 2 and middle.is_dir():
+                        for entry in os.scandir(middle.path):
+                            if _is_tracked(entry.name):
+                                yield entry.name, index
+
+    def rebuild(self) -> int:
+        """Rescan every root and replace the manifest; returns the file count"""
+        manifest = {}
+        for index in range(len(self.roots)):
+            manifest.update(self._scan_root(index))
+        self._manifest = manifest
+        return len(manifest)
+
+    def migrate(self, folder: str, dry_run: bool = False) -> Dict[str, int]:
+        """Move files from the flat legacy layout of `folder` into shards"""
+        index = self._root_index(folder)
+        moved = skipped = 0
+        for entry in os.scandir(self.roots[index]):
+            if not entry.is_file() or not _is_tracked(entry.name):
+                continue
+            target = self.path_for(self.roots[index], entry.name, create=not dry_run)
+            if os.path.exists(target):
+                skipped += 1
+                continue
+            if not dry_run:
+                os.replace(entry.path, target)
+                self._manifest[entry.name] = index
+            moved += 1
+        return {'moved': moved, 'skipped': skipped}
+
+    def __len__(self) -> int:
+        return len(self._manifest)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self._manifest),
+            "roots": len(self.roots),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+_file_store = None
+_file_store_lock = threading.Lock()
+
+
+def get_file_store() -> ShardedFileStore:
+    """Process-wide store over UPLOAD_FOLDER and AVATAR_FOLDER, scanned on first use"""
+    global _file_store
+    if _file_store is None:
+        with _file_store_lock:
+            if _file_store is None:
+                store = ShardedFileStore([
+                    os.getenv('UPLOAD_FOLDER', '../uploads'),
+                    os.getenv('AVATAR_FOLDER', '../generated_avatars')
+                ])
+                store.rebuild()
+                _file_store = store
+    return _file_store
@@ -0,0 +1,77 @@
+"""
+🖼️ Decoded Frame Cache
+Keeps your freshly processed face in memory for the avatar step.
+
+"We decoded you once. Nobody deserves to be decoded twice."
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from app.caching import LRUCache
+
+
+def _pil_image_bytes(image: Image.Image) -> int:
+    """Approximate resident size of a PIL image (RGB is stored 4 bytes/pixel)"""
+    width, height = image.size
+    bands = 4 if image.mode in ('RGB', 'RGBA', 'RGBX', 'CMYK') else len(image.getbands())
+    return width * height * bands
+
+
+class DecodedFrameCache:
+    """
+    Byte-bounded, TTL'd LRU of processed frames keyed by file_id.
+
+    Frames are held as RGB PIL images, the layout the avatar renderer draws
+    on, so generation right after an upload skips the JPEG decode, the
+    BGR->RGB conversion and the numpy->PIL copy. Cached frames are shared
+    and must be treated as read-only (copy before drawing).
+    """
+
+    def __init__(self, max_bytes: int = None, ttl: float = None, maxsize: int = None):
+        self._cache = LRUCache(
+            maxsize=maxsize or int(os.getenv('FRAME_CACHE_MAX_ENTRIES', 256)),
+            ttl=ttl if ttl is not None else float(os.getenv('FRAME_CACHE_TTL', 300)),
+            max_bytes=max_bytes or int(os.getenv('FRAME_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+            sizeof=_pil_image_bytes
+        )
+
+    def put(self, file_id: str, image: Image.Image):
+        self._cache.set(file_id, image)
+
+    def get(self, file_id: str) -> Optional[Image.Image]:
+        return self._cache.get(file_id)
+
+    def get_or_load(self, file_id: str, path: str) -> Optional[Image.Image]:
+        """Cached frame, or decode it straight to RGB from disk and cache it"""
+        image = self.get(file_id) if file_id else None
+        if image is not None:
+            return image
+        try:
+            with Image.open(path) as source:
+                image = source.convert('RGB')
+        except (FileNotFoundError, OSError):
+            return None
+        if file_id:
+            self.put(file_id, image)
+        return image
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+_frame_cache = None
+_frame_cache_lock = threading.Lock()
+
+
+def get_frame_cache() -> DecodedFrameCache:
+    """Process-wide frame cache shared by upload processing and avatar generation"""
+    global _frame_cache
+    if _frame_cache is None:
+        with _frame_cache_lock:
+            if _frame_cache is None:
+                _frame_cache = DecodedFrameCache()
+    return _frame_cache
@@ -0,0 +1,135 @@
+"""
+🏁 Hedged Generation
+Racing the cloud against our own worst instincts.
+
+"Why wait for a smart answer when a fast, mean one is already here?"
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.services.llm_client import LatencyWindow
+
+# How a reply was produced, for per-mode tail latency
+MODE_REMOTE = 'remote'      # the model answered and started in time
+MODE_HEDGED = 'hedged'      # no first token within the threshold; the local roast went out
+MODE_FALLBACK = 'fallback'  # the remote call failed (or was refused) before the threshold
+MODE_POOLED = 'pooled'      # an earlier late answer was reused
+MODE_SHED = 'shed'          # every remote worker was busy; answered locally without asking
+
+
+class Hedger:
+    """
+    Runs the remote completion on a worker and waits at most `threshold()`
+    for its first token. If none arrives, the caller gets the local answer
+    and the remote one is handed to `on_late` whenever it finishes.
+
+    The threshold is the HEDGE_PERCENTILE of recently observed
+    time-to-first-token (late ones included, so it can't ratchet down),
+    times HEDGE_MULTIPLIER, clamped to [HEDGE_MIN_DELAY, HEDGE_MAX_DELAY].
+    Until HEDGE_MIN_SAMPLES have been seen, HEDGE_INITIAL_DELAY is used.
+    Time-to-first-token is measured from when a worker starts the call.
+
+    Only HEDGE_WORKERS remote calls run at once and nothing queues behind
+    them: while all are busy (e.g. a slow upstream holding hedged calls
+    until their deadline), requests are answered locally straight away.
+    """
+
+    def __init__(self):
+        self.percentile = float(os.getenv('HEDGE_PERCENTILE', 0.95))
+        self.multiplier = float(os.getenv('HEDGE_MULTIPLIER', 1.0))
+        self.min_delay = float(os.getenv('HEDGE_MIN_DELAY', 0.3))
+        self.max_delay = float(os.getenv('HEDGE_MAX_DELAY', 3.0))
+        self.initial_delay = float(os.getenv('HEDGE_INITIAL_DELAY', 1.0))
+        self.min_samples = int(os.getenv('HEDGE_MIN_SAMPLES', 20))
+
+        self.workers = int(os.getenv('HEDGE_WORKERS', 8))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hedged-remote')
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self.first_token = LatencyWindow(int(os.getenv('HEDGE_WINDOW', 200)))
+        self.modes = {mode: LatencyWindow()
+                      for mode in (MODE_REMOTE, MODE_HEDGED, MODE_FALLBACK, MODE_POOLED, MODE_SHED)}
+        self.late_results = 0
+
+    def threshold(self) -> float:
+        """Seconds to wait for the first remote token before hedging"""
+        if len(self.first_token) < self.min_samples:
+            return self.initial_delay
+        observed = self.first_token.percentile(self.percentile) * self.multiplier
+        return min(self.max_delay, max(self.min_delay, observed))
+
+    def record(self, mode: str, started: float):
+        self.modes[mode].add(time.monotonic() - started)
+
+    def run(self, remote: Callable[[Callable[[], None]], Dict[str, Any]], local: Callable[[], Dict[str, Any]],
+            on_late: Callable[[Dict[str, Any]], None] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        (response, mode) from whichever of remote and local wins.
+
+        `remote` receives a callback to invoke when its first token arrives.
+        """
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            # Queueing would only add wait time and more upstream calls to a backlog
+            response = local()
+            self.record(MODE_SHED, started)
+            return response, MODE_SHED
+
+        first = threading.Event()
+        settled = threading.Event()
+
+        def call_remote():
+            running = time.monotonic()
+
+            def mark_first_token():
+                if not first.is_set():
+                    self.first_token.add(time.monotonic() - running)
+                    first.set()
+                    settled.set()
+
+            return remote(mark_first_token)
+
+        try:
+            future: Future = self._executor.submit(call_remote)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        future.add_done_callback(lambda _: settled.set())
+        settled.wait(self.threshold())
+
+        if first.is_set() or (future.done() and future.exception() is None):
+            # The model is talking; let it finish (its own deadline still applies)
+            try:
+                response = future.result()
+                self.record(MODE_REMOTE, started)
+                return response, MODE_REMOTE
+            except Exception:
+                mode = MODE_FALLBACK
+        elif future.done():
+            mode = MODE_FALLBACK
+        else:
+            mode = MODE_HEDGED
+            future.add_done_callback(lambda done: self._late(done, on_late))
+
+        response = local()
+        self.record(mode, started)
+        return response, mode
+
+    def _late(self, future: Future, on_late: Optional[Callable[[Dict[str, Any]], None]]):
+        if future.exception() is not None:
+            return
+        self.late_results += 1
+        if on_late is not None:
+            on_late(future.result())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold() * 1000,
+            "first_token": self.first_token.summary(),
+            "late_results": self.late_results,
+            "modes": {mode: dict(window.summary(), count=window.count) for mode, window in self.modes.items()}
+        }
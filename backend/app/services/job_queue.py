@@ -0,0 +1,496 @@
+"""
+📬 Background Job Queue
+Long-running disappointment, delivered asynchronously.
+
+"Your avatar is being generated. Please hold. Your call is not important to us."
+"""
+
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_RETRYING = 'retrying'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+IN_FLIGHT_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_RETRYING)
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (e.g. the input is gone)"""
+
+
+class JobBroker(ABC):
+    """
+    Interface for where jobs wait and where their state lives.
+
+    A broker stores job dicts, hands due jobs to workers one at a time
+    under a lease, and de-duplicates identical in-flight submissions.
+    Times (run_after, lease_until, finished_at) are epoch seconds.
+    """
+
+    @abstractmethod
+    def enqueue(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Store a queued job unless one with its dedup_key is in flight.
+
+        Returns (job, deduplicated); the check and insert are atomic.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def requeue(self, job_id: str, run_after: float, **fields):
+        """Put an existing job back in line once `run_after` has passed (used for retries)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, timeout: float, lease: float) -> Optional[Dict[str, Any]]:
+        """
+        Mark the oldest due job running for `lease` seconds and return it, or None.
+
+        A running job whose lease ran out (its worker died) is due again.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, job_id: str, **fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def purge(self, finished_before: float) -> int:
+        """Delete succeeded/failed jobs that finished before the given time"""
+        raise NotImplementedError
+
+
+class InMemoryBroker(JobBroker):
+    """
+    Process-local broker; fine for a single server process.
+
+    Nothing survives a restart, so leases are recorded but never expire.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, str] = {}
+        self._ready = deque()
+        self._delayed = []  # heap of (run_after, job_id)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+    def enqueue(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        with self._lock:
+            job_id = self._in_flight.get(job['dedup_key'])
+            if job_id is not None:
+                return dict(self._jobs[job_id]), True
+            self._jobs[job['job_id']] = dict(job)
+            self._in_flight[job['dedup_key']] = job['job_id']
+            self._ready.append(job['job_id'])
+            self._wakeup.notify()
+        return job, False
+
+    def requeue(self, job_id: str, run_after: float, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, run_after=run_after, updated_at=datetime.now().isoformat())
+            heapq.heappush(self._delayed, (run_after, job_id))
+            self._wakeup.notify()
+
+    def claim(self, timeout: float, lease: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                while self._delayed and self._delayed[0][0] <= time.time():
+                    self._ready.append(heapq.heappop(self._delayed)[1])
+                if self._ready:
+                    job = self._jobs[self._ready.popleft()]
+                    job.update(status=JOB_RUNNING, lease_until=time.time() + lease,
+                               updated_at=datetime.now().isoformat())
+                    return dict(job)
+
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    return None
+                if self._delayed:
+                    wait = min(wait, self._delayed[0][0] - time.time())
+                self._wakeup.wait(max(0.0, wait))
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields, updated_at=datetime.now().isoformat())
+            if job['status'] not in IN_FLIGHT_STATUSES and self._in_flight.get(job['dedup_key']) == job_id:
+                del self._in_flight[job['dedup_key']]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def purge(self, finished_before: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['status'] not in IN_FLIGHT_STATUSES and (job.get('finished_at') or 0) < finished_before]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteBroker(JobBroker):
+    """
+    SQLite-backed broker, shared by every worker process on the host.
+
+    Submissions and claims happen inside BEGIN IMMEDIATE, so identical
+    submissions from two processes share one job and two workers never
+    take the same job. A claim holds a lease (lease_until); if the worker
+    dies, the job is claimed again once the lease runs out. Retry delays
+    are stored as run_after, so they survive restarts. Idle workers poll
+    every `poll_interval` seconds.
+    """
+
+    _JSON_FIELDS = ('payload', 'result')
+    # Added after the first release; created on open for older databases, where
+    # a zero lease makes jobs left running by the old workers claimable again
+    _LATE_COLUMNS = {'run_after': 'REAL NOT NULL DEFAULT 0', 'lease_until': 'REAL NOT NULL DEFAULT 0',
+                     'finished_at': 'REAL'}
+
+    def __init__(self, db_file: str = "./data/jobs.sqlite3", poll_interval: float = 0.25):
+        self.db_file = db_file
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                dedup_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                stage TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                payload TEXT,
+                result TEXT,
+                error TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            )
+        """)
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        for column, definition in self._LATE_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (dedup_key, status)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=5.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _to_job(self, row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in self._JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def _values(self, fields: Dict[str, Any]) -> list:
+        return [json.dumps(value, separators=(',', ':')) if column in self._JSON_FIELDS else value
+                for column, value in fields.items()]
+
+    def enqueue(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE dedup_key = ? AND status IN ({', '.join('?' for _ in IN_FLIGHT_STATUSES)}) "
+                "ORDER BY created_at LIMIT 1",
+                (job['dedup_key'], *IN_FLIGHT_STATUSES)
+            ).fetchone()
+            if row is None:
+                conn.execute(f"INSERT INTO jobs ({', '.join(job)}) VALUES ({', '.join('?' for _ in job)})",
+                             self._values(job))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return (self._to_job(row), True) if row is not None else (job, False)
+
+    def requeue(self, job_id: str, run_after: float, **fields):
+        self.update(job_id, run_after=run_after, **fields)
+
+    def claim(self, timeout: float, lease: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        conn = self._connection()
+        while True:
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    """SELECT * FROM jobs
+                       WHERE (status IN (?, ?) AND run_after <= ?) OR (status = ? AND lease_until < ?)
+                       ORDER BY created_at LIMIT 1""",
+                    (JOB_QUEUED, JOB_RETRYING, now, JOB_RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = ?, lease_until = ?, updated_at = ? WHERE job_id = ?",
+                                 (JOB_RUNNING, now + lease, datetime.now().isoformat(), row['job_id']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+            if row is not None:
+                job = self._to_job(row)
+                job.update(status=JOB_RUNNING, lease_until=now + lease)
+                return job
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def update(self, job_id: str, **fields):
+        fields['updated_at'] = datetime.now().isoformat()
+        self._connection().execute(
+            f"UPDATE jobs SET {', '.join(f'{c} = ?' for c in fields)} WHERE job_id = ?",
+            (*self._values(fields), job_id)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_job(row)
+
+    def purge(self, finished_before: float) -> int:
+        cursor = self._connection().execute(
+            f"DELETE FROM jobs WHERE finished_at < ? AND status NOT IN ({', '.join('?' for _ in IN_FLIGHT_STATUSES)})",
+            (finished_before, *IN_FLIGHT_STATUSES)
+        )
+        return cursor.rowcount
+
+
+JOB_BROKERS = {
+    'memory': InMemoryBroker,
+    'sqlite': SQLiteBroker,
+}
+
+
+def create_job_broker(kind: str = None, path: str = None) -> JobBroker:
+    """Build the broker named by JOB_BROKER ('memory' or 'sqlite')"""
+    kind = (kind or os.getenv('JOB_BROKER', 'memory')).lower()
+    if kind not in JOB_BROKERS:
+        raise ValueError(f"Unknown job broker: {kind}")
+    if kind == 'sqlite':
+        return SQLiteBroker(path or os.getenv('JOB_BROKER_PATH', './data/jobs.sqlite3'))
+    return JOB_BROKERS[kind]()
+
+
+class JobQueue:
+    """
+    Runs registered job handlers on a fixed number of worker threads.
+
+    Identical in-flight submissions (same type and payload) share one job.
+    Failed jobs are retried with exponential backoff up to `max_retries`
+    times. Every state change is passed to `notifier(event, job)` so the
+    app can push it to clients (e.g. over Socket.IO).
+
+    A claimed job is leased for JOB_LEASE seconds, renewed whenever the
+    handler reports progress. If the worker dies, another one picks the
+    job up once the lease runs out (counted as a failed attempt), so a
+    handler that goes longer than the lease without reporting may run
+    twice. Finished jobs are purged after JOB_RETENTION seconds.
+    """
+
+    def __init__(self, broker: JobBroker = None, concurrency: int = None, max_retries: int = None,
+                 notifier: Callable[[str, Dict[str, Any]], None] = None):
+        self.broker = broker or create_job_broker()
+        self.concurrency = concurrency or int(os.getenv('JOB_CONCURRENCY', 2))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('JOB_MAX_RETRIES', 2))
+        self.retry_backoff = float(os.getenv('JOB_RETRY_BACKOFF', 1.0))
+        self.lease = float(os.getenv('JOB_LEASE', 60))
+        self.retention = float(os.getenv('JOB_RETENTION', 24 * 3600))
+        self.notifier = notifier
+        self._handlers: Dict[str, Callable] = {}
+        self._public_results: Dict[str, Callable] = {}
+        self._stopped = threading.Event()
+        self._workers = []
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.retried = 0
+        self.abandoned = 0
+        self.purged = 0
+
+    def register(self, job_type: str, handler: Callable[[Dict[str, Any], Callable], Any],
+                 public_result: Callable[[Any], Any] = None):
+        """
+        handler(payload, report_progress) -> JSON-serializable result
+
+        public_result(result) strips whatever only the job's owner (the
+        payload's user_id) may see; everyone else gets its output.
+        """
+        self._handlers[job_type] = handler
+        if public_result is not None:
+            self._public_results[job_type] = public_result
+
+    def start(self):
+        for i in range(self.concurrency):
+            worker = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._stopped.set()
+
+    def public_view(self, job: Dict[str, Any], viewer_id: str = None) -> Dict[str, Any]:
+        """Job state safe to hand to clients; the full result only for its owner"""
+        view = {key: job.get(key) for key in
+                ('job_id', 'job_type', 'status', 'progress', 'stage', 'attempts',
+                 'result', 'error', 'created_at', 'updated_at')}
+        owner_id = (job.get('payload') or {}).get('user_id')
+        public_result = self._public_results.get(job.get('job_type'))
+        if view['result'] is not None and public_result and not (owner_id and owner_id == viewer_id):
+            view['result'] = public_result(view['result'])
+        return view
+
+    def submit(self, job_type: str, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Queue a job, or return the identical one already in flight"""
+        if job_type not in self._handlers:
+            raise ValueError(f"No handler registered for job type: {job_type}")
+
+        dedup_key = hashlib.sha256(
+            f"{job_type}:{json.dumps(payload, sort_keys=True, separators=(',', ':'))}".encode()
+        ).hexdigest()
+
+        now = datetime.now().isoformat()
+        job, deduplicated = self.broker.enqueue({
+            'job_id': str(uuid.uuid4()),
+            'job_type': job_type,
+            'dedup_key': dedup_key,
+            'status': JOB_QUEUED,
+            'progress': 0.0,
+            'stage': 'queued',
+            'attempts': 0,
+            'payload': payload,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'run_after': 0.0
+        })
+        if deduplicated:
+            self.deduplicated += 1
+        else:
+            self.submitted += 1
+        return self.public_view(job), deduplicated
+
+    def get(self, job_id: str, viewer_id: str = None) -> Optional[Dict[str, Any]]:
+        """Job state as `viewer_id` may see it (anonymous viewers get the public result)"""
+        job = self.broker.get(job_id)
+        return self.public_view(job, viewer_id) if job else None
+
+    def _notify(self, event: str, job_id: str):
+        if self.notifier is None:
+            return
+        try:
+            self.notifier(event, self.get(job_id))
+        except Exception as e:
+            print(f"Warning: job notification failed: {e}")
+
+    def _work(self):
+        while not self._stopped.is_set():
+            self._purge_finished()
+            job = self.broker.claim(timeout=1.0, lease=self.lease)
+            if job is None:
+                continue
+            self._run(job)
+
+    def _purge_finished(self):
+        """Drop finished jobs past their retention, at most once a minute per process"""
+        with self._purge_lock:
+            if time.monotonic() < self._next_purge:
+                return
+            self._next_purge = time.monotonic() + 60
+        try:
+            self.purged += self.broker.purge(time.time() - self.retention)
+        except Exception as e:
+            print(f"Warning: job purge failed: {e}")
+
+    def _run(self, job: Dict[str, Any]):
+        job_id = job['job_id']
+        if job['attempts'] > self.max_retries:
+            # Every attempt was used up, the last one by a worker that never came back
+            self.abandoned += 1
+            self.broker.update(job_id, status=JOB_FAILED, stage='failed', finished_at=time.time(),
+                               error=job.get('error') or "Worker stopped before the job finished")
+            self._notify('job_failed', job_id)
+            return
+
+        attempts = job['attempts'] + 1
+        self.broker.update(job_id, attempts=attempts, stage='running')
+        self._notify('job_progress', job_id)
+
+        # Handlers may report from their own threads; drop reports that
+        # arrive after the attempt has already finished
+        progress_lock = threading.Lock()
+        finished = [False]
+
+        def report_progress(progress: float, stage: str = None):
+            with progress_lock:
+                if finished[0]:
+                    return
+                self.broker.update(job_id, progress=round(progress, 3), stage=stage or 'running',
+                                   lease_until=time.time() + self.lease)
+                self._notify('job_progress', job_id)
+
+        try:
+            result = self._handlers[job['job_type']](job['payload'], report_progress)
+        except Exception as e:
+            with progress_lock:
+                finished[0] = True
+            if attempts <= self.max_retries and not isinstance(e, PermanentJobError):
+                self.retried += 1
+                self.broker.requeue(job_id, time.time() + self.retry_backoff * (2 ** (attempts - 1)),
+                                    status=JOB_RETRYING, stage='retrying', error=str(e))
+                self._notify('job_progress', job_id)
+            else:
+                self.broker.update(job_id, status=JOB_FAILED, stage='failed', error=str(e),
+                                   finished_at=time.time())
+                self._notify('job_failed', job_id)
+            return
+
+        with progress_lock:
+            finished[0] = True
+        self.broker.update(job_id, status=JOB_SUCCEEDED, stage='done', progress=1.0,
+                           result=result, error=None, finished_at=time.time())
+        self._notify('job_completed', job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "broker": type(self.broker).__name__,
+            "concurrency": self.concurrency,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "retried": self.retried,
+            "abandoned": self.abandoned,
+            "purged": self.purged
+        }
@@ -0,0 +1,314 @@
+"""
+🔌 LLM Client
+A polite, impatient phone line to the language model.
+
+"We'll wait for the AI. Up to a point. Then we'll just insult you ourselves."
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Worth another attempt; anything else in the 4xx range is our own fault
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The completion could not be produced"""
+
+
+class LLMTimeout(LLMError):
+    """The call's deadline passed"""
+
+
+class LLMUnavailable(LLMError):
+    """The circuit breaker is open, so the upstream wasn't even tried"""
+
+
+class LatencyWindow:
+    """Recent latency samples (seconds) with percentile summaries"""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def summary(self) -> Dict[str, float]:
+        """p50/p95/p99 in milliseconds"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {}
+        pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+        return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    are refused for `reset_timeout` seconds. Then one probe is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._state = self.HALF_OPEN
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release(self):
+        """A call that ended without a verdict (e.g. cancelled): free the probe slot, change nothing else"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LLMClient:
+    """
+    Chat completions over a pooled keep-alive requests.Session.
+
+    Every call has a deadline; failed attempts (connection errors,
+    timeouts, 429 and 5xx) are retried with full-jitter exponential
+    backoff only while the deadline allows. A circuit breaker refuses
+    calls outright while the upstream keeps failing, so callers can fall
+    back immediately instead of waiting out timeouts.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self.base_url = (base_url or os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')).rstrip('/')
+        self.deadline = float(os.getenv('LLM_DEADLINE', 8))
+        self.connect_timeout = float(os.getenv('LLM_CONNECT_TIMEOUT', 2))
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', 2))
+        self.retry_backoff = float(os.getenv('LLM_RETRY_BACKOFF', 0.25))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.getenv('LLM_BREAKER_RESET', 30))
+        )
+
+        pool_size = int(os.getenv('LLM_POOL_SIZE', 10))
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+        self.session.headers.update({
+            'Authorization': f"Bearer {self.api_key}",
+            'Content-Type': 'application/json'
+        })
+
+        self._lock = threading.Lock()
+        self.latency = LatencyWindow(int(os.getenv('LLM_LATENCY_WINDOW', 500)))
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.short_circuited = 0
+
+    def available(self) -> bool:
+        """False while the circuit is open (calls would be refused)"""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def chat(self, params: Dict[str, Any], deadline: float = None) -> Dict[str, Any]:
+        """POST /chat/completions and return the decoded JSON body"""
+        response, _ = self._request(params, deadline, stream=False)
+        try:
+            return response.json()
+        finally:
+            response.close()
+
+    def stream_chat(self, params: Dict[str, Any], cancel: threading.Event = None,
+                    deadline: float = None) -> Iterator[str]:
+        """
+        Content deltas of a streamed completion.
+
+        The deadline covers getting the stream started; after that each
+        chunk must arrive within the remaining read timeout. Setting
+        `cancel` (or closing the generator) drops the connection. Only a
+        stream that reaches [DONE] counts as a success for the circuit
+        breaker; one that breaks off is a failure, and a cancelled one
+        records nothing (a half-open probe is simply let go).
+        """
+        response, started = self._request(dict(params, stream=True), deadline, stream=True)
+        outcome = 'failed'
+        try:
+            for line in response.iter_lines():
+                if cancel is not None and cancel.is_set():
+                    outcome = 'cancelled'
+                    break
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[len(b'data:'):].strip()
+                if data == b'[DONE]':
+                    outcome = 'done'
+                    break
+                choices = json.loads(data).get('choices') or [{}]
+                delta = choices[0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+        except GeneratorExit:
+            outcome = 'cancelled'
+            raise
+        except requests.RequestException as e:
+            raise LLMError(f"stream interrupted: {e}") from e
+        finally:
+            response.close()
+            if outcome == 'cancelled':
+                self.breaker.release()
+            else:
+                self._record(outcome == 'done', started)
+
+    def _request(self, params: Dict[str, Any], deadline: Optional[float],
+                 stream: bool) -> Tuple[requests.Response, float]:
+        """
+        (response, start time) for a call the breaker lets through.
+
+        Failures are recorded here, whatever raised them; so is success,
+        except for streams, whose outcome stream_chat records at the end.
+        """
+        started = time.monotonic()
+        self.calls += 1
+
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise LLMUnavailable("LLM circuit open")
+
+        try:
+            response = self._send(params, started + (deadline or self.deadline), stream)
+        except Exception as e:
+            # Anything at all, or a half-open probe would stay in flight forever
+            self._record(False, started)
+            if isinstance(e, LLMError):
+                raise
+            raise LLMError(f"request failed: {e}") from e
+        if not stream:
+            self._record(True, started)
+        return response, started
+
+    def _send(self, params: Dict[str, Any], expires: float, stream: bool) -> requests.Response:
+        """POST with retries until a non-error response or the deadline"""
+        attempt = 0
+        while True:
+            remaining = expires - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise LLMTimeout("deadline passed before the request could be sent")
+                response = self.session.post(
+                    f"{self.base_url}/chat/completions", json=params, stream=stream,
+                    timeout=(min(self.connect_timeout, remaining), remaining)
+                )
+                if response.status_code < 400:
+                    return response
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                error = LLMError(f"upstream returned {response.status_code}")
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise error
+            except requests.Timeout as e:
+                self.timeouts += 1
+                error, retry_after = LLMTimeout(str(e)), None
+            except requests.RequestException as e:
+                error, retry_after = LLMError(str(e)), None
+            except LLMTimeout:
+                self.timeouts += 1
+                raise
+
+            # Full jitter, but never sleep past the deadline
+            delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay >= expires:
+                raise error
+            self.retries += 1
+            time.sleep(delay)
+
+    def _record(self, success: bool, started: float):
+        self.latency.add(time.monotonic() - started)
+        with self._lock:
+            if success:
+                self.successes += 1
+            else:
+                self.failures += 1
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.successes + self.failures
+        return {
+            "base_url": self.base_url,
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "error_rate": self.failures / finished if finished else 0.0,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "short_circuited": self.short_circuited,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "latency": self.latency.summary()
+        }
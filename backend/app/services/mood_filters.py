@@ -0,0 +1,143 @@
+"""
+🎨 Mood Filters
+Colour grading for every flavour of therapeutic disappointment.
+
+"We can't change how you feel, but we can make you look slightly more beige about it."
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# ITU-R 601-2 luma, the same weights PIL uses for RGB -> L
+LUMA = np.array([0.299, 0.587, 0.114])
+
+# Built-in moods; AVATAR_MOOD_CONFIG can add more or override these
+DEFAULT_MOOD_SPECS: Dict[str, Dict[str, Any]] = {
+    "professional_disappointment": {"saturation": 0.8},  # that clinical feel
+    "fake_empathy": {"saturation": 1.1, "gains": [1.04, 1.0, 0.96]},  # slightly warmer tones
+    "silent_judgment": {"saturation": 0.9, "contrast": 1.1, "gains": [0.97, 1.0, 1.04]},
+    "toxic_positivity": {"saturation": 1.25, "brightness": 1.08}
+}
+
+SPEC_KEYS = ('matrix', 'saturation', 'contrast', 'brightness', 'gains', 'gamma', 'curves')
+
+
+class MoodFilter:
+    """
+    A mood compiled to at most one colour matrix and one per-channel LUT.
+
+    Affine steps (matrix, saturation, contrast, brightness, gains) are
+    composed into a single 3x4 matrix, tone steps (gamma, curves) into a
+    256-entry LUT per channel. A matrix with no cross-channel terms is
+    folded into the LUT, so most moods cost exactly one pass in PIL's C
+    code. That pass writes a new image, which doubles as the variant's
+    private copy of the shared base frame.
+    """
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        self.name = name
+        self.spec = spec
+        self.matrix, self.lut = self._compile(spec)
+
+    @property
+    def passes(self) -> int:
+        return (self.matrix is not None) + (self.lut is not None)
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        """Filtered copy of an RGB image (the input is never modified)"""
+        if self.matrix is not None:
+            image = image.convert('RGB', self.matrix)
+        if self.lut is not None:
+            image = image.point(self.lut)
+        if self.passes == 0:
+            image = image.copy()
+        return image
+
+    @staticmethod
+    def _compile(spec: Dict[str, Any]) -> Tuple[Optional[Tuple[float, ...]], Optional[List[int]]]:
+        unknown = set(spec) - set(SPEC_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown mood filter settings: {', '.join(sorted(unknown))}")
+
+        # Affine part as a 4x4 homogeneous matrix, applied in SPEC_KEYS order
+        affine = np.eye(4)
+
+        def then(step: np.ndarray):
+            nonlocal affine
+            affine = step @ affine
+
+        if 'matrix' in spec:
+            step = np.eye(4)
+            step[:3, :] = np.asarray(spec['matrix'], dtype=float).reshape(3, 4)
+            then(step)
+        if 'saturation' in spec:
+            # Blend towards the pixel's own grey, like ImageEnhance.Color
+            factor = float(spec['saturation'])
+            step = np.eye(4)
+            step[:3, :3] = (1 - factor) * np.tile(LUMA, (3, 1)) + factor * np.eye(3)
+            then(step)
+        if 'contrast' in spec:
+            # Around mid-grey rather than the image mean so it stays data-only
+            factor = float(spec['contrast'])
+            step = np.diag([factor, factor, factor, 1.0])
+            step[:3, 3] = 128 * (1 - factor)
+            then(step)
+        if 'brightness' in spec:
+            factor = float(spec['brightness'])
+            then(np.diag([factor, factor, factor, 1.0]))
+        if 'gains' in spec:
+            then(np.diag([*map(float, spec['gains']), 1.0]))
+
+        # Tone part as a float LUT per channel
+        levels = np.arange(256, dtype=float)
+        curves = np.tile(levels, (3, 1))
+        tone_mapped = False
+        if 'gamma' in spec:
+            gamma = np.broadcast_to(np.asarray(spec['gamma'], dtype=float), (3,))
+            curves = 255.0 * (curves / 255.0) ** gamma[:, None]
+            tone_mapped = True
+        if 'curves' in spec:
+            # {"r": [[x, y], ...], ...}: piecewise-linear control points per channel
+            for channel, points in spec['curves'].items():
+                c = 'rgb'.index(channel.lower())
+                xs, ys = zip(*sorted(points))
+                curves[c] = np.interp(curves[c], xs, ys)
+            tone_mapped = True
+
+        linear = affine[:3, :]
+        has_matrix = not np.allclose(linear, np.eye(3, 4))
+        cross_channel = not np.allclose(linear[:, :3], np.diag(np.diag(linear[:, :3])))
+
+        if has_matrix and not cross_channel:
+            # Per-channel scale and offset: fold into the LUT
+            scale, offset = np.diag(linear[:, :3]), linear[:, 3]
+            indices = np.clip(levels[None, :] * scale[:, None] + offset[:, None], 0, 255)
+            curves = np.stack([np.interp(indices[c], levels, curves[c]) for c in range(3)])
+            has_matrix, tone_mapped = False, True
+
+        matrix = tuple(float(v) for v in linear.ravel()) if has_matrix else None
+        lut = None
+        if tone_mapped:
+            table = np.clip(np.rint(curves), 0, 255).astype(np.uint8)
+            if not np.array_equal(table, np.tile(np.arange(256, dtype=np.uint8), (3, 1))):
+                lut = table.ravel().tolist()
+        return matrix, lut
+
+
+def load_mood_filters(config_path: str = None) -> Dict[str, MoodFilter]:
+    """Compile the built-in moods plus any from AVATAR_MOOD_CONFIG (a JSON object of specs)"""
+    specs = dict(DEFAULT_MOOD_SPECS)
+
+    config_path = config_path or os.getenv('AVATAR_MOOD_CONFIG')
+    if config_path:
+        try:
+            with open(config_path, 'r') as f:
+                specs.update(json.load(f))
+        except FileNotFoundError:
+            print(f"Warning: mood filter config not found: {config_path}")
+
+    return {name: MoodFilter(name, spec) for name, spec in specs.items()}
@@ -0,0 +1,141 @@
+"""
+🔑 Password Hasher Service
+Slow password hashing, kept politely out of everyone else's way.
+
+"Key stretching: the only kind of stretching you've done this year."
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class HasherSaturatedError(Exception):
+    """Raised when the hashing pool and its queue are both full, or a job waited too long"""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a dedicated, size-limited pool.
+
+    At most `max_workers + max_queue` jobs are admitted at once; anything
+    beyond that is rejected immediately with HasherSaturatedError so the
+    caller can answer 503 instead of piling up blocked request threads. A
+    job that hasn't finished within `timeout` raises the same error.
+    hashlib's PBKDF2 and scrypt release the GIL, so worker threads hash in
+    parallel while the server keeps handling other requests and socket events.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None,
+                 method: str = None, iterations: int = None, timeout: float = None):
+        self.max_workers = max_workers or int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv('PASSWORD_HASH_QUEUE', 16))
+        self.timeout = timeout or float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+        self.method = self._build_method(
+            method or os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+            iterations or os.getenv('PASSWORD_HASH_ITERATIONS')
+        )
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='password-hasher')
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._stored_method = self._stored_prefix(self.method)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @staticmethod
+    def _build_method(method: str, iterations) -> str:
+        """Fold the iteration count into a werkzeug method string"""
+        if iterations and method.startswith('pbkdf2'):
+            if method.count(':') == 0:
+                method = f"{method}:sha256"
+            if method.count(':') == 1:
+                method = f"{method}:{int(iterations)}"
+        return method
+
+    @staticmethod
+    def _stored_prefix(method: str) -> str:
+        """The "method:params" werkzeug writes before the first "$", with its defaults filled in"""
+        name, *args = method.split(':')
+        if name == 'pbkdf2':
+            hash_name = args[0] if args else 'sha256'
+            iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+            return f"pbkdf2:{hash_name}:{iterations}"
+        if name == 'scrypt':
+            n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+            return f"scrypt:{n}:{r}:{p}"
+        return method
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _run(self, fn, *args):
+        """Run fn on the pool, rejecting straight away when saturated"""
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HasherSaturatedError("Password hashing is saturated, try again shortly")
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # frees its slot now if it never started
+            self._count('timed_out')
+            raise HasherSaturatedError("Password hashing is taking too long, try again shortly")
+        self._count('completed')
+        return result
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True when a stored hash was made with different parameters (read from its prefix, no hashing)"""
+        try:
+            return self._stored_prefix(password_hash.split('$', 1)[0]) != self._stored_method
+        except ValueError:
+            return True  # parameters we can't read; replace it with one we can
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "method": self.method,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_password_hasher = None
+_password_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Process-wide hasher, handed to the user model by AuthService"""
+    global _password_hasher
+    if _password_hasher is None:
+        with _password_hasher_lock:
+            if _password_hasher is None:
+                _password_hasher = PasswordHasher()
+    return _password_hasher
@@ -0,0 +1,187 @@
+"""
+🥫 Response Pool
+Pre-cooked roasts, kept warm for whoever walks in next.
+
+"We wrote your insult before you arrived. That's how well we know you."
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from app.caching import LRUCache
+
+
+class ResponsePool:
+    """
+    Pre-generated responses for prompts that never change.
+
+    A background thread fills each prompt's pool to `depth` and then keeps
+    replacing entries older than `max_age`, generating at most
+    `refill_per_minute` responses. A client never gets the same entry
+    twice; when the pool has nothing new for them, `draw` returns None
+    and the caller generates one the slow way.
+
+    Up to `extra_keys` other keys can be filled with `add` (e.g. answers
+    that arrived too late to be used); those are never refilled and the
+    least recently added key is dropped first.
+
+    Every server process runs its own pool and refill thread, so
+    RESPONSE_POOL_REFILL_PER_MINUTE is the budget for the whole host and
+    is split evenly across WEB_CONCURRENCY processes (gunicorn's worker
+    count setting).
+    """
+
+    def __init__(self, generate: Callable[[str], Dict[str, Any]], prompts: Dict[Hashable, str],
+                 depth: int = None, max_age: float = None, refill_per_minute: float = None,
+                 extra_keys: int = None):
+        self.generate = generate
+        self.prompts = dict(prompts)
+        self.depth = depth or int(os.getenv('RESPONSE_POOL_DEPTH', 8))
+        self.max_age = max_age or float(os.getenv('RESPONSE_POOL_MAX_AGE', 3600))
+        if refill_per_minute is None:
+            workers = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+            refill_per_minute = float(os.getenv('RESPONSE_POOL_REFILL_PER_MINUTE', 30)) / workers
+        self.refill_per_minute = refill_per_minute
+
+        self.extra_keys = extra_keys if extra_keys is not None else int(os.getenv('RESPONSE_POOL_EXTRA_KEYS', 1024))
+
+        self._pools: Dict[Hashable, deque] = {key: deque() for key in self.prompts}
+        self._extra: "OrderedDict[Hashable, deque]" = OrderedDict()
+        # (client, prompt key) -> ids of the entries that client has already seen
+        self._seen = LRUCache(maxsize=int(os.getenv('RESPONSE_POOL_CLIENTS', 10000)),
+                              ttl=float(os.getenv('RESPONSE_POOL_SEEN_TTL', 24 * 3600)))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._refill_times = deque(maxlen=1000)
+        self._wanted = set()  # prompts some client has exhausted
+
+        self.hits = 0
+        self.misses = 0
+        self.extra_hits = 0
+        self.refills = 0
+        self.refill_failures = 0
+
+    def start(self):
+        """Start the refill thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refill_loop, name='response-pool', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def draw(self, key: Hashable, client_id: str) -> Optional[Dict[str, Any]]:
+        """A pooled response this client hasn't seen yet, or None"""
+        with self._lock:
+            fixed = key in self._pools
+            pool = self._pools[key] if fixed else self._extra.get(key)
+            if pool is None:
+                return None
+            seen = self._seen.get((client_id, key))
+            if seen is None:
+                seen = set()
+                self._seen.set((client_id, key), seen)
+            entry = next((entry for entry in reversed(pool) if entry[0] not in seen), None)
+            if entry is not None:
+                seen.add(entry[0])
+            if not fixed:
+                self.extra_hits += entry is not None
+            elif entry is None:
+                self.misses += 1
+                self._wanted.add(key)
+            else:
+                self.hits += 1
+
+        if entry is None:
+            if fixed:
+                self._wake.set()  # this client has worn the pool out; make something new
+            return None
+        return dict(entry[2], timestamp=datetime.now().isoformat())
+
+    def add(self, key: Hashable, response: Dict[str, Any]):
+        """Put a freshly generated response into a prompt's (or extra key's) pool"""
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                if not self.extra_keys:
+                    return
+                pool = self._extra.pop(key, None) or deque()
+                self._extra[key] = pool
+                while len(self._extra) > self.extra_keys:
+                    self._extra.popitem(last=False)
+            pool.append((next(self._ids), time.time(), response))
+            while len(pool) > self.depth:
+                pool.popleft()
+
+    def _next_key(self) -> Optional[Hashable]:
+        """Prompt a client has exhausted, whose pool is shallowest, or whose oldest entry is stale"""
+        with self._lock:
+            if self._wanted:
+                return self._wanted.pop()
+            now = time.time()
+            key, pool = min(self._pools.items(), key=lambda item: len(item[1]))
+            if len(pool) < self.depth:
+                return key
+            stale = [(entries[0][1], name) for name, entries in self._pools.items()
+                     if now - entries[0][1] > self.max_age]
+            return min(stale)[1] if stale else None
+
+    def _refill_loop(self):
+        interval = 60.0 / self.refill_per_minute
+        while not self._stop.is_set():
+            key = self._next_key() if self._pools else None
+            if key is None:
+                # Everything is full and fresh; sleep until something goes stale or runs dry
+                self._wake.wait(min(self.max_age, 60.0))
+                self._wake.clear()
+                continue
+
+            try:
+                response = self.generate(self.prompts[key])
+            except Exception as e:
+                self.refill_failures += 1
+                print(f"Warning: response pool refill failed: {e}")
+            else:
+                if response is not None:
+                    self.add(key, response)
+                    self.refills += 1
+                    with self._lock:
+                        self._refill_times.append(time.time())
+                else:
+                    self.refill_failures += 1
+            self._stop.wait(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            # The refill thread appends to these while we read
+            refill_times = list(self._refill_times)
+            depth = {str(key): len(pool) for key, pool in self._pools.items()}
+            extra_keys = len(self._extra)
+        recent = sum(1 for t in refill_times if t > time.time() - 60)
+        return {
+            "depth": depth,
+            "target_depth": self.depth,
+            "extra_keys": extra_keys,
+            "extra_hits": self.extra_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "refills": self.refills,
+            "refill_failures": self.refill_failures,
+            "refills_last_minute": recent,
+            "refill_per_minute": self.refill_per_minute,
+            "running": self._thread is not None and self._thread.is_alive()
+        }
@@ -5,11 +5,77 @@ The core AI engine that delivers hilariously unhelpful therapy advice.
 "Combining the wisdom of therapy with the emotional intelligence of a toaster."
 """
 
-import openai
+import json
 import os
 import random
+import re
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional, Iterator
+
+from app.caching import LRUCache, SingleFlight
+from app.services.response_pool import ResponsePool
+from app.services.stream_backends import OpenAIStreamBackend, FakeStreamBackend
+from app.services.llm_client import LLMClient, LLMError
+from app.services.hedging import Hedger, MODE_POOLED, MODE_REMOTE
+
+# Prompts that never change, so their answers can be generated ahead of time
+ROAST_PROMPTS = {
+    'general_existence': "Roast me about my life choices in general",
+    'work_life': "Roast me about my work and career decisions",
+    'relationships': "Roast me about my relationship skills",
+    'self_care': "Roast me about my self-care routine",
+    'decision_making': "Roast me about how I make decisions"
+}
+DEFAULT_ROAST_PROMPT = "Just roast me about whatever"
+WELCOME_PROMPT = "Hello, I'm here for therapy."
+
+
+def normalize_message(message: str) -> str:
+    """Case, spacing and trailing punctuation don't change what we'd say back"""
+    return re.sub(r'\s+', ' ', message).strip().strip('.!?,;:').strip().lower()
+
+
+class TherapyStream:
+    """
+    One reply being streamed: iterate for text deltas, then read `response`
+    for the full response dict. `cancel()` stops it from any thread.
+    """
+    
+    def __init__(self, service: 'RoastTherapistService', user_message: str, backend):
+        self.service = service
+        self.user_message = user_message
+        self.backend = backend
+        self.cancelled = threading.Event()
+        self.response: Optional[Dict[str, Any]] = None
+    
+    def cancel(self):
+        self.cancelled.set()
+    
+    def __iter__(self) -> Iterator[str]:
+        parts = []
+        try:
+            params = self.service._completion_params(self.service._create_roast_therapy_prompt(self.user_message))
+            for delta in self.backend.stream(params, self.user_message, self.cancelled):
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            if parts:
+                print(f"Warning: therapy stream broke off after {len(parts)} chunks: {e}")
+        
+        if self.cancelled.is_set():
+            return
+        if self.service.ai_enabled:
+            self.service.replies += 1
+        if not parts:
+            # Nothing came through; fall back to a local roast, sent as one chunk
+            if self.service.ai_enabled:
+                self.service.fallbacks += 1
+            self.response = self.service._generate_local_roast_response(self.user_message)
+            yield self.response['response']
+        else:
+            self.response = self.service._build_response(''.join(parts).strip())
 
 
 class RoastTherapistService:
@@ -20,10 +86,31 @@ class RoastTherapistService:
     
     def __init__(self):
         """Initialize the roast therapist with maximum sarcasm"""
-        openai.api_key = os.getenv('OPENAI_API_KEY')
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        self.model = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+        self.llm = LLMClient(self.api_key)
+        self.replies = 0
+        self.fallbacks = 0
+        
+        # Race the model against the local roast engine (THERAPY_HEDGE=true)
+        hedge = os.getenv('THERAPY_HEDGE', 'false').lower() in ('1', 'true', 'yes')
+        self.hedger = Hedger() if hedge else None
         self.sarcasm_level = float(os.getenv('THERAPY_SARCASM_LEVEL', 0.8))
         self.roast_intensity = float(os.getenv('ROAST_INTENSITY', 0.9))
         
+        # Identical prompts share one upstream call, and the answers are kept for
+        # a while; each key collects up to `variety` answers and then cycles them
+        self.response_cache = LRUCache(maxsize=int(os.getenv('RESPONSE_CACHE_SIZE', 2048)),
+                                       ttl=float(os.getenv('RESPONSE_CACHE_TTL', 600)))
+        self.response_variety = int(os.getenv('RESPONSE_CACHE_VARIETY', 3))
+        self.variety_overrides = {
+            normalize_message(message): int(variety)
+            for message, variety in json.loads(os.getenv('RESPONSE_CACHE_VARIETY_OVERRIDES') or '{}').items()
+        }
+        self._cache_lock = threading.Lock()
+        self._reply_flight = SingleFlight()
+        self.cached_replies = 0
+        
         # Therapy clichés and roast templates
         self.therapy_openers = [
             "Interesting. Let's unpack that... or maybe let's not.",
@@ -48,57 +135,209 @@ class RoastTherapistService:
             "It's not you, it's... actually, no, it's definitely you.",
             "I prescribe one serving of 'getting over it' with a side of perspective.",
         ]
+        
+        # Streaming replies: 'openai', 'fake' (offline, word by word with a delay), 'local' or 'auto'
+        stream_backend = os.getenv('THERAPY_STREAM_BACKEND', 'auto').lower()
+        if stream_backend == 'auto':
+            stream_backend = 'openai' if self.ai_enabled else 'local'
+        if stream_backend == 'openai':
+            self.stream_backend = OpenAIStreamBackend(self.llm)
+        else:
+            self.stream_backend = FakeStreamBackend(
+                lambda text: self._generate_local_roast_response(text)['response'],
+                delay=None if stream_backend == 'fake' else 0.0
+            )
+        
+        pooled_prompts = dict(ROAST_PROMPTS, default=DEFAULT_ROAST_PROMPT, welcome=WELCOME_PROMPT)
+        self.response_pool = ResponsePool(self._generate_ai_response, pooled_prompts)
+    
+    @property
+    def ai_enabled(self) -> bool:
+        return bool(self.api_key) and self.api_key != "your_openai_api_key_here"
+    
+    def start_response_pool(self):
+        """Pre-generate answers to the fixed prompts (pointless without OpenAI)"""
+        if self.ai_enabled:
+            self.response_pool.start()
+    
+    def generate_pooled_response(self, prompt_key: str, client_id: str) -> Dict[str, Any]:
+        """
+        Response to one of the fixed prompts, from the pool when possible
+        
+        Args:
+            prompt_key (str): a ROAST_PROMPTS topic, 'default' or 'welcome'
+            client_id (str): who is asking, so they never get the same entry twice
+        """
+        pooled = self.response_pool.draw(prompt_key, client_id)
+        if pooled is not None:
+            return pooled
+        prompt = self.response_pool.prompts.get(prompt_key, DEFAULT_ROAST_PROMPT)
+        return self._generate_local_roast_response(prompt)
 
-    def generate_therapy_response(self, user_message: str) -> Dict[str, Any]:
+    def generate_therapy_response(self, user_message: str, client_id: str = None) -> Dict[str, Any]:
         """
         Generate a hilariously unhelpful therapy response
         
         Args:
             user_message (str): The user's therapy input
+            client_id (str): Who is asking; with hedging on, lets them reuse
+                late answers to the same message without seeing one twice
             
         Returns:
             Dict containing the response, advice type, and roast level
         """
         
         # If OpenAI is not configured, use our built-in roast responses
-        if not openai.api_key or openai.api_key == "your_openai_api_key_here":
+        if not self.ai_enabled:
             return self._generate_local_roast_response(user_message)
         
-        try:
-            # Craft the perfect prompt for maximum therapeutic uselessness
-            prompt = self._create_roast_therapy_prompt(user_message)
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": prompt["system"]
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt["user"]
-                    }
-                ],
-                max_tokens=200,
-                temperature=0.9,  # Maximum creativity for maximum chaos
-                presence_penalty=0.6,
-                frequency_penalty=0.6
-            )
-            
-            ai_response = response.choices[0].message.content.strip()
-            
-            return {
-                "response": ai_response,
-                "advice_type": self._classify_advice_type(ai_response),
-                "roast_level": self._calculate_roast_level(ai_response),
-                "wisdom_rating": "🍕 Pizza-tier nonsense",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            # Fallback to local roasting if AI fails
-            return self._generate_local_roast_response(user_message)
+        self.replies += 1
+        key = (normalize_message(user_message), self.sarcasm_level, self.roast_intensity, self.model)
+        cached = self._cached_response(key)
+        if cached is not None:
+            return cached
+        
+        client_id = client_id or 'anonymous'
+        if self.hedger is not None:
+            # Drawn per caller, outside the flight, so nobody gets a pooled answer twice
+            started = time.monotonic()
+            pooled = self.response_pool.draw(('message', key[0]), client_id)
+            if pooled is not None:
+                self.hedger.record(MODE_POOLED, started)
+                return dict(pooled)
+        
+        # Everyone asking the same thing right now waits on a single upstream call
+        response, source = self._reply_flight.do(key, self._generate_fresh_response,
+                                                 key, user_message)
+        if source == 'local':
+            self.fallbacks += 1
+        return dict(response)
+    
+    def _generate_fresh_response(self, key: tuple, user_message: str) -> Tuple[Dict[str, Any], str]:
+        """(response, source) where source is 'model' or 'local'"""
+        if self.hedger is not None:
+            response, source = self._generate_hedged_response(user_message)
+        else:
+            try:
+                # Refused instantly while the circuit is open, so fallback is fast
+                response, source = self._generate_ai_response(user_message), 'model'
+            except Exception as e:
+                # Fallback to local roasting if AI fails
+                response, source = self._generate_local_roast_response(user_message), 'local'
+        
+        # Only real model answers are worth repeating
+        if source == 'model':
+            self._remember_response(key, response)
+        return response, source
+    
+    def _variety_for(self, message: str) -> int:
+        return max(1, self.variety_overrides.get(message, self.response_variety))
+    
+    def _cached_response(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Next cached answer for this key, once it has collected enough variety"""
+        with self._cache_lock:
+            entry = self.response_cache.get(key)
+            if entry is None or len(entry['answers']) < self._variety_for(key[0]):
+                return None
+            answer = entry['answers'][entry['next'] % len(entry['answers'])]
+            entry['next'] += 1
+        self.cached_replies += 1
+        return dict(answer, timestamp=datetime.now().isoformat())
+    
+    def _remember_response(self, key: tuple, response: Dict[str, Any]):
+        with self._cache_lock:
+            entry = self.response_cache.get(key)
+            if entry is None:
+                entry = {'answers': [], 'next': 0}
+                self.response_cache.set(key, entry)
+            if len(entry['answers']) < self._variety_for(key[0]):
+                entry['answers'].append(response)
+
+    def _generate_ai_response(self, user_message: str) -> Optional[Dict[str, Any]]:
+        """One OpenAI round trip; raises on failure, None if AI isn't configured"""
+        if not self.ai_enabled:
+            return None
+        
+        # Craft the perfect prompt for maximum therapeutic uselessness
+        prompt = self._create_roast_therapy_prompt(user_message)
+        
+        response = self.llm.chat(self._completion_params(prompt))
+        
+        return self._build_response(response['choices'][0]['message']['content'].strip())
+    
+    def _generate_hedged_response(self, user_message: str) -> Tuple[Dict[str, Any], str]:
+        """Remote reply if it starts within the hedge threshold, local roast otherwise"""
+        # Late answers go to the pool for the next caller asking the same thing
+        key = ('message', normalize_message(user_message))
+        
+        def remote(first_token):
+            return self._generate_ai_streamed(user_message, first_token)
+        
+        response, mode = self.hedger.run(
+            remote,
+            lambda: self._generate_local_roast_response(user_message),
+            on_late=lambda late: self.response_pool.add(key, late)
+        )
+        return response, 'model' if mode == MODE_REMOTE else 'local'
+    
+    def _generate_ai_streamed(self, user_message: str, first_token) -> Dict[str, Any]:
+        """Streamed OpenAI round trip, calling first_token() when text starts arriving"""
+        params = self._completion_params(self._create_roast_therapy_prompt(user_message))
+        parts = []
+        for delta in self.llm.stream_chat(params):
+            if not parts:
+                first_token()
+            parts.append(delta)
+        if not parts:
+            raise LLMError("empty completion")
+        return self._build_response(''.join(parts).strip())
+    
+    def stream_therapy_response(self, user_message: str) -> TherapyStream:
+        """
+        Stream a therapy response as it is generated
+        
+        Iterate the returned stream for text deltas; afterwards its
+        `response` holds the same dict generate_therapy_response returns.
+        """
+        return TherapyStream(self, user_message, self.stream_backend)
+    
+    def _completion_params(self, prompt: Dict[str, str]) -> Dict[str, Any]:
+        """Chat completion arguments for a roast therapy prompt"""
+        return dict(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system", 
+                    "content": prompt["system"]
+                },
+                {
+                    "role": "user", 
+                    "content": prompt["user"]
+                }
+            ],
+            max_tokens=200,
+            temperature=0.9,  # Maximum creativity for maximum chaos
+            presence_penalty=0.6,
+            frequency_penalty=0.6
+        )
+    
+    def _build_response(self, ai_response: str) -> Dict[str, Any]:
+        """Response dict for text that came back from the model"""
+        return {
+            "response": ai_response,
+            "advice_type": self._classify_advice_type(ai_response),
+            "roast_level": self._calculate_roast_level(ai_response),
+            "wisdom_rating": "🍕 Pizza-tier nonsense",
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def llm_stats(self) -> Dict[str, Any]:
+        """Upstream client counters plus how often we fell back to local roasts"""
+        return dict(self.llm.stats(), enabled=self.ai_enabled, replies=self.replies, fallbacks=self.fallbacks,
+                    fallback_rate=self.fallbacks / self.replies if self.replies else 0.0,
+                    hedging=self.hedger.stats() if self.hedger is not None else None,
+                    response_cache=dict(self.response_cache.stats(), served=self.cached_replies,
+                                        variety=self.response_variety, flights=self._reply_flight.stats()))
 
     def _create_roast_therapy_prompt(self, user_message: str) -> Dict[str, str]:
         """Create the perfect prompt for therapeutic roasting"""
@@ -0,0 +1,48 @@
+"""
+📡 Streaming Backends
+Disappointment, delivered one token at a time.
+
+"You wanted it faster. Now you get to watch it arrive."
+"""
+
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Iterator
+
+from app.services.llm_client import LLMClient
+
+
+class OpenAIStreamBackend:
+    """Chat completion deltas from the OpenAI-compatible API (stream=True)"""
+
+    name = 'openai'
+
+    def __init__(self, client: LLMClient):
+        self.client = client
+
+    def stream(self, params: Dict[str, Any], user_message: str, cancel: threading.Event) -> Iterator[str]:
+        # Cancelling drops the upstream connection instead of reading the rest
+        return self.client.stream_chat(params, cancel)
+
+
+class FakeStreamBackend:
+    """
+    Offline stand-in: streams a locally generated reply word by word with
+    a fixed delay, so streaming can be exercised without an API key.
+    """
+
+    name = 'fake'
+
+    def __init__(self, reply: Callable[[str], str], delay: float = None):
+        self.reply = reply
+        self.delay = float(os.getenv('FAKE_STREAM_DELAY', 0.05)) if delay is None else delay
+
+    def stream(self, params: Dict[str, Any], user_message: str, cancel: threading.Event) -> Iterator[str]:
+        # Roast what they actually said, not the prompt we'd have wrapped it in
+        text = self.reply(user_message)
+        for token in re.findall(r'\S+\s*', text):
+            # wait() doubles as an interruptible sleep
+            if cancel.wait(self.delay):
+                break
+            yield token
@@ -0,0 +1,81 @@
+"""
+⏱️ Accessory Layer Benchmark
+Redrawing glasses on every avatar vs. blitting a cached sprite.
+
+Usage:
+    python benchmarks/bench_accessory_layers.py --sizes 1024x1365 2048x2730 --avatars 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image, ImageDraw
+
+from app.services.avatar_generator import AvatarGeneratorService
+
+
+def draw_per_variant(service: AvatarGeneratorService, image: Image.Image, face_pos, accessories):
+    """The old path: a fresh set of draw calls on every variant"""
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    x, y, w, h = face_pos
+    if 'glasses' in accessories:
+        service._add_glasses(draw, x, y, w, h)
+    if 'notepad' in accessories:
+        service._add_notepad(draw, width, height)
+    if 'tissue_box' in accessories:
+        service._add_tissue_box(draw, width, height)
+
+
+def blit_cached_layer(service: AvatarGeneratorService, image: Image.Image, face_pos, accessories):
+    """The new path: a few pastes of cached sprites"""
+    for sprite, offset in service._get_accessory_layer(image.size, face_pos, accessories):
+        image.paste(sprite, offset, sprite)
+
+
+def run(service: AvatarGeneratorService, size, avatars: int) -> dict:
+    """Median accessory time per avatar; the per-variant base copy is not timed"""
+    width, height = size
+    base = Image.new('RGB', size, (180, 150, 130))
+    face_pos = (width // 4, height // 4, width // 2, height // 2)
+    canvases = [base.copy() for _ in service.variant_configs]
+    results = {}
+
+    for name, render in (("draw", draw_per_variant), ("layer", blit_cached_layer)):
+        service.accessory_layers.clear()
+        for canvas, config in zip(canvases, service.variant_configs):  # warm-up, fills the layer cache once
+            render(service, canvas, face_pos, config['accessories'])
+        timings = []
+        for _ in range(avatars):
+            start = time.perf_counter()
+            for canvas, config in zip(canvases, service.variant_configs):
+                render(service, canvas, face_pos, config['accessories'])
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(timings)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1024x1365', '2048x2730'])
+    parser.add_argument('--avatars', type=int, default=50)
+    args = parser.parse_args()
+
+    service = AvatarGeneratorService()
+    print(f"avatars={args.avatars} variants/avatar={len(service.variant_configs)}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        result = run(service, (width, height), args.avatars)
+        print(f"{size:>10}  draw {result['draw']:7.3f} ms/avatar  layer {result['layer']:7.3f} ms/avatar  "
+              f"speed-up {result['draw'] / result['layer']:5.2f}x")
+    service.render_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
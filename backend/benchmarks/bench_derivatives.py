@@ -0,0 +1,57 @@
+"""
+⏱️ Image Derivative Benchmark
+Bytes on the wire and render time per preset, against the full-size variant.
+
+Renders every preset/format pair from a quality-95 JPEG (like the ones
+_create_avatar_variants writes) into a fresh derivative cache.
+
+Usage:
+    python benchmarks/bench_derivatives.py --image ../uploads/selfie.jpg --repeats 5
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', required=True, help='any photo; it is re-saved as a quality-95 JPEG first')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench-derivatives-')
+    os.environ['DERIVATIVE_FOLDER'] = os.path.join(root, 'derivatives')
+    try:
+        from app.services.derivatives import PRESETS, DerivativeService
+
+        source = os.path.join(root, 'avatar_variant_0123456789abcdef.jpg')
+        Image.open(args.image).convert('RGB').save(source, 'JPEG', quality=95)
+        full_bytes = os.path.getsize(source)
+        print(f"source: {Image.open(source).size}, {full_bytes / 1024:.0f} KiB")
+
+        service = DerivativeService()
+        for preset in PRESETS.values():
+            for image_format in service.formats:
+                timings = []
+                for attempt in range(args.repeats):
+                    start = time.perf_counter()
+                    path = service.get(source, f'bench{attempt}', preset, image_format)
+                    timings.append((time.perf_counter() - start) * 1000)
+                size = os.path.getsize(path)
+                print(f"{preset.name:<7} {image_format:<5} render {statistics.median(timings):7.1f} ms  "
+                      f"{size / 1024:8.1f} KiB  ({full_bytes / size:6.1f}x smaller)")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
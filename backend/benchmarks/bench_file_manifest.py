@@ -0,0 +1,113 @@
+"""
+⏱️ File Manifest Benchmark
+Finding one selfie among a million: manifest lookups vs. probing folders.
+
+The manifest part registers --files names in memory (no disk needed). The
+disk part writes --disk-files empty files in both layouts and compares the
+old os.path.exists probing with ShardedFileStore.resolve, plus the startup
+rebuild scan.
+
+Usage:
+    python benchmarks/bench_file_manifest.py --files 1000000 --disk-files 50000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.file_store import ShardedFileStore
+
+
+def per_call_us(fn, names, repeats: int = 3) -> float:
+    """Median over repeats of the mean per-call latency in microseconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for name in names:
+            fn(name)
+        timings.append((time.perf_counter() - start) / len(names) * 1e6)
+    return statistics.median(timings)
+
+
+def bench_manifest(count: int, lookups: int):
+    root = tempfile.mkdtemp(prefix='bench-manifest-')
+    try:
+        tracemalloc.start()
+        store = ShardedFileStore([os.path.join(root, 'uploads'), os.path.join(root, 'avatars')])
+        names = [f"avatar_variant_{uuid.uuid4().hex[:16]}.jpg" for _ in range(count)]
+        start = time.perf_counter()
+        for name in names:
+            store.register(store.roots[1], name)
+        register_s = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        sample = random.sample(names, min(lookups, count))
+        hit = per_call_us(store.resolve, sample)
+        print(f"manifest: {count:,} files registered in {register_s:.2f}s, "
+              f"~{peak / count:.0f} B/file (incl. names), resolve {hit:.2f} us/lookup")
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_disk(count: int, lookups: int):
+    root = tempfile.mkdtemp(prefix='bench-layout-')
+    try:
+        flat_uploads, flat_avatars = os.path.join(root, 'flat', 'uploads'), os.path.join(root, 'flat', 'avatars')
+        os.makedirs(flat_uploads)
+        os.makedirs(flat_avatars)
+        store = ShardedFileStore([os.path.join(root, 'sharded', 'uploads'), os.path.join(root, 'sharded', 'avatars')])
+
+        names = [f"avatar_variant_{uuid.uuid4().hex[:16]}.jpg" for _ in range(count)]
+        for name in names:
+            open(os.path.join(flat_avatars, name), 'wb').close()
+            open(store.path_for(store.roots[1], name), 'wb').close()
+
+        def probe_flat(name):
+            for folder in (flat_uploads, flat_avatars):
+                path = os.path.join(folder, name)
+                if os.path.exists(path):
+                    return path
+            return None
+
+        start = time.perf_counter()
+        found = store.rebuild()
+        rebuild_s = time.perf_counter() - start
+
+        sample = random.sample(names, min(lookups, count))
+        flat = per_call_us(probe_flat, sample)
+        sharded = per_call_us(store.resolve, sample)
+        missing = [f"avatar_variant_{uuid.uuid4().hex[:16]}.jpg" for _ in range(min(lookups, count))]
+        flat_miss = per_call_us(probe_flat, missing)
+        sharded_miss = per_call_us(store.resolve, missing)
+
+        print(f"disk: {count:,} files, rebuild scan {rebuild_s:.2f}s ({found:,} found)")
+        print(f"      hit:  flat probe {flat:7.2f} us   manifest {sharded:7.2f} us")
+        print(f"      miss: flat probe {flat_miss:7.2f} us   manifest {sharded_miss:7.2f} us")
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=1_000_000)
+    parser.add_argument('--disk-files', type=int, default=50_000)
+    parser.add_argument('--lookups', type=int, default=100_000)
+    args = parser.parse_args()
+
+    bench_manifest(args.files, args.lookups)
+    if args.disk_files:
+        bench_disk(args.disk_files, args.lookups)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+⏱️ Hedged Generation Benchmark
+Reply latency with and without racing the local roast engine.
+
+Runs generate_therapy_response against benchmarks/llm_stub_server.py with
+a heavy tail (a few percent of requests stall before answering), first with
+THERAPY_HEDGE off, then on, and prints p50/p95/p99 plus the per-mode
+breakdown from the hedger.
+
+Usage:
+    python benchmarks/bench_hedging.py --calls 300 --latency 0.15 --slow-rate 0.03 --slow-for 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_stub_server import StubConfig, serve
+
+MESSAGES = ["I'm sad", "work stress", "my boss hates me", "dating is hard", "I can't sleep", "I'm worried"]
+
+
+def run(calls: int, hedge: bool):
+    os.environ['THERAPY_HEDGE'] = 'true' if hedge else 'false'
+    from app.services.roast_therapist import RoastTherapistService
+    service = RoastTherapistService()
+
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        # Unique messages, so late answers parked in the pool aren't reused here
+        service.generate_therapy_response(f"{MESSAGES[i % len(MESSAGES)]} ({i})", client_id=f"client{i}")
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    pick = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))]
+    print(f"hedge {'on ' if hedge else 'off'}: p50 {pick(0.5):7.1f} ms  p95 {pick(0.95):7.1f} ms  "
+          f"p99 {pick(0.99):7.1f} ms  fallback rate {service.llm_stats()['fallback_rate']:.0%}")
+    if hedge:
+        print(json.dumps(service.hedger.stats(), indent=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.15)
+    parser.add_argument('--slow-rate', type=float, default=0.03)
+    parser.add_argument('--slow-for', type=float, default=2.0)
+    args = parser.parse_args()
+
+    config = StubConfig(latency=args.latency, jitter=args.latency / 3, hang_rate=args.slow_rate,
+                        hang_for=args.slow_for, token_delay=0.005)
+    server = serve(config)
+    os.environ.update(OPENAI_API_KEY='stub', OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_port}/v1",
+                      HEDGE_INITIAL_DELAY='0.5', LLM_DEADLINE='10')
+
+    run(args.calls, hedge=False)
+    run(args.calls, hedge=True)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+⏱️ LLM Client Benchmark
+Connection reuse, retries and the circuit breaker against the local stub.
+
+Three scenarios, each against a fresh benchmarks/llm_stub_server.py:
+  healthy  - pooled session vs. a new connection per call
+  flaky    - share of calls that still succeed thanks to retries
+  outage   - every call hangs; reply latency before and after the breaker opens
+
+Usage:
+    python benchmarks/bench_llm_client.py --calls 100 --latency 0.02
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+
+from llm_stub_server import StubConfig, serve
+
+PARAMS = {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "I'm sad"}]}
+
+
+def timed(fn, calls: int):
+    timings, errors = [], 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, errors
+
+
+def pct(timings, q):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    os.environ.update(OPENAI_API_KEY='stub', LLM_DEADLINE='1', LLM_BREAKER_FAILURES='3', LLM_BREAKER_RESET='60')
+    from app.services.llm_client import LLMClient
+    from app.services.roast_therapist import RoastTherapistService
+
+    # Healthy upstream: keep-alive pool vs. reconnecting every time
+    config = StubConfig(latency=args.latency)
+    server = serve(config)
+    url = f"http://127.0.0.1:{server.server_port}/v1"
+    client = LLMClient(base_url=url)
+    pooled, _ = timed(lambda: client.chat(PARAMS), args.calls)
+    pooled_connections = len(config.connections)
+    config.connections.clear()
+    fresh, _ = timed(lambda: requests.post(f"{url}/chat/completions", json=PARAMS,
+                                           headers={'Connection': 'close'}).json(), args.calls)
+    print(f"healthy: pooled median {statistics.median(pooled):6.1f} ms over {pooled_connections} connection(s); "
+          f"new connection each call {statistics.median(fresh):6.1f} ms over {len(config.connections)}")
+    server.shutdown()
+
+    # Flaky upstream: 30% of requests fail with 503
+    config = StubConfig(latency=args.latency, fail_rate=0.3)
+    server = serve(config)
+    client = LLMClient(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    client.breaker.failure_threshold = args.calls  # measure retries, not the breaker
+    timings, errors = timed(lambda: client.chat(PARAMS), args.calls)
+    print(f"flaky (30% 503): {1 - errors / args.calls:.0%} of calls succeeded, {client.retries} retries, "
+          f"p95 {pct(timings, 0.95):6.1f} ms")
+    server.shutdown()
+
+    # Outage: every request hangs; the service should fall back fast once the circuit opens
+    config = StubConfig(hang_rate=1.0, hang_for=5.0)
+    server = serve(config)
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{server.server_port}/v1"
+    service = RoastTherapistService()
+    timings, _ = timed(lambda: service.generate_therapy_response("I'm sad"), 20)
+    print(f"outage: first replies {[round(t) for t in timings[:4]]} ms, "
+          f"then p50 {statistics.median(timings[4:]):.2f} ms; fallback rate {service.llm_stats()['fallback_rate']:.0%}, "
+          f"circuit {service.llm.breaker.state}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+⏱️ Mood Filter Benchmark
+Per-call ImageEnhance vs. precompiled colour matrices and LUTs.
+
+Both paths include the copy each variant needs of the shared base frame.
+
+Usage:
+    python benchmarks/bench_mood_filters.py --megapixels 1 4 12 --repeats 10
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from app.services.mood_filters import MoodFilter, load_mood_filters
+
+
+def per_call_enhance(image: Image.Image, factor: float) -> Image.Image:
+    """The old path: copy the frame, then build an enhancer per call"""
+    return ImageEnhance.Color(image.copy()).enhance(factor)
+
+
+def median_ms(fn, repeats: int) -> float:
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4, 12])
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    moods = load_mood_filters()
+    desaturate = MoodFilter('desaturate', {"saturation": 0.8})
+    tone_only = MoodFilter('tone_only', {"gains": [1.04, 1.0, 0.96], "gamma": 0.9})
+    rng = np.random.default_rng(0)
+
+    for megapixels in args.megapixels:
+        width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+        enhance = median_ms(lambda: per_call_enhance(image, 0.8), args.repeats)
+        matrix = median_ms(lambda: desaturate.apply(image), args.repeats)
+        lut = median_ms(lambda: tone_only.apply(image), args.repeats)
+        copy = median_ms(image.copy, args.repeats)
+        print(f"{megapixels:>5g} MP ({width}x{height})  copy only {copy:7.1f} ms")
+        print(f"        saturation 0.8: ImageEnhance {enhance:7.1f} ms  matrix {matrix:7.1f} ms  "
+              f"speed-up {enhance / matrix:4.2f}x")
+        print(f"        gains+gamma: LUT {lut:7.1f} ms")
+        for name, mood_filter in moods.items():
+            elapsed = median_ms(lambda: mood_filter.apply(image), args.repeats)
+            print(f"        {name:<28} {elapsed:7.1f} ms  ({mood_filter.passes} pass)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+⏱️ Password Pool Benchmark
+How many logins per second can we disappoint at each pool size?
+
+Usage:
+    python benchmarks/bench_password_pool.py --sizes 1 2 4 8 --clients 16 --logins 200
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from werkzeug.security import generate_password_hash
+
+from app.services.password_hasher import HasherSaturatedError, PasswordHasher
+
+
+def run(pool_size: int, clients: int, logins: int, method: str) -> dict:
+    """Hammer one hasher with `clients` threads verifying `logins` passwords"""
+    hasher = PasswordHasher(max_workers=pool_size, max_queue=clients, method=method)
+    stored = generate_password_hash('password123', method)
+    remaining = [logins]
+    lock = threading.Lock()
+    rejected = [0]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            try:
+                hasher.verify(stored, 'password123')
+            except HasherSaturatedError:
+                with lock:
+                    rejected[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+
+    return {
+        "pool_size": pool_size,
+        "logins_per_second": (logins - rejected[0]) / elapsed,
+        "rejected": rejected[0],
+        "elapsed": elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    args = parser.parse_args()
+
+    print(f"method={args.method} clients={args.clients} logins={args.logins} cpus={os.cpu_count()}")
+    for size in args.sizes:
+        result = run(size, args.clients, args.logins, args.method)
+        print(f"pool={result['pool_size']:>3}  {result['logins_per_second']:8.1f} logins/s  "
+              f"rejected={result['rejected']}  ({result['elapsed']:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+🗂️ Response Cache Benchmark
+How many upstream calls a crowd of identical complaints actually costs.
+
+Fires bursts of concurrent generate_therapy_response calls for a handful of
+popular messages against benchmarks/llm_stub_server.py and prints how many
+requests reached the stub, how many callers were coalesced onto someone
+else's call, and how many were answered from the response cache.
+
+Usage:
+    python benchmarks/bench_response_cache.py --bursts 20 --concurrency 16 --latency 0.3 --variety 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_stub_server import StubConfig, serve
+
+MESSAGES = ["I'm sad", "work stress", "My boss hates me!", "dating is hard", "i'm SAD."]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bursts', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--variety', type=int, default=3)
+    args = parser.parse_args()
+
+    config = StubConfig(latency=args.latency)
+    server = serve(config)
+    os.environ.update(OPENAI_API_KEY='stub', OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_port}/v1",
+                      RESPONSE_CACHE_VARIETY=str(args.variety), THERAPY_HEDGE='false',
+                      LLM_POOL_SIZE=str(args.concurrency))
+    from app.services.roast_therapist import RoastTherapistService
+    service = RoastTherapistService()
+
+    calls = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for burst in range(args.bursts):
+            message = MESSAGES[burst % len(MESSAGES)]
+            list(executor.map(lambda i: service.generate_therapy_response(message, client_id=f"client{i}"),
+                              range(args.concurrency)))
+            calls += args.concurrency
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"{calls} replies in {elapsed:.2f}s, {config.requests} upstream requests "
+          f"({config.requests / calls:.1%} of replies)")
+    print(json.dumps(service.llm_stats()['response_cache'], indent=1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+🧪 LLM Stub Server
+A fake OpenAI that is exactly as unreliable as you tell it to be.
+
+Answers POST /v1/chat/completions (plain and stream=True) with canned
+roasts after a configurable latency, and fails or hangs on a configurable
+share of requests (or on exactly the next few, for tests). Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:8089/v1 to try LLM_* settings offline.
+
+Usage:
+    python benchmarks/llm_stub_server.py --port 8089 --latency 0.3 --fail-rate 0.1 --hang-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "Really? You came to a mirror for advice. Maybe try... having fewer problems. Progress!"
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, fail_rate: float = 0.0,
+                 hang_rate: float = 0.0, hang_for: float = 30.0, token_delay: float = 0.01):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.hang_rate = hang_rate
+        self.hang_for = hang_for
+        self.token_delay = token_delay
+        # The next N requests fail (503) or hang, whatever the rates say
+        self.fail_next = 0
+        self.hang_next = 0
+        self.requests = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+
+    def next_outcome(self) -> str:
+        """'hang', 'fail' or 'ok' for the request that just arrived"""
+        with self._lock:
+            self.requests += 1
+            if self.hang_next > 0:
+                self.hang_next -= 1
+                return 'hang'
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return 'fail'
+        roll = random.random()
+        if roll < self.hang_rate:
+            return 'hang'
+        if roll < self.hang_rate + self.fail_rate:
+            return 'fail'
+        return 'ok'
+
+
+def make_handler(config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is visible
+        disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            config.connections.add(self.client_address)
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+            outcome = config.next_outcome()
+            if outcome == 'hang':
+                time.sleep(config.hang_for)
+            elif outcome == 'fail':
+                return self._send(503, {"error": {"message": "stub says no"}})
+            time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+
+            if body.get('stream'):
+                return self._stream()
+            self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}}]})
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            try:
+                for token in REPLY.split(' '):
+                    chunk = {"choices": [{"index": 0, "delta": {"content": token + ' '}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(config.token_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client cancelled
+            self.close_connection = True
+
+    return Handler
+
+
+def serve(config: StubConfig, port: int = 0) -> ThreadingHTTPServer:
+    """Start the stub on a daemon thread; the bound port is server.server_port"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.fail_rate, args.hang_rate)
+    server = serve(config, args.port)
+    print(f"LLM stub on http://127.0.0.1:{server.server_port}/v1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
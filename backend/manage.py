@@ -0,0 +1,96 @@
+"""
+🛠️ Mirror Mirror Management Commands
+One-shot maintenance chores for the backend.
+
+"Administrative tasks, performed with the enthusiasm of a Monday morning."
+
+Usage:
+    python manage.py import-users --source ./data/users.json --backend sqlite
+    python manage.py import-avatars --source ../generated_avatars
+    python manage.py migrate-files --dry-run
+"""
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.models.avatar_store import AvatarStore, import_avatars_from_json
+from app.models.user_storage import create_user_storage, import_users_from_json
+from app.services.file_store import ShardedFileStore
+
+
+def import_users(args):
+    """Copy users from a users.json file into the configured storage backend"""
+    storage = create_user_storage(args.backend, args.target)
+    try:
+        result = import_users_from_json(args.source, storage)
+    finally:
+        storage.close()
+
+    print(f"Imported {result['imported']} of {result['total']} users "
+          f"({result['skipped']} already present or conflicting)")
+    return 0
+
+
+def import_avatars(args):
+    """Copy legacy avatar_<id>.json files into the avatar metadata store"""
+    store = AvatarStore(args.target)
+    try:
+        result = import_avatars_from_json(args.source, store, batch_size=args.batch_size, remove=args.remove)
+        total = store.count()
+    finally:
+        store.close()
+
+    print(f"Imported {result['imported']} avatars ({result['skipped']} already present, "
+          f"{result['failed']} unreadable); store now holds {total}")
+    return 0 if result['failed'] == 0 else 1
+
+
+def migrate_files(args):
+    """Move flat uploads and generated avatars into the sharded layout"""
+    store = ShardedFileStore(args.folders)
+    for folder in args.folders:
+        result = store.migrate(folder, dry_run=args.dry_run)
+        verb = "Would move" if args.dry_run else "Moved"
+        print(f"{folder}: {verb} {result['moved']} files ({result['skipped']} already sharded)")
+    if not args.dry_run:
+        print(f"Manifest scan finds {store.rebuild()} files")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mirror Mirror management commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    users_parser = subparsers.add_parser('import-users', help="Import users.json into a storage backend")
+    users_parser.add_argument('--source', default='./data/users.json', help="users.json to read")
+    users_parser.add_argument('--backend', default='sqlite', help="Target backend (json or sqlite)")
+    users_parser.add_argument('--target', default=None, help="Target database path")
+    users_parser.set_defaults(handler=import_users)
+
+    avatars_parser = subparsers.add_parser('import-avatars', help="Import avatar_<id>.json files into the avatar store")
+    avatars_parser.add_argument('--source', default=os.getenv('AVATAR_FOLDER', '../generated_avatars'),
+                                help="Folder holding avatar_<id>.json files")
+    avatars_parser.add_argument('--target', default=None, help="Avatar database path (default AVATAR_DB_PATH)")
+    avatars_parser.add_argument('--batch-size', type=int, default=1000)
+    avatars_parser.add_argument('--remove', action='store_true', help="Delete each JSON file once imported")
+    avatars_parser.set_defaults(handler=import_avatars)
+
+    files_parser = subparsers.add_parser('migrate-files', help="Move flat upload/avatar files into hash shards")
+    files_parser.add_argument('--folders', nargs='+',
+                              default=[os.getenv('UPLOAD_FOLDER', '../uploads'),
+                                       os.getenv('AVATAR_FOLDER', '../generated_avatars')],
+                              help="Folders to migrate (default UPLOAD_FOLDER and AVATAR_FOLDER)")
+    files_parser.add_argument('--dry-run', action='store_true', help="Only report what would move")
+    files_parser.set_defaults(handler=migrate_files)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
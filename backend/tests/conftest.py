@@ -0,0 +1,25 @@
+"""
+🧪 Shared test fixtures
+Disappointment, now reproducible.
+"""
+
+import os
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [BACKEND, os.path.join(BACKEND, 'benchmarks')]
+
+from llm_stub_server import StubConfig, serve  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    """An OpenAI-compatible stub on a free port; tweak the returned config per test"""
+    config = StubConfig(latency=0.0, token_delay=0.01)
+    server = serve(config)
+    config.base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    yield config
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,103 @@
+"""
+📦 File delivery tests: ETags, 304s, byte ranges, cache policy and proxy hand-off.
+"""
+
+import os
+
+import pytest
+from flask import Flask
+
+from app.services.file_delivery import FileDelivery
+
+BODY = bytes(range(256)) * 4
+VARIANT = 'avatar_variant_0123456789abcdef.jpg'
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    root = tmp_path / 'generated_avatars'
+    root.mkdir()
+    for name in (VARIANT, 'original_abc.jpg', 'avatar_abc.json'):
+        (root / name).write_bytes(BODY)
+
+    def make(mode='python'):
+        monkeypatch.setenv('FILE_DELIVERY', mode)
+        delivery = FileDelivery([str(root)])
+        app = Flask(__name__)
+
+        @app.route('/files/<filename>')
+        def serve(filename):
+            return delivery.not_modified(filename) or delivery.respond(os.path.join(root, filename), filename)
+
+        client = app.test_client()
+        client.delivery = delivery
+        return client
+    return make
+
+
+def test_full_response_has_a_strong_etag(make_client):
+    response = make_client().get('/files/original_abc.jpg')
+    etag, weak = response.get_etag()
+    assert response.status_code == 200
+    assert response.data == BODY
+    assert etag and not weak
+    assert response.last_modified is not None
+
+
+def test_matching_etag_gets_a_304(make_client):
+    client = make_client()
+    etag = client.get('/files/original_abc.jpg').get_etag()[0]
+    response = client.get('/files/original_abc.jpg', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert client.delivery.counts['304'] == 1
+
+
+def test_content_addressed_name_is_the_etag(make_client):
+    client = make_client()
+    assert client.get(f'/files/{VARIANT}').get_etag() == ('0123456789abcdef', False)
+
+    response = client.get(f'/files/{VARIANT}', headers={'If-None-Match': '"0123456789abcdef"'})
+    assert response.status_code == 304
+
+
+def test_range_request_gets_a_206(make_client):
+    response = make_client().get('/files/original_abc.jpg', headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.data == BODY[:10]
+    assert response.headers['Content-Range'] == f'bytes 0-9/{len(BODY)}'
+
+
+def test_stale_if_range_gets_the_whole_file(make_client):
+    response = make_client().get('/files/original_abc.jpg',
+                                 headers={'Range': 'bytes=0-9', 'If-Range': '"not-the-etag"'})
+    assert response.status_code == 200
+    assert response.data == BODY
+
+
+@pytest.mark.parametrize('filename', [VARIANT, 'original_abc.jpg'])
+def test_write_once_files_are_immutable_and_private(make_client, filename):
+    cache_control = make_client().get(f'/files/{filename}').cache_control
+    assert cache_control.private
+    assert cache_control.immutable
+    assert cache_control.max_age == 365 * 24 * 3600
+    assert not cache_control.no_cache
+
+
+def test_mutable_files_must_revalidate(make_client):
+    cache_control = make_client().get('/files/avatar_abc.json').cache_control
+    assert cache_control.private
+    assert cache_control.no_cache
+    assert not cache_control.immutable
+
+
+def test_x_accel_redirect_leaves_the_body_to_the_proxy(make_client):
+    client = make_client('x-accel-redirect')
+    response = client.get('/files/original_abc.jpg')
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == '/_protected/generated_avatars/original_abc.jpg'
+    assert response.data == b''
+    assert client.delivery.counts['delegated'] == 1
+
+    etag = response.get_etag()[0]
+    assert client.get('/files/original_abc.jpg', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
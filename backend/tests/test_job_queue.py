@@ -0,0 +1,129 @@
+"""
+📬 Job broker tests: de-duplicating identical submissions, and taking back expired leases.
+"""
+
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.services.job_queue import (
+    JOB_FAILED, JOB_QUEUED, JOB_RETRYING, JOB_RUNNING, JOB_SUCCEEDED, InMemoryBroker, JobQueue, SQLiteBroker
+)
+
+
+def make_job(dedup_key='same-avatar', **fields):
+    """A job dict shaped like the ones JobQueue.submit builds"""
+    now = datetime.now().isoformat()
+    job = {
+        'job_id': str(uuid.uuid4()),
+        'job_type': 'avatar',
+        'dedup_key': dedup_key,
+        'status': JOB_QUEUED,
+        'progress': 0.0,
+        'stage': 'queued',
+        'attempts': 0,
+        'payload': {'file_id': 'f1'},
+        'result': None,
+        'error': None,
+        'created_at': now,
+        'updated_at': now,
+        'run_after': 0.0
+    }
+    job.update(fields)
+    return job
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def broker(request, tmp_path):
+    if request.param == 'memory':
+        return InMemoryBroker()
+    return SQLiteBroker(str(tmp_path / 'jobs.sqlite3'), poll_interval=0.01)
+
+
+def test_identical_in_flight_jobs_are_shared(broker):
+    first, deduplicated = broker.enqueue(make_job())
+    assert not deduplicated
+
+    second, deduplicated = broker.enqueue(make_job())
+    assert deduplicated
+    assert second['job_id'] == first['job_id']
+
+    _, deduplicated = broker.enqueue(make_job(dedup_key='other-avatar'))
+    assert not deduplicated
+
+
+def test_running_jobs_still_deduplicate(broker):
+    first, _ = broker.enqueue(make_job())
+    assert broker.claim(timeout=0, lease=60)['job_id'] == first['job_id']
+    second, deduplicated = broker.enqueue(make_job())
+    assert deduplicated
+    assert second['job_id'] == first['job_id']
+
+
+@pytest.mark.parametrize('status', [JOB_SUCCEEDED, JOB_FAILED])
+def test_finished_jobs_no_longer_deduplicate(broker, status):
+    first, _ = broker.enqueue(make_job())
+    broker.update(first['job_id'], status=status, finished_at=time.time())
+
+    second, deduplicated = broker.enqueue(make_job())
+    assert not deduplicated
+    assert second['job_id'] != first['job_id']
+
+
+def test_a_job_is_claimed_once(broker):
+    job, _ = broker.enqueue(make_job())
+    claimed = broker.claim(timeout=0, lease=60)
+    assert claimed['job_id'] == job['job_id']
+    assert claimed['status'] == JOB_RUNNING
+    assert broker.claim(timeout=0.05, lease=60) is None
+
+
+def test_sqlite_dedup_spans_broker_instances(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    first, _ = SQLiteBroker(path).enqueue(make_job())
+    second, deduplicated = SQLiteBroker(path).enqueue(make_job())
+    assert deduplicated
+    assert second['job_id'] == first['job_id']
+
+
+def test_sqlite_expired_lease_is_claimed_again(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    job, _ = SQLiteBroker(path).enqueue(make_job())
+
+    # The first worker "dies" holding a short lease
+    assert SQLiteBroker(path).claim(timeout=0, lease=0.1)['job_id'] == job['job_id']
+    other_worker = SQLiteBroker(path, poll_interval=0.01)
+    assert other_worker.claim(timeout=0, lease=60) is None
+
+    time.sleep(0.15)
+    reclaimed = other_worker.claim(timeout=0, lease=60)
+    assert reclaimed['job_id'] == job['job_id']
+    assert reclaimed['lease_until'] > time.time() + 30
+
+
+def test_sqlite_retry_waits_for_run_after(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / 'jobs.sqlite3'), poll_interval=0.01)
+    job, _ = broker.enqueue(make_job())
+    broker.claim(timeout=0, lease=60)
+    broker.requeue(job['job_id'], run_after=time.time() + 0.1, status=JOB_RETRYING)
+    assert broker.claim(timeout=0, lease=60) is None
+    assert broker.claim(timeout=1, lease=60)['job_id'] == job['job_id']
+
+
+def test_submit_deduplicates_and_hides_private_results():
+    queue = JobQueue(broker=InMemoryBroker(), concurrency=1)
+    queue.register('avatar', lambda payload, report: None,
+                   public_result=lambda result: {'avatar_url': result['avatar_url']})
+
+    job, deduplicated = queue.submit('avatar', {'file_id': 'f1', 'user_id': 'owner'})
+    assert not deduplicated
+    assert queue.submit('avatar', {'user_id': 'owner', 'file_id': 'f1'})[1]
+    assert queue.stats()['deduplicated'] == 1
+
+    queue.broker.update(job['job_id'], status=JOB_SUCCEEDED,
+                        result={'avatar_url': '/a.jpg', 'face_data': {'position': [1, 2, 3, 4]}})
+    assert queue.get(job['job_id'], 'owner')['result']['face_data']
+    assert queue.get(job['job_id'])['result'] == {'avatar_url': '/a.jpg'}
+    assert queue.get(job['job_id'], 'someone-else')['result'] == {'avatar_url': '/a.jpg'}
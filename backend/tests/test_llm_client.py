@@ -0,0 +1,150 @@
+"""
+🔌 LLM client tests: retries, deadlines and the circuit breaker, against the stub server.
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.services.llm_client import CircuitBreaker, LLMClient, LLMError, LLMTimeout, LLMUnavailable
+
+PARAMS = {"model": "stub", "messages": [{"role": "user", "content": "roast me"}]}
+
+
+@pytest.fixture
+def make_client(stub, monkeypatch):
+    def make(**settings):
+        defaults = {'LLM_DEADLINE': 2, 'LLM_MAX_RETRIES': 2, 'LLM_RETRY_BACKOFF': 0.01,
+                    'LLM_BREAKER_FAILURES': 2, 'LLM_BREAKER_RESET': 30}
+        for name, value in dict(defaults, **settings).items():
+            monkeypatch.setenv(name, str(value))
+        return LLMClient(api_key='stub', base_url=stub.base_url)
+    return make
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.opened == 1
+
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # the probe is still out
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+
+
+def test_open_circuit_refuses_without_calling_upstream(stub, make_client):
+    client = make_client(LLM_MAX_RETRIES=0)
+    stub.fail_next = 2
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            client.chat(PARAMS)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(LLMUnavailable):
+        client.chat(PARAMS)
+    assert stub.requests == 2
+    assert client.short_circuited == 1
+
+
+def test_half_open_success_closes_the_circuit(stub, make_client):
+    client = make_client(LLM_MAX_RETRIES=0, LLM_BREAKER_RESET=0.1)
+    stub.fail_next = 2
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            client.chat(PARAMS)
+    time.sleep(0.15)
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+
+    assert client.chat(PARAMS)['choices']
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries_5xx_until_it_succeeds(stub, make_client):
+    client = make_client()
+    stub.fail_next = 2
+    assert client.chat(PARAMS)['choices']
+    assert stub.requests == 3
+    assert client.retries == 2
+    assert client.failures == 0
+
+
+def test_gives_up_after_max_retries(stub, make_client):
+    client = make_client(LLM_MAX_RETRIES=1, LLM_BREAKER_FAILURES=10)
+    stub.fail_next = 5
+    with pytest.raises(LLMError, match='503'):
+        client.chat(PARAMS)
+    assert stub.requests == 2
+    assert client.failures == 1
+
+
+def test_deadline_overrun_times_out(stub, make_client):
+    client = make_client(LLM_DEADLINE=0.3)
+    stub.hang_next, stub.hang_for = 1, 2.0
+    started = time.monotonic()
+    with pytest.raises(LLMTimeout):
+        client.chat(PARAMS)
+    assert time.monotonic() - started < 1.0
+    assert client.timeouts >= 1
+    assert client.failures == 1
+
+
+def test_completed_stream_counts_as_success(stub, make_client):
+    client = make_client()
+    text = ''.join(client.stream_chat(PARAMS))
+    assert text.startswith("Really?")
+    assert client.successes == 1
+
+
+def test_cancelled_stream_records_nothing(stub, make_client):
+    client = make_client()
+    stub.token_delay = 0.02
+    cancel = threading.Event()
+    deltas = []
+    for delta in client.stream_chat(PARAMS, cancel):
+        deltas.append(delta)
+        if len(deltas) == 2:
+            cancel.set()
+    assert len(deltas) == 2
+    assert (client.successes, client.failures) == (0, 0)
+    assert len(client.latency) == 0
+
+
+def test_closing_a_probe_stream_frees_the_probe(stub, make_client):
+    client = make_client(LLM_MAX_RETRIES=0, LLM_BREAKER_RESET=0.1)
+    stub.fail_next = 2
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            client.chat(PARAMS)
+    time.sleep(0.15)
+
+    stream = client.stream_chat(PARAMS)
+    next(stream)
+    stream.close()
+    # Nothing was proven either way: still half-open, and the next call may probe
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    assert client.breaker.allow()
@@ -0,0 +1,67 @@
+"""
+📡 Streaming tests: the fake backend, cancellation, and the OpenAI backend against the stub.
+"""
+
+import threading
+
+import pytest
+
+from app.services.llm_client import LLMClient
+from app.services.roast_therapist import RoastTherapistService
+from app.services.stream_backends import FakeStreamBackend, OpenAIStreamBackend
+
+PARAMS = {"model": "stub", "messages": [{"role": "user", "content": "wrapped prompt"}]}
+
+
+def test_fake_backend_roasts_the_raw_message():
+    seen = []
+    backend = FakeStreamBackend(lambda text: seen.append(text) or "one two three", delay=0.0)
+    tokens = list(backend.stream(PARAMS, "i'm sad", threading.Event()))
+    assert seen == ["i'm sad"]
+    assert ''.join(tokens) == "one two three"
+
+
+def test_fake_backend_stops_when_cancelled():
+    backend = FakeStreamBackend(lambda text: "a b c d e f", delay=0.0)
+    cancel = threading.Event()
+    tokens = []
+    for token in backend.stream(PARAMS, "hi", cancel):
+        tokens.append(token)
+        if len(tokens) == 2:
+            cancel.set()
+    assert tokens == ["a ", "b "]
+
+
+def test_openai_backend_drops_the_stream_on_cancel(stub, monkeypatch):
+    monkeypatch.setenv('LLM_MAX_RETRIES', '0')
+    stub.token_delay = 0.02
+    client = LLMClient(api_key='stub', base_url=stub.base_url)
+    cancel = threading.Event()
+    tokens = []
+    for token in OpenAIStreamBackend(client).stream(PARAMS, "hi", cancel):
+        tokens.append(token)
+        cancel.set()
+    assert len(tokens) == 1
+    assert client.successes == 0
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    monkeypatch.setenv('THERAPY_STREAM_BACKEND', 'fake')
+    monkeypatch.setenv('FAKE_STREAM_DELAY', '0.001')
+    return RoastTherapistService()
+
+
+def test_therapy_stream_builds_the_full_response(service):
+    stream = service.stream_therapy_response("I keep procrastinating")
+    text = ''.join(stream)
+    assert stream.response is not None
+    assert stream.response['response'] == text.strip()
+
+
+def test_cancelled_therapy_stream_has_no_response(service):
+    stream = service.stream_therapy_response("I keep procrastinating")
+    for _ in stream:
+        stream.cancel()
+    assert stream.response is None
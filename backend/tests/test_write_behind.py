@@ -0,0 +1,105 @@
+"""
+⏳ Write-behind tests: the read overlay during a flush, and merging after a failed one.
+"""
+
+import threading
+
+import pytest
+
+from app.models.write_behind import WriteBehindBuffer
+
+
+class RecordingStorage:
+    """Stands in for a user backend; update_fields can be held open or made to fail"""
+
+    def __init__(self):
+        self.writes = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+
+    def update_fields(self, updates):
+        self.entered.set()
+        self.release.wait(5)
+        if self.fail:
+            raise IOError("disk is having a moment")
+        self.writes.append({user_id: dict(fields) for user_id, fields in updates.items()})
+
+
+@pytest.fixture
+def storage():
+    return RecordingStorage()
+
+
+@pytest.fixture
+def buffer(storage):
+    # A long interval keeps the background flusher out of the way
+    buffer = WriteBehindBuffer(storage, flush_interval=3600, max_batch=1000)
+    yield buffer
+    storage.fail = False
+    storage.release.set()
+    buffer.close()
+
+
+def test_staged_fields_merge_per_user(buffer, storage):
+    buffer.stage('u1', {'last_login': 'a'})
+    buffer.stage('u1', {'profile_data': {'mood': 'meh'}})
+    assert buffer.pending_for('u1') == {'last_login': 'a', 'profile_data': {'mood': 'meh'}}
+
+    buffer.flush()
+    assert storage.writes == [{'u1': {'last_login': 'a', 'profile_data': {'mood': 'meh'}}}]
+    assert buffer.pending_for('u1') is None
+
+
+def test_in_flight_batch_stays_visible_until_it_commits(buffer, storage):
+    buffer.stage('u1', {'last_login': 'a', 'profile_data': 'old'})
+    storage.release.clear()
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert storage.entered.wait(5)
+
+    # Mid-write: readers still see the batch, and newer staged values win
+    assert buffer.pending_for('u1') == {'last_login': 'a', 'profile_data': 'old'}
+    buffer.stage('u1', {'profile_data': 'new'})
+    assert buffer.pending_for('u1') == {'last_login': 'a', 'profile_data': 'new'}
+
+    storage.release.set()
+    flusher.join(5)
+    assert buffer.pending_for('u1') == {'profile_data': 'new'}
+
+
+def test_failed_flush_is_retried_with_newer_values_on_top(buffer, storage):
+    buffer.stage('u1', {'last_login': 'a', 'profile_data': 'old'})
+    storage.fail = True
+    storage.release.clear()
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert storage.entered.wait(5)
+    buffer.stage('u1', {'profile_data': 'new'})
+    storage.release.set()
+    flusher.join(5)
+
+    assert storage.writes == []
+    assert buffer.pending_for('u1') == {'last_login': 'a', 'profile_data': 'new'}
+    assert buffer.stats()['flushes'] == 0
+
+    storage.fail = False
+    buffer.flush()
+    assert storage.writes == [{'u1': {'last_login': 'a', 'profile_data': 'new'}}]
+    assert buffer.stats()['flushed_users'] == 1
+
+
+def test_take_removes_pending_fields(buffer, storage):
+    buffer.stage('u1', {'last_login': 'a'})
+    assert buffer.take('u1') == {'last_login': 'a'}
+    assert buffer.take('u1') == {}
+    buffer.flush()
+    assert storage.writes == []
+
+
+def test_close_writes_out_what_is_pending(storage):
+    buffer = WriteBehindBuffer(storage, flush_interval=3600)
+    buffer.stage('u1', {'last_login': 'a'})
+    buffer.close()
+    assert storage.writes == [{'u1': {'last_login': 'a'}}]